@@ -11,6 +11,7 @@ import settings
 import schedule
 import cron
 import shutil
+import warm_cache
 
 # this import must happen before any github api stuff gets imported.  it sets
 # up caching on the api functions so we don't run out of api requests
@@ -21,6 +22,7 @@ import github_api.prs
 import github_api.voting
 import github_api.repos
 import github_api.comments
+import github_api.graphql
 
 # Has a sideeffect of creating private key if one doesn't exist already
 # Currently imported just for the sideeffect (not currently being used)
@@ -42,6 +44,9 @@ def main():
 
     api = gh.API(settings.GITHUB_USER, settings.GITHUB_SECRET)
 
+    # if we've just restarted ourselves, pick up where we left off
+    warm_cache.restore(api)
+
     log.info("starting up and entering event loop")
 
     os.system("pkill chaos_server")
@@ -50,7 +55,7 @@ def main():
     subprocess.Popen([sys.executable, "server.py"], cwd=server_dir)
 
     # Schedule all cron jobs to be run
-    cron.schedule_jobs()
+    cron.schedule_jobs(api)
 
     log.info("Setting description to {desc}".format(desc=settings.REPO_DESCRIPTION))
     github_api.repos.set_desc(api, settings.URN, settings.REPO_DESCRIPTION)
@@ -3,10 +3,15 @@ import settings
 
 from .poll_pull_requests import poll_pull_requests as poll_pull_requests
 from .poll_read_issue_comments import poll_read_issue_comments
+from .dump_stats import dump_stats
 
 
-def schedule_jobs():
+def schedule_jobs(api):
+    """ all jobs share the same api object, so they share its connection pool
+    and rate limit state """
     schedule.every(settings.PULL_REQUEST_POLLING_INTERVAL_SECONDS).seconds.do(
-        poll_pull_requests)
+        poll_pull_requests, api)
     schedule.every(settings.ISSUE_COMMENT_POLLING_INTERVAL_SECONDS).seconds.do(
-        poll_read_issue_comments)
+        poll_read_issue_comments, api)
+    schedule.every(settings.API_STATS_INTERVAL_SECONDS).seconds.do(
+        dump_stats, api)
@@ -0,0 +1,33 @@
+import json
+import logging
+from os.path import join, abspath, dirname
+
+import settings
+import memoize
+
+THIS_DIR = dirname(abspath(__file__))
+STATS_FILE = join(THIS_DIR, "..", settings.API_STATS_FILE)
+MEMOIZE_STATS_FILE = join(THIS_DIR, "..", settings.MEMOIZE_STATS_FILE)
+
+__log = logging.getLogger("chaosbot")
+
+
+def dump_stats(api):
+    """ writes the api's per-endpoint statistics, and our memoize caches'
+    statistics, out as json, so we can see which calls burn the most budget and
+    how well our caching works """
+    api.instrumentation.dump(STATS_FILE)
+
+    for endpoint, stats in api.instrumentation.top(3):
+        __log.info("busiest endpoint %s: %d requests, %d bytes, %0.1fs cooldown",
+                   endpoint, stats["requests"], stats["bytes_received"],
+                   stats["cooldown_seconds"])
+
+    cache_stats = memoize.all_stats()
+    with open(MEMOIZE_STATS_FILE, "w") as h:
+        json.dump(cache_stats, h, indent=2, sort_keys=True)
+
+    for name, stats in sorted(cache_stats.items()):
+        __log.info("cache %s: %d hits, %d stale hits, %d misses, %d entries",
+                   name, stats["hits"], stats["stale_hits"], stats["misses"],
+                   stats["entries"] or 0)
@@ -2,127 +2,230 @@ import arrow
 import logging
 import json
 import os
+from concurrent.futures import ThreadPoolExecutor
 from os.path import join, abspath, dirname
 
+import requests
+
 import settings
 import github_api as gh
+import memoize
+import warm_cache
 
 THIS_DIR = dirname(abspath(__file__))
 
 __log = logging.getLogger("chaosbot")
 
 
-def poll_pull_requests():
-    __log.info("looking for PRs")
+def get_pr_state(api, pr, snapshot=None, known_users=None):
+    """ does all of the reads we need to decide what to do with a pr.  this
+    runs concurrently for all ready prs, so it must not change anything.  if we
+    have a graphql `snapshot` of the pr, its votes come from there """
+    pr_num = pr.number
+    __log.info("collecting votes for PR #%d", pr_num)
+
+    # gather all current votes
+    if snapshot is not None:
+        votes = gh.voting.tally_votes(pr, snapshot["comments"],
+                                      snapshot["reactions"], snapshot["reviews"])
+    else:
+        votes = gh.voting.get_votes(api, settings.URN, pr)
+    state = weigh_votes(api, votes, known_users)
 
-    api = gh.API(settings.GITHUB_USER, settings.GITHUB_SECRET)
+    # a pr in its voting window is about to be merged or closed for good.  our
+    # comments may only be caught up on what changed, which misses deleted
+    # ones, so count its votes again from all of its comments
+    if gh.prs.is_pr_in_voting_window(pr, state[-1]):
+        __log.info("recounting the votes for PR #%d from scratch", pr_num)
+        votes = gh.voting.get_votes(api, settings.URN, pr, full=True)
+        state = weigh_votes(api, votes, known_users)
 
+    return state
+
+
+def weigh_votes(api, votes, known_users):
+    """ returns the votes, their total, the threshold they have to reach and
+    the pr's voting window """
     # get voting window
     now = arrow.utcnow()
     voting_window = gh.voting.get_initial_voting_window(now)
 
-    # get all ready prs (disregarding of the voting window)
-    prs = gh.prs.get_ready_prs(api, settings.URN, 0)
+    # is our PR approved or rejected?
+    vote_total, variance = gh.voting.get_vote_sum(api, votes, known_users)
+    threshold = gh.voting.get_approval_threshold(api, settings.URN)
 
-    needs_update = False
-    for pr in prs:
-        pr_num = pr["number"]
-        __log.info("processing PR #%d", pr_num)
+    # the PR is mitigated or the threshold is not reached ?
+    if variance >= threshold or vote_total < threshold:
+        voting_window = gh.voting.get_extended_voting_window(api, settings.URN)
 
-        # gather all current votes
-        votes = gh.voting.get_votes(api, settings.URN, pr)
+    return votes, vote_total, threshold, voting_window
 
-        # is our PR approved or rejected?
-        vote_total, variance = gh.voting.get_vote_sum(api, votes)
-        threshold = gh.voting.get_approval_threshold(api, settings.URN)
-        is_approved = vote_total >= threshold
 
-        # the PR is mitigated or the threshold is not reached ?
-        if variance >= threshold or not is_approved:
-            voting_window = gh.voting.get_extended_voting_window(api, settings.URN)
+def handle_pr(api, pr, votes, vote_total, threshold, voting_window):
+    """ acts on a pr's votes: merges, closes or updates its status.  returns
+    True if the pr was merged """
+    pr_num = pr.number
+    __log.info("processing PR #%d", pr_num)
+    merged = False
 
-        # is our PR in voting window?
-        in_window = gh.prs.is_pr_in_voting_window(pr, voting_window)
+    is_approved = vote_total >= threshold
 
-        if is_approved:
-            __log.info("PR %d status: will be approved", pr_num)
+    # is our PR in voting window?
+    in_window = gh.prs.is_pr_in_voting_window(pr, voting_window)
 
-            gh.prs.post_accepted_status(
-                api, settings.URN, pr, voting_window, votes, vote_total, threshold)
+    if is_approved:
+        __log.info("PR %d status: will be approved", pr_num)
+
+        gh.prs.post_accepted_status(
+            api, settings.URN, pr, voting_window, votes, vote_total, threshold)
+
+        if in_window:
+            __log.info("PR %d approved for merging!", pr_num)
 
-            if in_window:
-                __log.info("PR %d approved for merging!", pr_num)
-
-                try:
-                    sha = gh.prs.merge_pr(api, settings.URN, pr, votes, vote_total,
-                                          threshold)
-                # some error, like suddenly there's a merge conflict, or some
-                # new commits were introduced between findint this ready pr and
-                # merging it
-                except gh.exceptions.CouldntMerge:
-                    __log.info("couldn't merge PR %d for some reason, skipping",
-                               pr_num)
-                    gh.prs.label_pr(api, settings.URN, pr_num, ["can't merge"])
-                    continue
+            try:
+                sha = gh.prs.merge_pr(api, settings.URN, pr, votes, vote_total,
+                                      threshold)
+            # some error, like suddenly there's a merge conflict, or some
+            # new commits were introduced between findint this ready pr and
+            # merging it
+            except gh.exceptions.CouldntMerge:
+                __log.info("couldn't merge PR %d for some reason, skipping",
+                           pr_num)
+                gh.prs.label_pr(api, settings.URN, pr_num, ["can't merge"])
+                return False
 
+            # from here on, we have to restart onto the merged code no matter
+            # what, so the rest is best effort
+            merged = True
+
+            try:
                 gh.comments.leave_accept_comment(
                     api, settings.URN, pr_num, sha, votes, vote_total, threshold)
                 gh.prs.label_pr(api, settings.URN, pr_num, ["accepted"])
 
                 # chaosbot rewards merge owners with a follow
-                pr_owner = pr["user"]["login"]
+                pr_owner = pr.author
                 gh.users.follow_user(api, pr_owner)
+            except (requests.RequestException, gh.exceptions.CircuitOpen):
+                __log.exception("merged PR %d, but couldn't wrap it up", pr_num)
 
-                needs_update = True
+    else:
+        __log.info("PR %d status: will be rejected", pr_num)
 
+        if in_window:
+            gh.prs.post_rejected_status(
+                api, settings.URN, pr, voting_window, votes, vote_total, threshold)
+            __log.info("PR %d rejected, closing", pr_num)
+            gh.comments.leave_reject_comment(
+                api, settings.URN, pr_num, votes, vote_total, threshold)
+            gh.prs.label_pr(api, settings.URN, pr_num, ["rejected"])
+            gh.prs.close_pr(api, settings.URN, pr)
+        elif vote_total < 0:
+            gh.prs.post_rejected_status(
+                api, settings.URN, pr, voting_window, votes, vote_total, threshold)
         else:
-            __log.info("PR %d status: will be rejected", pr_num)
-
-            if in_window:
-                gh.prs.post_rejected_status(
-                    api, settings.URN, pr, voting_window, votes, vote_total, threshold)
-                __log.info("PR %d rejected, closing", pr_num)
-                gh.comments.leave_reject_comment(
-                    api, settings.URN, pr_num, votes, vote_total, threshold)
-                gh.prs.label_pr(api, settings.URN, pr_num, ["rejected"])
-                gh.prs.close_pr(api, settings.URN, pr)
-            elif vote_total < 0:
-                gh.prs.post_rejected_status(
-                    api, settings.URN, pr, voting_window, votes, vote_total, threshold)
+            gh.prs.post_pending_status(
+                api, settings.URN, pr, voting_window, votes, vote_total, threshold)
+
+    # This sets up a voting record, with each user having a count of votes
+    # that they have cast.
+    try:
+        fp = open('server/voters.json', 'x')
+        fp.close()
+    except:
+        # file already exists, which is what we want
+        pass
+
+    with open('server/voters.json', 'r+') as fp:
+        old_votes = {}
+        fs = fp.read()
+        if fs:
+            # if the voting record exists, read it in
+            old_votes = json.loads(fs)
+            # then prepare for overwriting
+            fp.seek(0)
+            fp.truncate()
+        for user in votes:
+            if user in old_votes:
+                old_votes[user] += 1
             else:
-                gh.prs.post_pending_status(
-                    api, settings.URN, pr, voting_window, votes, vote_total, threshold)
+                old_votes[user] = 1
+        json.dump(old_votes, fp)
+
+    return merged
+
+
+def poll_pull_requests(api):
+    __log.info("looking for PRs")
 
-        # This sets up a voting record, with each user having a count of votes
-        # that they have cast.
+    # if we're already pacing our requests, more threads would only be
+    # waiting on each other
+    workers = settings.PULL_REQUEST_POLLING_WORKERS
+    if api.limiter.is_throttled():
+        workers = 1
+
+    # one graphql query per batch of prs can replace most of our rest calls
+    snapshots = {}
+    known_users = {}
+    open_prs = None
+    if settings.USE_GRAPHQL:
         try:
-            fp = open('server/voters.json', 'x')
-            fp.close()
-        except:
-            # file already exists, which is what we want
-            pass
-
-        with open('server/voters.json', 'r+') as fp:
-            old_votes = {}
-            fs = fp.read()
-            if fs:
-                # if the voting record exists, read it in
-                old_votes = json.loads(fs)
-                # then prepare for overwriting
-                fp.seek(0)
-                fp.truncate()
-            for user in votes:
-                if user in old_votes:
-                    old_votes[user] += 1
-                else:
-                    old_votes[user] = 1
-            json.dump(old_votes, fp)
+            snapshot_list, known_users = gh.graphql.get_open_prs_snapshot(api, settings.URN)
+            snapshots = {s["pr"].number: s for s in snapshot_list}
+            open_prs = [s["pr"] for s in snapshot_list]
+        # the rest api can still get us through this cycle
+        except (gh.exceptions.GraphQLError, requests.RequestException,
+                gh.exceptions.CircuitOpen):
+            __log.exception("graphql snapshot failed, falling back to rest")
+
+    def get_state(pr):
+        try:
+            return get_pr_state(api, pr, snapshots.get(pr.number), known_users)
+        except (requests.RequestException, gh.exceptions.CircuitOpen):
+            __log.exception("failed to collect votes for PR #%d, skipping",
+                            pr.number)
+            return None
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        # get all ready prs (disregarding of the voting window)
+        prs = gh.prs.get_ready_prs(api, settings.URN, 0, pool=pool,
+                                   open_prs=open_prs)
+
+        # the reads for every ready pr happen concurrently, but everything
+        # below that acts on them (merging, closing, restarting) stays
+        # strictly one pr at a time
+        prs = list(prs)
+        states = list(pool.map(get_state, prs))
+
+    # one pr failing (github being flaky, or a circuit being open) shouldn't
+    # throw away the work we've already done for the others
+    needs_update = False
+    for pr, state in zip(prs, states):
+        if state is None:
+            continue
+        try:
+            if handle_pr(api, pr, *state):
+                needs_update = True
+        except (requests.RequestException, gh.exceptions.CircuitOpen):
+            __log.exception("failed to process PR #%d, skipping", pr.number)
 
     # we approved a PR, restart
     if needs_update:
         __log.info("updating code and requirements and restarting self")
         startup_path = join(THIS_DIR, "..", "startup.sh")
+        # exec skips our exit handlers, so write out our caches ourselves, and
+        # save what's only in memory for our next self
+        memoize.flush_all()
+        gh.voting.voter_index.save()
+        try:
+            warm_cache.save(api)
+        except Exception:
+            __log.exception("couldn't save the warm cache")
         os.execl(startup_path, startup_path)
 
+    # remember the voters we met this time
+    gh.voting.voter_index.save()
+
+    __log.debug("api connections: %r", api.connection_stats())
     __log.info("Waiting %d seconds until next scheduled PR polling event",
                settings.PULL_REQUEST_POLLING_INTERVAL_SECONDS)
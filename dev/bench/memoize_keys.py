@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Micro-benchmark of memoize's hot path: a cache hit on get_vote_weight.  It
+compares how we used to build keys (re-extracting the args into a dict and
+json-dumping them on every call) with the binder that's compiled once at
+decoration time.  Run it from the project directory:
+
+    python dev/bench/memoize_keys.py
+"""
+
+import sys
+import json
+import timeit
+import argparse
+from os.path import join, abspath, dirname
+
+sys.path.insert(0, abspath(join(dirname(abspath(__file__)), "..", "..")))
+
+from memoize import memoize  # noqa: E402
+from memoize.helpers import _make_binder, digest_key  # noqa: E402
+
+
+def get_vote_weight(api, username):
+    return 1.0
+
+
+def old_extract_args(sig_args, sig_defaults, args, kwargs, whitelist, blacklist):
+    """ the key path we used to run on every call, for comparison """
+    all_args = dict(zip(sig_args, args))
+    all_args.update(kwargs)
+    if sig_defaults:
+        for i, defl in enumerate(sig_defaults):
+            name = sig_args[-(i + 1)]
+            all_args[name] = defl
+
+    to_use = {}
+    if whitelist is not None:
+        for key in whitelist:
+            to_use[key] = all_args[key]
+    elif blacklist is not None:
+        for key, val in all_args.items():
+            if key not in blacklist:
+                to_use[key] = val
+    else:
+        to_use = all_args
+    return to_use
+
+
+def old_key(args, kwargs):
+    to_use = old_extract_args(["api", "username"], None, args, kwargs,
+                              None, {"api"})
+    return json.dumps(tuple(sorted(to_use.items(), key=lambda e: e[0])))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="benchmark memoize keys")
+    parser.add_argument("--number", type=int, default=200000)
+    args = parser.parse_args()
+
+    api = object()
+    bind = _make_binder(get_vote_weight, blacklist={"api"})
+    hit = memoize("1d", blacklist={"api"})(get_vote_weight)
+    hit_digest = memoize("1d", blacklist={"api"}, key_fn=digest_key)(get_vote_weight)
+    hit(api, "smittyvb")
+    hit_digest(api, "smittyvb")
+
+    cases = [
+        ("old key", lambda: old_key((api, "smittyvb"), {})),
+        ("binder key", lambda: bind((api, "smittyvb"), {})),
+        ("binder + digest key", lambda: digest_key(bind((api, "smittyvb"), {}))),
+        ("cache hit", lambda: hit(api, "smittyvb")),
+        ("cache hit, digest key", lambda: hit_digest(api, "smittyvb")),
+    ]
+
+    baseline = None
+    for name, fn in cases:
+        seconds = min(timeit.repeat(fn, number=args.number, repeat=3))
+        per_call = seconds / args.number * 1e6
+        if baseline is None:
+            baseline = per_call
+        print("{:>22}: {:6.2f}us per call ({:.1f}x)".format(
+            name, per_call, baseline / per_call))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Micro-benchmark of turning comments into votes.  It compares how we used to do
+it (demojizing the whole body, then reading both emoji lists from disk and
+scanning the body for each emoji) with the compiled VoteMatcher.  The corpus is
+the comments of a fake github dataset, or, with --corpus, a json list of real
+comment bodies.  Run it from the project directory:
+
+    python dev/bench/vote_matcher.py
+"""
+
+import os
+import sys
+import json
+import timeit
+import argparse
+from os.path import join, abspath, dirname
+
+PROJECT_DIR = abspath(join(dirname(abspath(__file__)), "..", ".."))
+sys.path.insert(0, PROJECT_DIR)
+sys.path.insert(0, join(PROJECT_DIR, "dev", "fake_github"))
+
+from emoji import demojize  # noqa: E402
+
+from github_api import voting  # noqa: E402
+import fake_github  # noqa: E402
+
+
+def old_parse_comment_for_vote(body):
+    """ the vote parsing we used to run on every comment, for comparison """
+    body = demojize(body)
+    for positive_emoji in voting.prepare_emojis_list("positive"):
+        if positive_emoji in body:
+            return 1
+    for negative_emoji in voting.prepare_emojis_list("negative"):
+        if negative_emoji in body:
+            return -1
+    return 0
+
+
+def load_corpus(args):
+    if args.corpus:
+        with open(args.corpus) as h:
+            return json.load(h)
+
+    dataset = fake_github.Dataset()
+    return [c["body"] for comments in dataset.comments.values() for c in comments]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="benchmark vote parsing")
+    parser.add_argument("--corpus", help="a json list of comment bodies")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    # the emoji lists are read relative to the project directory
+    os.chdir(PROJECT_DIR)
+
+    corpus = load_corpus(args)
+    old_votes = [old_parse_comment_for_vote(body) for body in corpus]
+    new_votes = [voting.parse_comment_for_vote(body) for body in corpus]
+    changed = sum(1 for old, new in zip(old_votes, new_votes) if old != new)
+    print("corpus: {} comments, {} votes changed".format(len(corpus), changed))
+
+    cases = [
+        ("old", old_parse_comment_for_vote),
+        ("vote matcher", voting.parse_comment_for_vote),
+    ]
+
+    baseline = None
+    for name, fn in cases:
+        seconds = min(timeit.repeat(lambda: [fn(body) for body in corpus],
+                                    number=1, repeat=args.repeat))
+        per_comment = seconds / len(corpus) * 1e6
+        if baseline is None:
+            baseline = per_comment
+        print("{:>14}: {:8.2f}us per comment ({:.1f}x)".format(
+            name, per_comment, baseline / per_comment))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Benchmarks a poll cycle against the fake github server.  Run it from the
+project directory:
+
+    python dev/fake_github/bench.py --scale 10 --cycles 3
+
+Every cycle runs poll_pull_requests and poll_read_issue_comments against the
+same api object, just like the real bot, so later cycles show the effect of
+our caches.  A merge "restarts" the bot: we start over with a new api object,
+carrying the warm cache over unless --cold-restarts is given.
+"""
+
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import tempfile
+from os.path import join, abspath, dirname
+from unittest import mock
+
+THIS_DIR = dirname(abspath(__file__))
+PROJECT_DIR = abspath(join(THIS_DIR, "..", ".."))
+sys.path.insert(0, PROJECT_DIR)
+
+import fake_github  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description="benchmark a poll cycle")
+    fake_github.add_dataset_args(parser)
+    parser.add_argument("--cycles", type=int, default=2)
+    parser.add_argument("--graphql", action="store_true",
+                        help="use the graphql snapshot instead of rest calls")
+    parser.add_argument("--cold-restarts", action="store_true",
+                        help="don't carry the warm cache over restarts")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING)
+
+    # settings reads some files relative to the project directory when it's
+    # imported, so do that before we move into our scratch directory
+    os.chdir(PROJECT_DIR)
+    import settings
+    import github_api as gh
+    import github_api.prs  # noqa: F401
+    import github_api.voting  # noqa: F401
+    import github_api.comments  # noqa: F401
+    import github_api.graphql  # noqa: F401
+    import cron  # noqa: F401
+    poll_prs = sys.modules["cron.poll_pull_requests"]
+    poll_comments = sys.modules["cron.poll_read_issue_comments"]
+    import warm_cache
+
+    dataset = fake_github.dataset_from_args(args)
+    server = fake_github.FakeGitHub(dataset, latency=args.latency,
+                                    rate_limit=args.rate_limit)
+    server.serve_in_thread()
+
+    # the bot writes its voting record relative to where it runs, so run it
+    # somewhere that isn't our checkout.  it reads the emoji lists the same way
+    scratch = tempfile.mkdtemp(prefix="chaos-bench-")
+    os.mkdir(join(scratch, "server"))
+    os.symlink(join(PROJECT_DIR, "data"), join(scratch, "data"))
+    os.chdir(scratch)
+
+    commands_file = join(scratch, "issue_commands_ran.json")
+    with open(commands_file, "w") as h:
+        json.dump({"comment_ids_ran": []}, h)
+
+    restarts = []
+    patches = [
+        mock.patch.object(settings, "URN", dataset.urn),
+        mock.patch.object(settings, "USE_GRAPHQL", args.graphql),
+        mock.patch.object(poll_prs.os, "execl", lambda *a: restarts.append(a)),
+        mock.patch.object(poll_comments, "SAVED_COMMANDS_FILE", commands_file),
+        mock.patch.object(warm_cache, "SNAPSHOT_FILE", join(scratch, "warm_cache.pickle")),
+    ]
+    for patch in patches:
+        patch.start()
+
+    print("dataset: {} prs, {} voters, {} comments".format(
+        len(dataset.prs), len(dataset.users),
+        sum(len(c) for c in dataset.comments.values())))
+
+    api = gh.API("bench", "secret", base_url=server.base_url)
+    for cycle in range(args.cycles):
+        for job in (poll_prs.poll_pull_requests, poll_comments.poll_read_issue_comments):
+            before = api.connection_stats()["requests"]
+            merges = len(restarts)
+            started = time.time()
+            job(api)
+            elapsed = time.time() - started
+            requests = api.connection_stats()["requests"] - before
+            print("cycle {}: {} took {:.2f}s and {} requests".format(
+                cycle + 1, job.__name__, elapsed, requests))
+
+            # we merged something and "restarted", so start over with a new
+            # api object, like the real bot would
+            if len(restarts) > merges:
+                api = gh.API("bench", "secret", base_url=server.base_url)
+                if not args.cold_restarts:
+                    warm_cache.restore(api)
+
+    stats = api.instrumentation.as_dict()
+    print("\nrate limit remaining: {}".format(api.limiter.remaining))
+    print("merges: {}".format(len(restarts)))
+    print("connections: {}".format(api.connection_stats()))
+    print("conditional cache: {}".format(api.conditional_cache.stats()))
+    print("comment store: {}".format(api.comment_store.stats()))
+    print("\nbusiest endpoints:")
+    for endpoint, endpoint_stats in api.instrumentation.top(10):
+        print("  {:>6} {:>10}b {:>8.3f}s  {}".format(
+            endpoint_stats["requests"], endpoint_stats["bytes_received"],
+            endpoint_stats["latency"]["mean"], endpoint))
+
+    stats_file = join(scratch, "api_stats.json")
+    api.instrumentation.dump(stats_file)
+    print("\nfull stats in {}".format(stats_file))
+    print("total endpoints: {}".format(len(stats["endpoints"])))
+
+    for patch in patches:
+        patch.stop()
+
+
+if __name__ == "__main__":
+    main()
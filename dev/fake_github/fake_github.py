@@ -0,0 +1,604 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+A local stand-in for the parts of the github api that chaosbot uses, serving a
+synthetic repo of whatever size we want.  It speaks enough of the real thing
+(pagination Link headers, ETags and 304s, rate limit headers, merge conflicts)
+that the bot can't tell the difference, which lets us load test it offline.
+
+    python dev/fake_github/fake_github.py --scale 10 --port 8000
+
+and then point an API object at it with base_url="http://localhost:8000"
+"""
+
+import re
+import sys
+import json
+import time
+import random
+import hashlib
+import argparse
+import threading
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from urllib.parse import urlparse, parse_qs, urlencode
+
+# roughly how big the real repo is.  --scale multiplies the prs and voters
+REAL_SIZE = {
+    "prs": 30,
+    "comments": 20,
+    "reactions": 10,
+    "reviews": 3,
+    "voters": 200,
+}
+
+RATE_LIMIT = 5000
+RATE_LIMIT_WINDOW = 60 * 60
+
+POSITIVE = [":+1:", "looks good :thumbsup:", "\U0001F44D nice", "yes! :ok_hand:"]
+NEGATIVE = [":-1:", "nope :thumbsdown:", "\U0001F44E", ":hankey: this breaks things"]
+NEUTRAL = ["what does this do?", "can you rebase?", "lol", "I'm not sure about this",
+           "this is a long comment about the design of the thing " * 5]
+REACTIONS = ["+1", "-1", "laugh", "hooray", "confused", "heart"]
+
+
+def github_dt(dt):
+    return dt.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+class Dataset(object):
+    """ a synthetic repo.  everything is generated up front from `seed`, so two
+    datasets with the same arguments are identical """
+
+    def __init__(self, urn="chaosbot/chaos", prs=REAL_SIZE["prs"],
+                 comments=REAL_SIZE["comments"], reactions=REAL_SIZE["reactions"],
+                 reviews=REAL_SIZE["reviews"], voters=REAL_SIZE["voters"], seed=0):
+        self.urn = urn
+        self.lock = threading.RLock()
+        self._rand = random.Random(seed)
+        self._next_id = 1
+        self._now = datetime.utcnow()
+
+        self.repo = {
+            "id": self.new_id(),
+            "name": urn.split("/")[1],
+            "full_name": urn,
+            "created_at": github_dt(self._now - timedelta(days=30)),
+            "subscribers_count": max(1, voters // 4),
+            "stargazers_count": voters * 5,
+            "watchers_count": voters * 5,
+        }
+
+        self.users = {}
+        for i in range(voters):
+            login = "voter{}".format(i)
+            # most voters are old enough to vote, some aren't
+            age = timedelta(days=self._rand.choice([3, 400, 800, 1500, 3000]))
+            self.users[login] = {
+                "login": login,
+                "id": self.new_id(),
+                "type": "User",
+                "created_at": github_dt(self._now - age),
+            }
+        self.logins = sorted(self.users)
+
+        self.prs = {}
+        self.comments = {}
+        self.reactions = {}
+        self.reviews = {}
+        self.statuses = {}
+        self.labels = {}
+        self.following = set()
+
+        for number in range(1, prs + 1):
+            self._generate_pr(number, comments, reactions, reviews)
+
+    def new_id(self):
+        new_id = self._next_id
+        self._next_id += 1
+        return new_id
+
+    def _generate_pr(self, number, num_comments, num_reactions, num_reviews):
+        rand = self._rand
+        author = rand.choice(self.logins)
+        # spread the last pushes over the last day, so some prs are still in
+        # their voting window and some aren't
+        pushed = self._now - timedelta(minutes=rand.randint(0, 24 * 60))
+        created = pushed - timedelta(hours=rand.randint(0, 48))
+        # one pr in ten is still computing its mergeability, one in ten has
+        # conflicts
+        mergeable = rand.choice([True] * 8 + [False, None])
+
+        self.prs[number] = {
+            "id": self.new_id(),
+            "number": number,
+            "state": "open",
+            "title": rand.choice(["Add a thing", "Fix the thing", "WIP: a thing",
+                                  "Remove the thing"]) + " #{}".format(number),
+            "body": "This PR does a thing.\n\n" * rand.randint(1, 20),
+            "user": self._user_stub(author),
+            "created_at": github_dt(created),
+            "updated_at": github_dt(pushed),
+            "head": {
+                "sha": hashlib.sha1(str(number).encode("utf8")).hexdigest(),
+                "ref": "branch-{}".format(number),
+                "repo": {"full_name": "{}/chaos".format(author),
+                         "pushed_at": github_dt(pushed)},
+            },
+            "base": {"ref": "master"},
+            "_mergeable": mergeable,
+        }
+
+        self.comments[number] = []
+        for i in range(num_comments):
+            at = github_dt(created + timedelta(minutes=i))
+            self.comments[number].append({
+                "id": self.new_id(),
+                "issue_number": number,
+                "user": self._user_stub(rand.choice(self.logins)),
+                "body": rand.choice(POSITIVE + NEGATIVE + NEUTRAL * 2),
+                "created_at": at,
+                "updated_at": at,
+            })
+
+        self.reactions[number] = []
+        for i in range(num_reactions):
+            self.reactions[number].append({
+                "id": self.new_id(),
+                "user": self._user_stub(rand.choice(self.logins)),
+                "content": rand.choice(REACTIONS),
+                "created_at": github_dt(created + timedelta(minutes=i)),
+            })
+
+        self.reviews[number] = []
+        for i in range(num_reviews):
+            self.reviews[number].append({
+                "id": self.new_id(),
+                "user": self._user_stub(rand.choice(self.logins)),
+                "state": rand.choice(["APPROVED", "COMMENTED", "DISMISSED"]),
+                "submitted_at": github_dt(created + timedelta(minutes=i)),
+            })
+
+    def _user_stub(self, login):
+        return {"login": login, "id": self.users[login]["id"], "type": "User"}
+
+    def comment_json(self, comment, base_url):
+        comment = dict(comment)
+        number = comment.pop("issue_number")
+        comment["html_url"] = "https://github.com/{}/issues/{}#issuecomment-{}".format(
+            self.urn, number, comment["id"])
+        comment["issue_url"] = "{}/repos/{}/issues/{}".format(base_url, self.urn, number)
+        return comment
+
+    def pr_json(self, pr, base_url, detailed=False):
+        data = {k: v for k, v in pr.items() if not k.startswith("_")}
+        data["statuses_url"] = "{}/repos/{}/statuses/{}".format(
+            base_url, self.urn, pr["head"]["sha"])
+        # just like the real thing, only single prs know if they're mergeable
+        if detailed:
+            data["mergeable"] = pr["_mergeable"]
+        return data
+
+
+class RateLimit(object):
+    def __init__(self, limit=RATE_LIMIT, window=RATE_LIMIT_WINDOW):
+        self.limit = limit
+        self._window = window
+        self._lock = threading.Lock()
+        self._reset = int(time.time()) + window
+        self.remaining = limit
+
+    def spend(self, cost):
+        with self._lock:
+            now = time.time()
+            if now >= self._reset:
+                self._reset = int(now) + self._window
+                self.remaining = self.limit
+            self.remaining = max(self.remaining - cost, 0)
+            return self.remaining, self._reset
+
+
+class Route(object):
+    def __init__(self, method, pattern, handler):
+        self.method = method
+        self.pattern = re.compile("^" + pattern + "$")
+        self.handler = handler
+
+
+class FakeGitHub(ThreadingMixIn, HTTPServer):
+    """ the server.  `latency` is an artificial delay, in seconds, added to
+    every response """
+
+    daemon_threads = True
+
+    def __init__(self, dataset, address=("127.0.0.1", 0), latency=0.0,
+                 rate_limit=RATE_LIMIT):
+        HTTPServer.__init__(self, address, FakeGitHubHandler)
+        self.dataset = dataset
+        self.latency = latency
+        self.rate_limit = RateLimit(rate_limit)
+        self.request_counts = {}
+        self._counts_lock = threading.Lock()
+
+    @property
+    def base_url(self):
+        return "http://{}:{}".format(*self.server_address[:2])
+
+    def count(self, route):
+        with self._counts_lock:
+            self.request_counts[route] = self.request_counts.get(route, 0) + 1
+
+    def serve_in_thread(self):
+        thread = threading.Thread(target=self.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return thread
+
+
+class FakeGitHubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    REPO = r"/repos/(?P<owner>[^/]+)/(?P<name>[^/]+)"
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self.dispatch("GET")
+
+    def do_POST(self):
+        self.dispatch("POST")
+
+    def do_PUT(self):
+        self.dispatch("PUT")
+
+    def do_PATCH(self):
+        self.dispatch("PATCH")
+
+    def dispatch(self, method):
+        parts = urlparse(self.path)
+        self.query = {k: v[-1] for k, v in parse_qs(parts.query).items()}
+
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+        self.body = json.loads(body.decode("utf8")) if body else None
+
+        if self.server.latency:
+            time.sleep(self.server.latency)
+
+        for route in ROUTES:
+            match = route.pattern.match(parts.path)
+            if route.method == method and match:
+                self.server.count("{} {}".format(method, route.pattern.pattern[1:-1]))
+                with self.server.dataset.lock:
+                    status, data, headers = route.handler(self, **match.groupdict())
+                self.respond(status, data, headers)
+                return
+
+        self.respond(404, {"message": "Not Found"})
+
+    def respond(self, status, data, headers=None):
+        headers = dict(headers or {})
+        payload = json.dumps(data).encode("utf8") if data is not None else b""
+
+        if status == 200 and self.command == "GET":
+            etag = '"{}"'.format(hashlib.md5(payload).hexdigest())
+            headers["ETag"] = etag
+            # conditional requests that match are free, just like on github
+            if self.headers.get("If-None-Match") == etag:
+                status, payload = 304, b""
+
+        cost = 0 if status == 304 else 1
+        remaining, reset = self.server.rate_limit.spend(cost)
+        headers["X-RateLimit-Limit"] = str(self.server.rate_limit.limit)
+        headers["X-RateLimit-Remaining"] = str(remaining)
+        headers["X-RateLimit-Reset"] = str(reset)
+
+        self.send_response(status)
+        if payload:
+            headers["Content-Type"] = "application/json; charset=utf-8"
+        headers["Content-Length"] = str(len(payload))
+        for k, v in headers.items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def paginate(self, items):
+        """ returns one page of items, and the Link header pointing at the
+        next and last pages """
+        per_page = min(int(self.query.get("per_page", 30)), 100)
+        page = int(self.query.get("page", 1))
+        last = max((len(items) + per_page - 1) // per_page, 1)
+
+        start = (page - 1) * per_page
+        data = items[start:start + per_page]
+
+        def page_url(n):
+            query = dict(self.query, page=n)
+            return "<{}{}?{}>".format(self.server.base_url,
+                                      urlparse(self.path).path, urlencode(query))
+
+        links = []
+        if page < last:
+            links.append('{}; rel="next"'.format(page_url(page + 1)))
+        links.append('{}; rel="last"'.format(page_url(last)))
+        return 200, data, {"Link": ", ".join(links)}
+
+    # handlers.  each returns a status code, the json data, and extra headers
+
+    def get_repo(self, owner, name):
+        return 200, self.server.dataset.repo, None
+
+    def patch_repo(self, owner, name):
+        self.server.dataset.repo.update(self.body or {})
+        return 200, self.server.dataset.repo, None
+
+    def get_pulls(self, owner, name):
+        ds = self.server.dataset
+        state = self.query.get("state", "open")
+        prs = [pr for pr in ds.prs.values() if state == "all" or pr["state"] == state]
+        prs.sort(key=lambda pr: pr["updated_at"],
+                 reverse=self.query.get("direction") == "desc")
+        return self.paginate([ds.pr_json(pr, self.server.base_url) for pr in prs])
+
+    def get_pull(self, owner, name, number):
+        ds = self.server.dataset
+        pr = ds.prs.get(int(number))
+        if pr is None:
+            return 404, {"message": "Not Found"}, None
+        return 200, ds.pr_json(pr, self.server.base_url, detailed=True), None
+
+    def patch_pull(self, owner, name, number):
+        return self.patch_issue(owner, name, number)
+
+    def merge_pull(self, owner, name, number):
+        pr = self.server.dataset.prs.get(int(number))
+        if pr is None:
+            return 404, {"message": "Not Found"}, None
+        if pr["state"] != "open" or not pr["_mergeable"]:
+            return 405, {"message": "Pull Request is not mergeable"}, None
+        if (self.body or {}).get("sha") not in (None, pr["head"]["sha"]):
+            return 409, {"message": "Head branch was modified"}, None
+
+        pr["state"] = "closed"
+        sha = hashlib.sha1("merge{}".format(number).encode("utf8")).hexdigest()
+        return 200, {"sha": sha, "merged": True, "message": "merged"}, None
+
+    def get_reviews(self, owner, name, number):
+        return self.paginate(self.server.dataset.reviews.get(int(number), []))
+
+    def get_issue_comments(self, owner, name, number):
+        ds = self.server.dataset
+        comments = ds.comments.get(int(number), [])
+        since = self.query.get("since")
+        if since:
+            comments = [c for c in comments if c["updated_at"] >= since]
+        return self.paginate([ds.comment_json(c, self.server.base_url) for c in comments])
+
+    def post_issue_comment(self, owner, name, number):
+        ds = self.server.dataset
+        now = github_dt(datetime.utcnow())
+        comment = {
+            "id": ds.new_id(),
+            "issue_number": int(number),
+            "user": {"login": "chaosbot", "id": 0, "type": "User"},
+            "body": self.body["body"],
+            "created_at": now,
+            "updated_at": now,
+        }
+        ds.comments.setdefault(int(number), []).append(comment)
+        return 201, ds.comment_json(comment, self.server.base_url), None
+
+    def get_issue_reactions(self, owner, name, number):
+        return self.paginate(self.server.dataset.reactions.get(int(number), []))
+
+    def put_labels(self, owner, name, number):
+        labels = [{"name": label} for label in self.body or []]
+        self.server.dataset.labels[int(number)] = labels
+        return 200, labels, None
+
+    def patch_issue(self, owner, name, number):
+        pr = self.server.dataset.prs.get(int(number))
+        if pr is None:
+            return 404, {"message": "Not Found"}, None
+        if self.body and "state" in self.body:
+            pr["state"] = self.body["state"]
+        return 200, self.server.dataset.pr_json(pr, self.server.base_url), None
+
+    def get_all_comments(self, owner, name):
+        ds = self.server.dataset
+        comments = [c for cs in ds.comments.values() for c in cs]
+        since = self.query.get("since")
+        if since:
+            comments = [c for c in comments if c["updated_at"] >= since]
+        key = "updated_at" if self.query.get("sort") == "updated" else "created_at"
+        comments.sort(key=lambda c: (c[key], c["id"]),
+                      reverse=self.query.get("direction") == "desc")
+        return self.paginate([ds.comment_json(c, self.server.base_url) for c in comments])
+
+    def find_comment(self, comment_id):
+        for comments in self.server.dataset.comments.values():
+            for comment in comments:
+                if comment["id"] == int(comment_id):
+                    return comment
+        return None
+
+    def get_comment(self, owner, name, comment_id):
+        comment = self.find_comment(comment_id)
+        if comment is None:
+            return 404, {"message": "Not Found"}, None
+        return 200, self.server.dataset.comment_json(comment, self.server.base_url), None
+
+    def get_comment_reactions(self, owner, name, comment_id):
+        return self.paginate([])
+
+    def post_status(self, owner, name, sha):
+        status = dict(self.body or {}, id=self.server.dataset.new_id())
+        self.server.dataset.statuses.setdefault(sha, []).insert(0, status)
+        return 201, status, None
+
+    def get_statuses(self, owner, name, sha):
+        return self.paginate(self.server.dataset.statuses.get(sha, []))
+
+    def get_user(self, login):
+        user = self.server.dataset.users.get(login)
+        if user is None:
+            return 404, {"message": "Not Found"}, None
+        return 200, user, None
+
+    def follow_user(self, login):
+        self.server.dataset.following.add(login)
+        return 204, None, None
+
+    def graphql(self):
+        """ only understands the open prs snapshot query from
+        github_api.graphql, and the users query from github_api.users """
+        variables = (self.body or {}).get("variables") or {}
+        ds = self.server.dataset
+        if variables and all(re.match(r"u\d+$", v) for v in variables):
+            return self.graphql_users(variables)
+        if "owner" not in variables:
+            return 200, {"errors": [{"message": "unsupported query"}]}, None
+
+        prs = sorted((pr for pr in ds.prs.values() if pr["state"] == "open"),
+                     key=lambda pr: pr["updated_at"])
+        start = int(variables.get("after") or 0)
+        batch = prs[start:start + variables["first"]]
+        nested = variables["nested"]
+
+        def actor(user):
+            return {"login": user["login"],
+                    "createdAt": ds.users[user["login"]]["created_at"]}
+
+        def connection(items, node):
+            return {"pageInfo": {"hasNextPage": len(items) > nested},
+                    "nodes": [node(item) for item in items[:nested]]}
+
+        nodes = []
+        for pr in batch:
+            number = pr["number"]
+            nodes.append({
+                "number": number,
+                "title": pr["title"],
+                "body": pr["body"],
+                "createdAt": pr["created_at"],
+                "mergeable": {True: "MERGEABLE", False: "CONFLICTING"}.get(
+                    pr["_mergeable"], "UNKNOWN"),
+                "headRefOid": pr["head"]["sha"],
+                "headRepository": {"pushedAt": pr["head"]["repo"]["pushed_at"]},
+                "author": actor(pr["user"]),
+                "comments": connection(ds.comments[number], lambda c: {
+                    "databaseId": c["id"], "body": c["body"],
+                    "createdAt": c["created_at"], "updatedAt": c["updated_at"],
+                    "author": actor(c["user"])}),
+                "reactions": connection(ds.reactions[number], lambda r: {
+                    "databaseId": r["id"],
+                    "content": {"+1": "THUMBS_UP", "-1": "THUMBS_DOWN"}.get(
+                        r["content"], r["content"].upper()),
+                    "createdAt": r["created_at"], "user": actor(r["user"])}),
+                "reviews": connection(ds.reviews[number], lambda r: {
+                    "databaseId": r["id"], "state": r["state"],
+                    "submittedAt": r["submitted_at"], "author": actor(r["user"])}),
+            })
+
+        end = start + len(batch)
+        page_info = {"hasNextPage": end < len(prs), "endCursor": str(end)}
+        data = {"repository": {"pullRequests": {"pageInfo": page_info, "nodes": nodes}}}
+        return 200, {"data": data}, None
+
+    def graphql_users(self, variables):
+        ds = self.server.dataset
+        data = {}
+        errors = []
+        for alias, login in variables.items():
+            user = ds.users.get(login)
+            data[alias] = user and {"login": login, "createdAt": user["created_at"]}
+            if user is None:
+                errors.append({"message": "Could not resolve to a User with the "
+                                          "login of '{}'.".format(login)})
+        body = {"data": data}
+        if errors:
+            body["errors"] = errors
+        return 200, body, None
+
+
+R = FakeGitHubHandler.REPO
+ROUTES = [
+    Route("GET", R, FakeGitHubHandler.get_repo),
+    Route("PATCH", R, FakeGitHubHandler.patch_repo),
+    Route("GET", R + r"/pulls", FakeGitHubHandler.get_pulls),
+    Route("GET", R + r"/pulls/(?P<number>\d+)", FakeGitHubHandler.get_pull),
+    Route("PATCH", R + r"/pulls/(?P<number>\d+)", FakeGitHubHandler.patch_pull),
+    Route("PUT", R + r"/pulls/(?P<number>\d+)/merge", FakeGitHubHandler.merge_pull),
+    Route("GET", R + r"/pulls/(?P<number>\d+)/reviews", FakeGitHubHandler.get_reviews),
+    Route("GET", R + r"/issues/comments", FakeGitHubHandler.get_all_comments),
+    Route("GET", R + r"/issues/comments/(?P<comment_id>\d+)",
+          FakeGitHubHandler.get_comment),
+    Route("GET", R + r"/issues/comments/(?P<comment_id>\d+)/reactions",
+          FakeGitHubHandler.get_comment_reactions),
+    Route("PATCH", R + r"/issues/(?P<number>\d+)", FakeGitHubHandler.patch_issue),
+    Route("GET", R + r"/issues/(?P<number>\d+)/comments",
+          FakeGitHubHandler.get_issue_comments),
+    Route("POST", R + r"/issues/(?P<number>\d+)/comments",
+          FakeGitHubHandler.post_issue_comment),
+    Route("GET", R + r"/issues/(?P<number>\d+)/reactions",
+          FakeGitHubHandler.get_issue_reactions),
+    Route("PUT", R + r"/issues/(?P<number>\d+)/labels", FakeGitHubHandler.put_labels),
+    Route("GET", R + r"/statuses/(?P<sha>\w+)", FakeGitHubHandler.get_statuses),
+    Route("POST", R + r"/statuses/(?P<sha>\w+)", FakeGitHubHandler.post_status),
+    Route("GET", r"/users/(?P<login>[^/]+)", FakeGitHubHandler.get_user),
+    Route("PUT", r"/user/following/(?P<login>[^/]+)", FakeGitHubHandler.follow_user),
+    Route("POST", r"/graphql", FakeGitHubHandler.graphql),
+]
+
+
+def add_dataset_args(parser):
+    parser.add_argument("--urn", default="chaosbot/chaos")
+    parser.add_argument("--scale", type=float, default=1,
+                        help="multiplies the number of prs and voters of our real size")
+    parser.add_argument("--prs", type=int)
+    parser.add_argument("--comments", type=int, default=REAL_SIZE["comments"],
+                        help="comments per pr")
+    parser.add_argument("--reactions", type=int, default=REAL_SIZE["reactions"],
+                        help="reactions per pr")
+    parser.add_argument("--reviews", type=int, default=REAL_SIZE["reviews"],
+                        help="reviews per pr")
+    parser.add_argument("--voters", type=int)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="artificial seconds of latency per request")
+    parser.add_argument("--rate-limit", type=int, default=RATE_LIMIT,
+                        help="requests per hour.  raise it to take our own "
+                        "pacing out of the picture")
+
+
+def dataset_from_args(args):
+    return Dataset(
+        urn=args.urn,
+        prs=args.prs or int(REAL_SIZE["prs"] * args.scale),
+        comments=args.comments,
+        reactions=args.reactions,
+        reviews=args.reviews,
+        voters=args.voters or int(REAL_SIZE["voters"] * args.scale),
+        seed=args.seed,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    add_dataset_args(parser)
+    parser.add_argument("--port", type=int, default=8000)
+    args = parser.parse_args()
+
+    dataset = dataset_from_args(args)
+    server = FakeGitHub(dataset, ("127.0.0.1", args.port), latency=args.latency,
+                        rate_limit=args.rate_limit)
+    sys.stderr.write("serving {} with {} prs and {} voters on {}\n".format(
+        dataset.urn, len(dataset.prs), len(dataset.users), server.base_url))
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,41 +1,30 @@
-import time
 import re
-import math
+import time
+import threading
 import requests
+from requests.adapters import HTTPAdapter
 from requests.auth import HTTPBasicAuth
+from requests.utils import parse_header_links
 import logging
 import settings
+from . import exceptions as exc
+from . import ratelimit
+from . import retry
+from .comment_store import CommentStore
+from .conditional import ConditionalCache
+from .instrumentation import Instrumentation, template_endpoint
+from .ratelimit import RateLimiter
 
 log = logging.getLogger("github_api")
 
 
-def compute_api_cooldown(remaining, reset):
-    """ remaining is the number of api requests, reset is the amount of time
-    until our api call counter gets refreshed.  it returns a number of seconds
-    to sleep before an api call.  this yields a nice curve where we'll spend
-    more time waiting as we have fewer api calls left, and less time weighting
-    if our refresh time is sooner.  graph it """
-
-    # i've seen github's api fail with a 403 when we had 5 requests remaining,
-    # as confirmed by their response headers.  so we'll take that kind of
-    # fluctuation into account.
-    #
-    # also account for a potential divide by zero
-    actual_remaining = max(remaining - 30, 1)
-
-    cooldown = ((reset / actual_remaining) ** 3) / 10.0
-
-    # it doesn't make sense to ever sleep longer than the point where github
-    # refreshes our api counter, but let's also pad that value a little bit
-    cooldown = min(reset + settings.API_COOLDOWN_RESET_PADDING, cooldown)
-
-    return cooldown
-
-
 class API(object):
     """ our github api class.  very simple, an instance of this class behaves
     like a function which does rate limiting.  see __call__ for the general
-    usage """
+    usage.  requests can be given a `priority` keyword from the ratelimit
+    module, which decides who waits (or gets dropped) when our api budget runs
+    low, and a `project` function, like a record's from_json, which slims down
+    every decoded object before we hold on to it """
 
     BASE_URL = "https://api.github.com"
     BASE_HEADERS = {
@@ -44,40 +33,156 @@ class API(object):
         "Accept": "application/vnd.github.squirrel-girl-preview+json"
     }
 
-    def __init__(self, user, pat):
+    def __init__(self, user, pat, pool_size=settings.API_POOL_SIZE,
+                 conditional_cache_size=settings.API_CONDITIONAL_CACHE_SIZE,
+                 base_url=None):
+        # pointing the api somewhere else is useful for testing against a
+        # local stand-in for github
+        if base_url is not None:
+            self.BASE_URL = base_url.rstrip("/")
+
         self._auth = HTTPBasicAuth(user, pat)
-        self._remaining = math.inf
-        self._reset = 0
+        self.limiter = RateLimiter()
+        self.instrumentation = Instrumentation()
+        self.retry_policy = retry.RetryPolicy()
+        self.breaker = retry.CircuitBreaker()
+        self.conditional_cache = ConditionalCache(conditional_cache_size)
+        self.comment_store = CommentStore(settings.API_COMMENT_STORE_SCOPES,
+                                          settings.API_COMMENTS_FULL_SYNC_SECONDS)
+
+        # one long-lived session per api object, so that consecutive calls
+        # reuse the same keep-alive connection instead of doing a new tcp+tls
+        # handshake every time
+        self._adapter = HTTPAdapter(pool_connections=pool_size,
+                                    pool_maxsize=pool_size)
+        self._session = requests.Session()
+        self._session.auth = self._auth
+        self._session.headers.update(self.BASE_HEADERS)
+        self._session.mount("https://", self._adapter)
+        self._session.mount("http://", self._adapter)
+        # the api object is shared between threads
+        self._num_requests = 0
+        self._num_requests_lock = threading.Lock()
+
+    def connection_stats(self):
+        """ returns how many requests we've made, and how many of those had to
+        open a new connection.  everything else reused a pooled one """
+        connections = 0
+        pools = self._adapter.poolmanager.pools
+        for key in pools.keys():
+            connections += pools[key].num_connections
+
+        with self._num_requests_lock:
+            num_requests = self._num_requests
+        return {
+            "requests": num_requests,
+            "connections": connections,
+            "reused": max(num_requests - connections, 0),
+        }
+
+    def close(self):
+        self._session.close()
 
     def __call__(self, method, path, **kwargs):
-        # sleep for a cooldown period, so we don't exhaust our api requests in
-        # the middle of doing something important
-        now = time.time()
-        reset_in = max(self._reset - now, 0)
-        cooldown = compute_api_cooldown(self._remaining, reset_in)
-        log.debug("requests remaining: %s, reset in: %ds, cooldown sleep: %0.2fs",
-                  self._remaining, reset_in, cooldown)
-        time.sleep(cooldown)
+        data, _ = self._request(method, path, **kwargs)
+        return data
+
+    def graphql(self, query, variables=None, priority=ratelimit.NORMAL):
+        """ runs a query against github's graphql api, and returns its "data".
+        graphql reports errors in the response body, not the status code, so
+        we raise those ourselves """
+        # queries are reads, so they're safe to retry even though they're POSTs
+        data, _ = self._request("post", self.BASE_URL + "/graphql",
+                                json={"query": query, "variables": variables or {}},
+                                priority=priority, idempotent=True)
+        if data.get("errors"):
+            raise exc.GraphQLError(data["errors"])
+        return data["data"]
+
+    def paginate(self, path, params=None, max_pages=None, **kwargs):
+        """ lazily yields the items of a paginated list endpoint, following the
+        rel="next" links that github sends back.  the next page is only
+        requested once the caller has consumed the current one, so breaking
+        out early saves api requests.  max_pages caps how many pages we will
+        fetch at most """
+        pages = 0
+        while path and (max_pages is None or pages < max_pages):
+            data, links = self._request("get", path, params=params, **kwargs)
+            pages += 1
+
+            for item in data or []:
+                yield item
+
+            # the next link already has all of our query params baked in
+            path = links.get("next")
+            params = None
 
+    def _request(self, method, path, priority=ratelimit.NORMAL, idempotent=None,
+                 project=None, **kwargs):
+        """ does the actual request, and returns the decoded data alongside a
+        mapping of the Link header's rel => url.  transient failures are
+        retried according to our retry policy.  `idempotent` overrides whether
+        the request is safe to repeat, which is otherwise decided by its
+        method """
         url = self.BASE_URL + path
         if re.match("https?://", path):
             url = path
 
-        headers = self.BASE_HEADERS.copy()
+        if idempotent is None:
+            idempotent = method.upper() in retry.IDEMPOTENT_METHODS
 
-        log.info("requesting %s to %r", method.upper(), path)
-        resp = requests.request(method, url, headers=headers, auth=self._auth,
-                                **kwargs)
+        # for reads, send back the validators from the last time we fetched
+        # this resource.  if it hasn't changed, github replies with an empty
+        # 304 that doesn't cost us anything against our rate limit
+        cache_key = None
+        if method.lower() == "get":
+            # the same resource projected differently is cached separately
+            cache_key = ConditionalCache.make_key(url, kwargs.get("params"),
+                                                  projection_name(project))
+            conditional, cached = self.conditional_cache.lookup(cache_key)
+            headers = kwargs.pop("headers", {}).copy()
+            headers.update(conditional)
+            kwargs["headers"] = headers
+
+        endpoint = template_endpoint(method, url)
+        attempt = 0
+        while True:
+            # fail fast if github has been failing us on this endpoint
+            self.breaker.before(endpoint)
+
+            try:
+                resp = self._send(method, url, priority, **kwargs)
+            except requests.RequestException as e:
+                self.breaker.failure(endpoint)
+                if not self.retry_policy.should_retry(attempt, idempotent, error=e):
+                    raise
+                resp, error = None, e
+            else:
+                error = None
+                degraded = (resp.status_code in retry.TRANSIENT_STATUSES or
+                            retry.is_abuse_response(resp))
+                if degraded:
+                    self.breaker.failure(endpoint)
+                else:
+                    self.breaker.success(endpoint)
+
+                if not (degraded and self.retry_policy.should_retry(
+                        attempt, idempotent, resp=resp)):
+                    break
+
+            wait = self.retry_policy.backoff(attempt, resp)
+            log.warning("%s to %r failed (%s), retrying in %0.1fs",
+                        method.upper(), path, error or resp.status_code, wait)
+            time.sleep(wait)
+            attempt += 1
 
         h = resp.headers
 
-        # keep our rate limit details up-to-date
-        try:
-            self._remaining = int(h["X-RateLimit-Remaining"])
-            self._reset = int(h["X-RateLimit-Reset"])
-        # on error, we won't receive these headers
-        except KeyError:
-            pass
+        if resp.status_code == 304:
+            log.debug("%r not modified, using cached response", path)
+            self.limiter.refund()
+            self.conditional_cache.not_modified_hit()
+            return cached
 
         resp.raise_for_status()
 
@@ -87,4 +192,67 @@ class API(object):
         except:
             data = None
 
-        return data
+        if project is not None and data is not None:
+            if isinstance(data, list):
+                data = [project(item) for item in data]
+            else:
+                data = project(data)
+
+        links = parse_links(h.get("Link"))
+
+        if cache_key is not None:
+            self.conditional_cache.store(cache_key, h, (data, links))
+
+        return data, links
+
+    def _send(self, method, url, priority, **kwargs):
+        """ a single attempt at a request.  waits for the rate limiter, and
+        records the request and its rate limit headers """
+        # wait for our turn, so we don't exhaust our api requests in the middle
+        # of doing something important.  cosmetic requests may get shed here
+        # instead, in which case this raises RequestShed
+        cooldown = self.limiter.acquire(priority)
+
+        log.info("requesting %s to %r", method.upper(), url)
+        started = time.monotonic()
+        try:
+            resp = self._session.request(method, url, **kwargs)
+        except requests.RequestException:
+            self.instrumentation.record(method, url, "error",
+                                        time.monotonic() - started, 0, cooldown)
+            raise
+        with self._num_requests_lock:
+            self._num_requests += 1
+        self.instrumentation.record(method, url, resp.status_code,
+                                    time.monotonic() - started, len(resp.content),
+                                    cooldown)
+
+        h = resp.headers
+
+        # keep our rate limit details up-to-date
+        try:
+            remaining = int(h["X-RateLimit-Remaining"])
+            reset = int(h["X-RateLimit-Reset"])
+            self.limiter.update(remaining, reset)
+            self.instrumentation.record_rate_limit(remaining, reset)
+        # on error, we won't receive these headers
+        except KeyError:
+            pass
+
+        return resp
+
+
+def projection_name(project):
+    if project is None:
+        return None
+    return getattr(project, "__qualname__", repr(project))
+
+
+def parse_links(header):
+    """ turns a Link header into a mapping of rel => url """
+    links = {}
+    if header:
+        for link in parse_header_links(header):
+            if "rel" in link:
+                links[link["rel"]] = link["url"]
+    return links
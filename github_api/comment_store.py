@@ -0,0 +1,122 @@
+import time
+import threading
+from collections import OrderedDict
+
+from . import records
+
+
+class _Scope(object):
+    """ the comments of one pr, or of a whole repo """
+    __slots__ = ("comments", "high_water", "synced")
+
+    def __init__(self, synced):
+        # comment id => Comment
+        self.comments = {}
+        # the latest updated_at of our comments
+        self.high_water = None
+        # when we last fetched all of them
+        self.synced = synced
+
+
+class CommentStore(object):
+    """ keeps the comments we've fetched, per scope (a pr, or a whole repo),
+    with the latest updated_at we've seen in it.  after the first fetch, we
+    only ask github for the comments updated since then, and merge them into
+    the ones we have.  github doesn't tell us about deleted comments that way,
+    so every `full_sync_interval` seconds a scope is fetched in full again.
+    we keep the `max_scopes` most recently used scopes.  it's safe to share
+    between threads """
+
+    def __init__(self, max_scopes, full_sync_interval, get_now=time.time):
+        self._max_scopes = max_scopes
+        self._full_sync_interval = full_sync_interval
+        self._get_now = get_now
+        self._scopes = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.full_syncs = 0
+        self.incremental_syncs = 0
+        self.fetched = 0
+
+    def fetch(self, api, path, scope, params=None, max_pages=None, full=False):
+        """ returns all of a scope's comments, oldest first, fetching only what
+        changed from `path`, unless `full` is given.  a fetch capped by
+        `max_pages` may not see every change, so those skip the store """
+        if max_pages is not None:
+            comments = api.paginate(path, params=params, max_pages=max_pages,
+                                    project=records.Comment.from_json)
+            return _ordered(comments)
+
+        now = self._get_now()
+        with self._lock:
+            state = self._scopes.get(scope)
+            full = (full or state is None or
+                    now - state.synced >= self._full_sync_interval)
+            since = None if full else state.high_water
+
+        params = dict(params or {})
+        if since is not None:
+            # github includes the comments updated at exactly `since`, so we
+            # don't miss ones that were updated in the same second
+            params["since"] = since
+        fetched = list(api.paginate(path, params=params,
+                                    project=records.Comment.from_json))
+
+        with self._lock:
+            self.fetched += len(fetched)
+            if full:
+                self.full_syncs += 1
+                state = _Scope(now)
+            else:
+                self.incremental_syncs += 1
+                state = self._scopes.get(scope)
+                # somebody else's fetch evicted it in the meantime
+                if state is None:
+                    return _ordered(fetched)
+
+            for comment in fetched:
+                state.comments[comment.id] = comment
+                if state.high_water is None or comment.updated_at > state.high_water:
+                    state.high_water = comment.updated_at
+
+            self._scopes[scope] = state
+            self._scopes.move_to_end(scope)
+            while len(self._scopes) > self._max_scopes:
+                self._scopes.popitem(last=False)
+
+            return _ordered(state.comments.values())
+
+    def __len__(self):
+        return len(self._scopes)
+
+    def dump(self):
+        """ all of our scopes, least recently used first """
+        with self._lock:
+            return [(scope, list(state.comments.values()), state.high_water,
+                     state.synced) for scope, state in self._scopes.items()]
+
+    def load(self, scopes):
+        """ adds scopes from dump(), as the most recently used ones """
+        with self._lock:
+            for scope, comments, high_water, synced in scopes:
+                state = _Scope(synced)
+                state.comments = {comment.id: comment for comment in comments}
+                state.high_water = high_water
+                self._scopes[scope] = state
+                self._scopes.move_to_end(scope)
+
+            while len(self._scopes) > self._max_scopes:
+                self._scopes.popitem(last=False)
+
+    def stats(self):
+        return {
+            "scopes": len(self._scopes),
+            "full_syncs": self.full_syncs,
+            "incremental_syncs": self.incremental_syncs,
+            "fetched": self.fetched,
+        }
+
+
+def _ordered(comments):
+    """ comments in the order github lists them by default """
+    return sorted(comments, key=lambda c: (c.created_at or "", c.id))
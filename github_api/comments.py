@@ -1,34 +1,32 @@
 import settings
 from . import prs
+from . import records
 
 
-def get_all_issue_comments(api, urn):
-    # Do all issue comments at once for API's sake..
+def get_all_issue_comments(api, urn, max_pages=None):
+    # Do all issue comments at once for API's sake..  we keep the ones we've
+    # seen, and only download the ones that changed since (see CommentStore)
     path = "/repos/{urn}/issues/comments".format(urn=urn)
-    # TODO - implement parameters
-    # sort - Either "created" or "updated". Defautl: "created
-    # direction - Either "asc" or "desc". Ignored without the sort parameter.
-    # since - Only comments updated at or after this time are returned.
-    # This is a timestamp in ISO 8601 format: YYYY-MM-DDTHH:MM:SSZ.
-    # Add get-reaction support for issue comments
+    # TODO - Add get-reaction support for issue comments
     params = {"per_page": settings.DEFAULT_PAGINATION}
-    comments = api("get", path, params=params)
+    comments = api.comment_store.fetch(api, path, ("repo", urn), params=params,
+                                       max_pages=max_pages)
     for comment in comments:
         # Return issue_id, global_comment_id, comment_text
         issue_comment = {}
-        # "https://github.com/octocat/Hello-World/issues/1347#issuecomment-1"
-        issue_comment["issue_id"] = comment["html_url"].split("/")[-1].split("#")[0]
+        issue_comment["issue_id"] = str(comment.issue_number)
         # I believe this is the right one... Could also be issue specific comment id
-        issue_comment["global_comment_id"] = comment["id"]
-        issue_comment["comment_text"] = comment["body"]
+        issue_comment["global_comment_id"] = comment.id
+        issue_comment["comment_text"] = comment.body
         yield issue_comment
 
 
-def get_reactions_for_comment(api, urn, comment_id):
+def get_reactions_for_comment(api, urn, comment_id, max_pages=None):
     path = "/repos/{urn}/issues/comments/{comment}/reactions"\
         .format(urn=urn, comment=comment_id)
     params = {"per_page": settings.DEFAULT_PAGINATION}
-    reactions = api("get", path, params=params)
+    reactions = api.paginate(path, params=params, max_pages=max_pages,
+                             project=records.Reaction.from_json)
     for reaction in reactions:
         yield reaction
 
@@ -0,0 +1,97 @@
+import threading
+from collections import OrderedDict
+
+
+class ConditionalCache(object):
+    """ remembers the validators (ETag and Last-Modified) and decoded body of
+    GET responses, so that we can make conditional requests.  github answers
+    those with a 304 when nothing has changed, and 304s don't count against our
+    rate limit.  the cache is bounded, and evicts the least recently used
+    entry when it's full.  it's safe to share between threads """
+
+    def __init__(self, max_size):
+        self._max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(url, params, variant=None):
+        """ the same url with different query params is a different resource.
+        `variant` tells apart different representations of the same one """
+        params = tuple(sorted((params or {}).items()))
+        return (url, params, variant)
+
+    def lookup(self, key):
+        """ returns the conditional headers we should send for a key, and the
+        body to use if github tells us it was not modified.  if we've never
+        seen the key, the headers are empty """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return {}, None
+
+            self.hits += 1
+            self._entries.move_to_end(key)
+
+        etag, last_modified, data = entry
+        headers = {}
+        if etag:
+            headers["If-None-Match"] = etag
+        if last_modified:
+            headers["If-Modified-Since"] = last_modified
+        return headers, data
+
+    def not_modified_hit(self):
+        """ call this when github says a resource was not modified """
+        with self._lock:
+            self.not_modified += 1
+
+    def store(self, key, headers, data):
+        """ stores a response, but only if it came with a validator, otherwise
+        we'd never be able to make a conditional request with it """
+        etag = headers.get("ETag")
+        last_modified = headers.get("Last-Modified")
+        with self._lock:
+            if not etag and not last_modified:
+                self._entries.pop(key, None)
+                return
+
+            self._entries[key] = (etag, last_modified, data)
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self._max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def __len__(self):
+        return len(self._entries)
+
+    def dump(self):
+        """ all of our entries, least recently used first """
+        with self._lock:
+            return list(self._entries.items())
+
+    def load(self, entries):
+        """ adds entries from dump(), as the most recently used ones """
+        with self._lock:
+            for key, entry in entries:
+                self._entries[key] = entry
+                self._entries.move_to_end(key)
+
+            while len(self._entries) > self._max_size:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "not_modified": self.not_modified,
+            "evictions": self.evictions,
+        }
@@ -1,2 +1,18 @@
 class CouldntMerge(Exception):
     pass
+
+
+class RequestShed(Exception):
+    """ raised when a low priority request was dropped to save our api budget
+    for more important ones """
+    pass
+
+
+class GraphQLError(Exception):
+    pass
+
+
+class CircuitOpen(Exception):
+    """ raised instead of making a request to an endpoint that has been failing
+    consistently """
+    pass
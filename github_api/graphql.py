@@ -0,0 +1,185 @@
+"""
+An optional graphql-backed fetcher for everything a poll cycle needs to know
+about the open prs.  With the rest api that's a handful of requests per pr, plus
+one per voter.  Here it's one query per batch of prs.  Everything is normalized
+into the same records that the rest api calls return, so the voting code
+doesn't need to know where its data came from.
+"""
+
+import settings
+from . import prs
+from . import records
+
+OPEN_PRS_QUERY = """
+query($owner: String!, $name: String!, $first: Int!, $nested: Int!, $after: String) {
+  repository(owner: $owner, name: $name) {
+    pullRequests(states: OPEN, first: $first, after: $after,
+                 orderBy: {field: UPDATED_AT, direction: ASC}) {
+      pageInfo { hasNextPage endCursor }
+      nodes {
+        number
+        title
+        body
+        createdAt
+        mergeable
+        headRefOid
+        headRepository { pushedAt }
+        author { login ...UserCreated }
+        comments(first: $nested) {
+          pageInfo { hasNextPage }
+          nodes {
+            databaseId body createdAt updatedAt
+            author { login ...UserCreated }
+          }
+        }
+        reactions(first: $nested) {
+          pageInfo { hasNextPage }
+          nodes {
+            databaseId content createdAt
+            user { login createdAt }
+          }
+        }
+        reviews(first: $nested) {
+          pageInfo { hasNextPage }
+          nodes {
+            databaseId state submittedAt
+            author { login ...UserCreated }
+          }
+        }
+      }
+    }
+  }
+}
+
+fragment UserCreated on User { createdAt }
+"""
+
+# graphql's reaction enum => the names the rest api uses
+REACTION_CONTENT = {
+    "THUMBS_UP": "+1",
+    "THUMBS_DOWN": "-1",
+    "LAUGH": "laugh",
+    "HOORAY": "hooray",
+    "CONFUSED": "confused",
+    "HEART": "heart",
+    "ROCKET": "rocket",
+    "EYES": "eyes",
+}
+
+MERGEABLE = {
+    "MERGEABLE": True,
+    "CONFLICTING": False,
+    "UNKNOWN": None,
+}
+
+
+def get_open_prs_snapshot(api, urn):
+    """ returns a list of snapshots, one for every open pr, and a mapping of
+    username => user for every author we saw along the way.  a snapshot is a
+    dict with the "pr", and its "comments", "reactions" and "reviews" """
+    owner, name = urn.split("/")
+    variables = {
+        "owner": owner,
+        "name": name,
+        "first": settings.GRAPHQL_PR_BATCH,
+        "nested": settings.DEFAULT_PAGINATION,
+        "after": None,
+    }
+
+    snapshots = []
+    known_users = {}
+    while True:
+        data = api.graphql(OPEN_PRS_QUERY, variables)
+        pulls = data["repository"]["pullRequests"]
+
+        for node in pulls["nodes"]:
+            snapshots.append(normalize_pr(api, urn, node, known_users))
+
+        if not pulls["pageInfo"]["hasNextPage"]:
+            break
+        variables["after"] = pulls["pageInfo"]["endCursor"]
+
+    return snapshots, known_users
+
+
+def normalize_pr(api, urn, node, known_users):
+    """ turns a pull request node into a snapshot.  any nested list that didn't
+    fit into the query gets fetched in full from the rest api instead """
+    head_repo = node["headRepository"]
+    pr = records.PullRequest(
+        number=node["number"],
+        title=node["title"],
+        body=node["body"],
+        author=normalize_actor(node["author"], known_users),
+        head_sha=node["headRefOid"],
+        pushed_at=head_repo["pushedAt"] if head_repo else None,
+        mergeable=MERGEABLE.get(node["mergeable"]),
+        created_at=node["createdAt"],
+        state="open",
+    )
+    pr_num = pr.number
+
+    if node["comments"]["pageInfo"]["hasNextPage"]:
+        pr_comments = list(prs.get_pr_comments(api, urn, pr_num))
+    else:
+        pr_comments = [normalize_comment(c, known_users)
+                       for c in node["comments"]["nodes"]]
+
+    if node["reactions"]["pageInfo"]["hasNextPage"]:
+        pr_reactions = list(prs.get_reactions_for_pr(api, urn, pr_num))
+    else:
+        pr_reactions = [normalize_reaction(r, known_users)
+                        for r in node["reactions"]["nodes"]]
+
+    if node["reviews"]["pageInfo"]["hasNextPage"]:
+        pr_reviews = list(prs.get_pr_reviews(api, urn, pr_num))
+    else:
+        pr_reviews = [normalize_review(r, known_users)
+                      for r in node["reviews"]["nodes"]]
+
+    return {
+        "pr": pr,
+        "comments": pr_comments,
+        "reactions": pr_reactions,
+        "reviews": pr_reviews,
+    }
+
+
+def normalize_actor(actor, known_users):
+    """ returns the actor's login, and remembers the user's creation date if
+    the actor is a user """
+    if actor is None:
+        return records.GHOST
+
+    login = actor["login"]
+    if actor.get("createdAt"):
+        known_users[login] = records.User(login=login, created_at=actor["createdAt"])
+    return login
+
+
+def normalize_comment(node, known_users):
+    return records.Comment(
+        id=node["databaseId"],
+        author=normalize_actor(node["author"], known_users),
+        body=node["body"],
+        created_at=node["createdAt"],
+        updated_at=node["updatedAt"],
+    )
+
+
+def normalize_reaction(node, known_users):
+    return records.Reaction(
+        id=node["databaseId"],
+        author=normalize_actor(node["user"], known_users),
+        content=REACTION_CONTENT.get(node["content"], node["content"].lower()),
+        created_at=node["createdAt"],
+    )
+
+
+def normalize_review(node, known_users):
+    return records.Review(
+        id=node["databaseId"],
+        author=normalize_actor(node["author"], known_users),
+        state=node["state"],
+        submitted_at=node["submittedAt"],
+    )
@@ -0,0 +1,42 @@
+"""
+Lets the rest of the bot know when we've changed something on github, so that
+whatever it has cached about it can be thrown away.  Mutations name what they
+changed with tags, and listeners get called with those tags.  The api layer
+doesn't know who's listening, which keeps caching out of it.
+"""
+
+import threading
+
+_listeners = []
+_lock = threading.Lock()
+
+
+def pr_tag(urn, pr_num):
+    """ the tag of a single pr (or issue, they share their numbers) """
+    return "pr:{urn}#{pr}".format(urn=urn, pr=pr_num)
+
+
+def labels_tag(urn, pr_num):
+    """ the tag of a pr's labels.  they don't change anything else about the
+    pr, like whether it's mergeable, so they have a tag of their own """
+    return "labels:{urn}#{pr}".format(urn=urn, pr=pr_num)
+
+
+def repo_tag(urn):
+    """ the tag of the repo as a whole, like its master branch """
+    return "repo:{urn}".format(urn=urn)
+
+
+def on_mutation(listener):
+    """ registers a listener, which is called with the tags of everything we
+    change from now on """
+    with _lock:
+        _listeners.append(listener)
+
+
+def mutated(*tags):
+    """ call after changing something on github """
+    with _lock:
+        listeners = list(_listeners)
+    for listener in listeners:
+        listener(*tags)
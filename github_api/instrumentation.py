@@ -0,0 +1,129 @@
+import re
+import json
+import time
+import bisect
+import threading
+from collections import Counter, deque
+from urllib.parse import urlparse
+
+import settings
+
+# turns concrete api paths into templated endpoints, so that all the requests
+# for, say, different prs' reviews get counted together.  order matters
+ENDPOINT_TEMPLATES = (
+    (re.compile(r"^/repos/[^/]+/[^/]+"), "/repos/{urn}"),
+    (re.compile(r"/pulls/\d+"), "/pulls/{pr}"),
+    (re.compile(r"/issues/comments/\d+"), "/issues/comments/{comment}"),
+    (re.compile(r"/issues/\d+"), "/issues/{issue}"),
+    (re.compile(r"/statuses/[^/]+"), "/statuses/{sha}"),
+    (re.compile(r"^/users/[^/]+"), "/users/{user}"),
+    (re.compile(r"^/user/following/[^/]+"), "/user/following/{user}"),
+)
+
+# the upper bounds, in seconds, of our latency histogram buckets.  anything
+# slower goes into a final overflow bucket
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def template_endpoint(method, path):
+    """ returns the templated endpoint for a request, like
+    "GET /repos/{urn}/pulls/{pr}/reviews" """
+    path = urlparse(path).path
+    # it's templated already
+    if "{" not in path:
+        for pattern, template in ENDPOINT_TEMPLATES:
+            path = pattern.sub(template, path)
+    return "{} {}".format(method.upper(), path)
+
+
+class EndpointStats(object):
+    def __init__(self):
+        self.requests = 0
+        self.statuses = Counter()
+        self.latency_buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+        self.bytes_received = 0
+        self.cooldown = 0.0
+
+    def record(self, status, latency, nbytes, cooldown):
+        self.requests += 1
+        self.statuses[str(status)] += 1
+        self.latency_buckets[bisect.bisect_left(LATENCY_BUCKETS, latency)] += 1
+        self.latency_total += latency
+        self.latency_max = max(self.latency_max, latency)
+        self.bytes_received += nbytes
+        self.cooldown += cooldown
+
+    def as_dict(self):
+        bounds = [str(b) for b in LATENCY_BUCKETS] + ["+Inf"]
+        return {
+            "requests": self.requests,
+            "statuses": dict(self.statuses),
+            "latency": {
+                "histogram": dict(zip(bounds, self.latency_buckets)),
+                "mean": self.latency_total / max(self.requests, 1),
+                "max": self.latency_max,
+            },
+            "bytes_received": self.bytes_received,
+            "cooldown_seconds": self.cooldown,
+        }
+
+
+class Instrumentation(object):
+    """ keeps per-endpoint request statistics for an api object, plus a
+    history of our rate limit headroom, so we can see where a poll cycle's time
+    and api budget goes """
+
+    def __init__(self, headroom_samples=settings.API_STATS_HEADROOM_SAMPLES):
+        self._lock = threading.Lock()
+        self._endpoints = {}
+        self._headroom = deque(maxlen=headroom_samples)
+        self.started = time.time()
+
+    def record(self, method, path, status, latency, nbytes, cooldown):
+        endpoint = template_endpoint(method, path)
+        with self._lock:
+            stats = self._endpoints.get(endpoint)
+            if stats is None:
+                stats = self._endpoints[endpoint] = EndpointStats()
+            stats.record(status, latency, nbytes, cooldown)
+
+    def record_rate_limit(self, remaining, reset):
+        with self._lock:
+            self._headroom.append((time.time(), remaining, reset))
+
+    def endpoint(self, method, path):
+        """ returns the stats for one endpoint, as a dict.  the path can be
+        concrete or already templated """
+        endpoint = template_endpoint(method, path)
+        with self._lock:
+            stats = self._endpoints.get(endpoint, EndpointStats())
+            return stats.as_dict()
+
+    def as_dict(self):
+        with self._lock:
+            endpoints = {name: stats.as_dict()
+                         for name, stats in self._endpoints.items()}
+            headroom = [{"time": t, "remaining": remaining, "reset": reset}
+                        for t, remaining, reset in self._headroom]
+
+        return {
+            "started": self.started,
+            "endpoints": endpoints,
+            "rate_limit": headroom,
+        }
+
+    def top(self, n=10, by="requests"):
+        """ the n endpoints that are the most expensive, by requests made,
+        bytes_received or cooldown_seconds """
+        endpoints = self.as_dict()["endpoints"]
+        ranked = sorted(endpoints.items(), key=lambda e: e[1][by], reverse=True)
+        return ranked[:n]
+
+    def to_json(self, **kwargs):
+        return json.dumps(self.as_dict(), **kwargs)
+
+    def dump(self, fpath):
+        with open(fpath, "w") as h:
+            h.write(self.to_json(indent=2, sort_keys=True))
@@ -1,25 +1,31 @@
 import arrow
 import math
 
+from . import hooks
+from . import ratelimit
+from . import records
+
 
 def close_issue(api, urn, issue_id):
     path = "/repos/{urn}/issues/{issue}".format(urn=urn, issue=issue_id)
     data = {"state": "closed"}
-    resp = api("PATCH", path, json=data)
+    resp = api("PATCH", path, json=data, priority=ratelimit.CRITICAL)
+    hooks.mutated(hooks.pr_tag(urn, issue_id))
     return resp
 
 
 def open_issue(api, urn, issue_id):
     path = "/repos/{urn}/issues/{issue}".format(urn=urn, issue=issue_id)
     data = {"state": "open"}
-    resp = api("PATCH", path, json=data)
+    resp = api("PATCH", path, json=data, priority=ratelimit.CRITICAL)
+    hooks.mutated(hooks.pr_tag(urn, issue_id))
     return resp
 
 
 def get_issue_comment_last_updated(api, urn, comment):
     path = "/repos/{urn}/issues/comments/{comment}".format(urn=urn, comment=comment)
-    comment = api("get", path)
-    updated = arrow.get(comment["updated_at"])
+    comment = api("get", path, project=records.Comment.from_json)
+    updated = arrow.get(comment.updated_at)
     return updated
 
 
@@ -1,12 +1,17 @@
 import math
 
 import arrow
-from requests import HTTPError
+import requests
+from requests import HTTPError, RequestException
 
 import settings
 from . import comments
 from . import exceptions as exc
+from . import hooks
 from . import misc
+from . import ratelimit
+from . import records
+from . import retry
 from . import voting
 
 TRAVIS_CI_CONTEXT = "continuous-integration/travis-ci"
@@ -16,9 +21,9 @@ def merge_pr(api, urn, pr, votes, total, threshold):
     """ merge a pull request, if possible, and use a nice detailed merge commit
     message """
 
-    pr_num = pr["number"]
-    pr_title = pr['title']
-    pr_description = pr['body']
+    pr_num = pr.number
+    pr_title = pr.title
+    pr_description = pr.body
 
     path = "/repos/{urn}/pulls/{pr}/merge".format(urn=urn, pr=pr_num)
 
@@ -55,7 +60,7 @@ Description:
 
         # if some clever person attempts to submit more commits while we're
         # aggregating votes, this sha check will fail and no merge will occur
-        "sha": pr["head"]["sha"],
+        "sha": pr.head_sha,
 
         # default is "merge"
         # i think we want to do a squash so its easier to auto-revert entire
@@ -65,8 +70,11 @@ Description:
         "merge_method": "squash",
     }
     try:
-        resp = api("PUT", path, json=data)
-        return resp["sha"]
+        # github sometimes answers a merge that went through with a 5xx, and
+        # retrying it would then get us a 405, so merges are never retried
+        resp = api("PUT", path, json=data, priority=ratelimit.CRITICAL,
+                   idempotent=False)
+        sha = resp["sha"]
     except HTTPError as e:
         resp = e.response
         # could not be merged
@@ -75,8 +83,38 @@ Description:
         # someone trying to be sneaky and change their PR commits during voting
         elif resp.status_code == 409:
             raise exc.CouldntMerge
+        # instead, we ask github whether it happened
+        elif resp.status_code in retry.TRANSIENT_STATUSES and is_merged(api, urn, pr_num):
+            sha = get_merge_sha(api, urn, pr_num)
         else:
             raise
+    # the same goes for a connection that died after our merge went out.  if
+    # we couldn't even connect, it never did
+    except (requests.ConnectionError, requests.Timeout) as e:
+        if isinstance(e, requests.ConnectTimeout) or not is_merged(api, urn, pr_num):
+            raise
+        sha = get_merge_sha(api, urn, pr_num)
+
+    # master moved, so every other pr's mergeability may have changed too
+    hooks.mutated(hooks.pr_tag(urn, pr_num), hooks.repo_tag(urn))
+    return sha
+
+
+def is_merged(api, urn, pr_num):
+    """ github answers 204 if a pr has been merged, and 404 if not """
+    path = "/repos/{urn}/pulls/{pr}/merge".format(urn=urn, pr=pr_num)
+    try:
+        api("get", path, priority=ratelimit.CRITICAL)
+    except HTTPError as e:
+        if e.response.status_code == 404:
+            return False
+        raise
+    return True
+
+
+def get_merge_sha(api, urn, pr_num):
+    path = "/repos/{urn}/pulls/{pr}".format(urn=urn, pr=pr_num)
+    return api("get", path, priority=ratelimit.CRITICAL)["merge_commit_sha"]
 
 
 def formatted_votes_summary(votes, total, threshold):
@@ -102,36 +140,47 @@ def label_pr(api, urn, pr_num, labels):
         labels = [labels]
     path = "/repos/{urn}/issues/{pr}/labels".format(urn=urn, pr=pr_num)
     data = labels
-    return api("PUT", path, json=data)
+    try:
+        resp = api("PUT", path, json=data, priority=ratelimit.COSMETIC)
+        hooks.mutated(hooks.labels_tag(urn, pr_num))
+        return resp
+    # labels are nice to have, but not worth spending our last requests on
+    except exc.RequestShed:
+        return None
 
 
 def close_pr(api, urn, pr):
     """ https://developer.github.com/v3/pulls/#update-a-pull-request """
-    path = "/repos/{urn}/pulls/{pr}".format(urn=urn, pr=pr["number"])
+    path = "/repos/{urn}/pulls/{pr}".format(urn=urn, pr=pr.number)
     data = {
         "state": "closed",
     }
-    return api("patch", path, json=data)
+    resp = api("patch", path, json=data, priority=ratelimit.CRITICAL)
+    hooks.mutated(hooks.pr_tag(urn, pr.number))
+    return resp
 
 
 def get_pr_last_updated(pr_data):
     """ a helper for finding the utc datetime of the last pr branch
     modifications """
-    repo = pr_data["head"]["repo"]
-    if repo:
-        return arrow.get(repo["pushed_at"])
+    # there's no push date if the repo backing the pr has been deleted
+    if pr_data.pushed_at:
+        return arrow.get(pr_data.pushed_at)
     else:
         return None
 
 
-def get_pr_comments(api, urn, pr_num):
+def get_pr_comments(api, urn, pr_num, max_pages=None, full=False):
     """ yield all comments on a pr, weirdly excluding the initial pr comment
-    itself (the one the owner makes) """
+    itself (the one the owner makes).  only the ones that changed since the
+    last time are downloaded, unless we want them all, `full` """
     params = {
         "per_page": settings.DEFAULT_PAGINATION
     }
     path = "/repos/{urn}/issues/{pr}/comments".format(urn=urn, pr=pr_num)
-    comments = api("get", path, params=params)
+    comments = api.comment_store.fetch(api, path, ("pr", urn, pr_num),
+                                       params=params, max_pages=max_pages,
+                                       full=full)
     for comment in comments:
         yield comment
 
@@ -141,7 +190,7 @@ def has_build_passed(api, statuses_url):
         Check if a Pull request has passed Travis CI builds
     :param api: github api instance
     :param statuses_url: full url to the github commit status.
-           Given in pr["statuses_url"]
+           Given in pr.statuses_url
     :return: true if the commit passed travis build, false if failed or still pending
     """
     statuses_path = statuses_url.replace(api.BASE_URL, "")
@@ -159,38 +208,69 @@ def has_build_passed(api, statuses_url):
     return False
 
 
-def get_ready_prs(api, urn, window):
+def get_ready_prs(api, urn, window, pool=None, open_prs=None):
     """ yield mergeable, travis-ci passed, non-WIP prs that have had no modifications for longer
     than the voting window.  these are prs that are ready to be considered for
-    merging """
-    open_prs = get_open_prs(api, urn)
+    merging.  if a `pool` executor is given, the mergeability of the candidate
+    prs is looked up concurrently.  `open_prs` can be given if we've already
+    fetched them some other way """
+    if open_prs is None:
+        open_prs = get_open_prs(api, urn)
+    candidates = []
+
+    # we're walking a paginated list sorted by last update, and it can shift
+    # under us while we do, so a pr can show up twice
+    seen = set()
     for pr in open_prs:
-        pr_num = pr["number"]
+        pr_num = pr.number
+        if pr_num in seen:
+            continue
+        seen.add(pr_num)
 
         now = arrow.utcnow()
         updated = get_pr_last_updated(pr)
         if updated is None:
-            comments.leave_deleted_comment(api, urn, pr["number"])
+            comments.leave_deleted_comment(api, urn, pr.number)
             close_pr(api, urn, pr)
             continue
 
         delta = (now - updated).total_seconds()
-        is_wip = "WIP" in pr["title"]
+        is_wip = "WIP" in pr.title
 
         # this is unused right now.  there are issues with travis status not
         # existing on the PRs anymore (somehow..still unsolved), and then PRs
         # were not being processed or updated.  do not use this variable in the
         # if-condition that follow it until that has been solved
-        # build_passed = has_build_passed(api, pr["statuses_url"])
+        # build_passed = has_build_passed(api, pr.statuses_url)
 
         if is_wip or delta < window:
             continue
 
-        # we check if its mergeable if its outside the voting window,
-        # because there seems to be a race where a freshly-created PR exists
-        # in the paginated list of PRs, but 404s when trying to fetch it directly
-        # mergeable can also be None, in which case we just skip it for now
-        mergeable = get_is_mergeable(api, urn, pr_num)
+        candidates.append((pr, delta))
+
+    # we check if its mergeable if its outside the voting window,
+    # because there seems to be a race where a freshly-created PR exists
+    # in the paginated list of PRs, but 404s when trying to fetch it directly
+    # mergeable can also be None, in which case we just skip it for now
+    def fetch_mergeable(candidate):
+        pr = candidate[0]
+        # prs from a graphql snapshot already know if they're mergeable
+        if pr.mergeable is not None:
+            return pr.mergeable
+        # if github is flaky, treat it like an unknown mergeability and
+        # try again on the next poll
+        try:
+            return get_is_mergeable(api, urn, pr.number)
+        except (RequestException, exc.CircuitOpen):
+            return None
+
+    if pool is None:
+        mergeables = map(fetch_mergeable, candidates)
+    else:
+        mergeables = pool.map(fetch_mergeable, candidates)
+
+    for (pr, delta), mergeable in zip(candidates, mergeables):
+        pr_num = pr.number
 
         if mergeable is True:
             label_pr(api, urn, pr_num, [])
@@ -199,7 +279,7 @@ def get_ready_prs(api, urn, window):
             label_pr(api, urn, pr_num, ["conflicts"])
             if delta >= 60 * 60 * settings.PR_STALE_HOURS:
                 comments.leave_stale_comment(
-                    api, urn, pr["number"], round(delta / 60 / 60))
+                    api, urn, pr.number, round(delta / 60 / 60))
                 close_pr(api, urn, pr)
 
 
@@ -216,19 +296,19 @@ def is_pr_in_voting_window(pr, window):
     return voting_window_remaining_seconds(pr, window) <= 0
 
 
-def get_pr_reviews(api, urn, pr_num):
-    """ get all pr reviews on a pr
+def get_pr_reviews(api, urn, pr_num, max_pages=None):
+    """ yield all pr reviews on a pr
     https://help.github.com/articles/about-pull-request-reviews/ """
     params = {
         "per_page": settings.DEFAULT_PAGINATION
     }
     path = "/repos/{urn}/pulls/{pr}/reviews".format(urn=urn, pr=pr_num)
-    data = api("get", path, params=params)
-    return data
+    return api.paginate(path, params=params, max_pages=max_pages,
+                        project=records.Review.from_json)
 
 
 def get_is_mergeable(api, urn, pr_num):
-    return get_pr(api, urn, pr_num)["mergeable"]
+    return get_pr(api, urn, pr_num).mergeable
 
 
 def get_pr(api, urn, pr_num):
@@ -236,11 +316,12 @@ def get_pr(api, urn, pr_num):
     not exist on prs that come back from paginated endpoints, so we must fetch
     the pr directly """
     path = "/repos/{urn}/pulls/{pr}".format(urn=urn, pr=pr_num)
-    pr = api("get", path)
+    pr = api("get", path, project=records.PullRequest.from_json)
     return pr
 
 
-def get_open_prs(api, urn):
+def get_open_prs(api, urn, max_pages=None):
+    """ yield all open prs, least recently updated first """
     params = {
         "state": "open",
         "sort": "updated",
@@ -248,20 +329,21 @@ def get_open_prs(api, urn):
         "per_page": settings.DEFAULT_PAGINATION,
     }
     path = "/repos/{urn}/pulls".format(urn=urn)
-    data = api("get", path, params=params)
-    return data
+    return api.paginate(path, params=params, max_pages=max_pages,
+                        project=records.PullRequest.from_json)
 
 
-def get_reactions_for_pr(api, urn, pr):
+def get_reactions_for_pr(api, urn, pr, max_pages=None):
     path = "/repos/{urn}/issues/{pr}/reactions".format(urn=urn, pr=pr)
     params = {"per_page": settings.DEFAULT_PAGINATION}
-    reactions = api("get", path, params=params)
+    reactions = api.paginate(path, params=params, max_pages=max_pages,
+                             project=records.Reaction.from_json)
     for reaction in reactions:
         yield reaction
 
 
 def post_accepted_status(api, urn, pr, voting_window, votes, total, threshold):
-    sha = pr["head"]["sha"]
+    sha = pr.head_sha
 
     remaining_seconds = voting_window_remaining_seconds(pr, voting_window)
     remaining_human = misc.seconds_to_human(remaining_seconds)
@@ -272,7 +354,7 @@ def post_accepted_status(api, urn, pr, voting_window, votes, total, threshold):
 
 
 def post_rejected_status(api, urn, pr, voting_window, votes, total, threshold):
-    sha = pr["head"]["sha"]
+    sha = pr.head_sha
 
     remaining_seconds = voting_window_remaining_seconds(pr, voting_window)
     remaining_human = misc.seconds_to_human(remaining_seconds)
@@ -283,7 +365,7 @@ def post_rejected_status(api, urn, pr, voting_window, votes, total, threshold):
 
 
 def post_pending_status(api, urn, pr, voting_window, votes, total, threshold):
-    sha = pr["head"]["sha"]
+    sha = pr.head_sha
 
     remaining_seconds = voting_window_remaining_seconds(pr, voting_window)
     remaining_human = misc.seconds_to_human(remaining_seconds)
@@ -301,4 +383,8 @@ def post_status(api, urn, sha, state, description):
         "description": description,
         "context": "chaosbot"
     }
-    api("POST", path, json=data)
+    try:
+        api("POST", path, json=data, priority=ratelimit.COSMETIC)
+    # the status gets re-posted on the next poll anyways
+    except exc.RequestShed:
+        pass
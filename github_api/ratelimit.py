@@ -0,0 +1,193 @@
+import math
+import time
+import logging
+import threading
+from collections import deque
+
+import settings
+from . import exceptions as exc
+
+log = logging.getLogger("github_api")
+
+# request priority classes, most important first.  critical requests are the
+# ones that actually change the outcome of a vote (merging, closing), normal
+# requests are the reads we need to make those decisions (and anything else
+# that isn't marked), and cosmetic requests are the nice-to-haves, like status
+# descriptions and labels
+CRITICAL = 0
+NORMAL = 1
+COSMETIC = 2
+
+PRIORITY_NAMES = {
+    CRITICAL: "critical",
+    NORMAL: "normal",
+    COSMETIC: "cosmetic",
+}
+
+
+class RateLimiter(object):
+    """ a token bucket scheduler for our api budget.  github tells us how many
+    requests we have left and when that number gets reset.  we keep track of
+    how many requests we've made in the last `spend_window` seconds, and as
+    long as spending at that rate until the reset leaves the budget alone,
+    requests go out as fast as we make them.  once it doesn't, we spread the
+    remaining requests evenly over the time until the reset, allowing up to
+    `burst` requests back-to-back.
+
+    every priority class has a reserve: a part of the remaining budget it is
+    not allowed to touch.  so as the budget runs low, cosmetic requests get
+    shed first, then normal requests get deferred until the reset, and
+    critical requests go through for as long as github will accept them """
+
+    def __init__(self, burst=settings.API_BURST,
+                 normal_reserve=settings.API_NORMAL_RESERVE,
+                 cosmetic_reserve=settings.API_COSMETIC_RESERVE,
+                 spend_window=settings.API_SPEND_WINDOW_SECONDS,
+                 get_now=time.time, sleep=time.sleep):
+        self._burst = burst
+        self._spend_window = spend_window
+        self._reserves = {
+            CRITICAL: 0,
+            NORMAL: normal_reserve,
+            COSMETIC: cosmetic_reserve,
+        }
+        self._get_now = get_now
+        self._sleep = sleep
+        self._lock = threading.Lock()
+
+        self.remaining = math.inf
+        self.reset = 0
+
+        self._tokens = float(burst)
+        self._rate = math.inf
+        self._last_refill = get_now()
+        # when we made the requests of the last `spend_window` seconds
+        self._spent = deque()
+
+    def update(self, remaining, reset):
+        """ feed the limiter with the X-RateLimit-Remaining and
+        X-RateLimit-Reset values from a response """
+        with self._lock:
+            self.remaining = remaining
+            self.reset = reset
+            self._refill(self._get_now())
+
+    def state(self):
+        """ what we know about our budget, to carry it over a restart """
+        with self._lock:
+            return {
+                "remaining": self.remaining,
+                "reset": self.reset,
+                "tokens": self._tokens,
+                "spent": list(self._spent),
+                "saved": self._get_now(),
+            }
+
+    def restore(self, state):
+        """ picks up where a previous limiter's state() left off """
+        with self._lock:
+            self.remaining = state["remaining"]
+            self.reset = state["reset"]
+            self._tokens = min(state["tokens"], self._burst)
+            self._last_refill = state["saved"]
+            self._spent = deque(state.get("spent", ()))
+            self._refill(self._get_now())
+
+    def refund(self):
+        """ give back the token of a request that didn't cost us anything, like
+        a 304 Not Modified """
+        with self._lock:
+            self._tokens = min(self._tokens + 1, self._burst)
+            if self._spent:
+                self._spent.pop()
+
+    def _refill(self, now):
+        reset_in = max(self.reset - now, 0)
+        usable = self.remaining - self._reserves[NORMAL]
+
+        # our budget is about to be refreshed, or we don't know it yet, so
+        # there's no point in pacing ourselves
+        if reset_in == 0 or math.isinf(usable):
+            self._rate = math.inf
+            self._tokens = float(self._burst)
+        else:
+            self._rate = max(usable, 0) / reset_in
+            elapsed = now - self._last_refill
+            self._tokens = min(self._tokens + elapsed * self._rate, self._burst)
+
+        self._last_refill = now
+
+    def _at_risk(self, priority, now):
+        """ whether spending at our recent rate until the reset would dig into
+        the reserve of `priority` """
+        reset_in = max(self.reset - now, 0)
+        if reset_in == 0:
+            return False
+
+        while self._spent and self._spent[0] <= now - self._spend_window:
+            self._spent.popleft()
+        projected = len(self._spent) / self._spend_window * reset_in
+        return self.remaining - self._reserves[priority] < projected
+
+    def is_throttled(self):
+        """ whether normal requests would currently have to wait """
+        with self._lock:
+            now = self._get_now()
+            self._refill(now)
+            headroom = self.remaining - self._reserves[NORMAL]
+            if headroom <= 0 and self.reset > now:
+                return True
+            return self._tokens < 1 and self._at_risk(NORMAL, now)
+
+    def reserve(self, priority):
+        """ takes a token for a request of the given priority, and returns how
+        many seconds the caller must wait before making it.  raises
+        RequestShed if a cosmetic request would have to wait at all.  requests
+        only wait while our budget is at risk """
+        with self._lock:
+            now = self._get_now()
+            self._refill(now)
+
+            reset_in = max(self.reset - now, 0)
+            until_reset = reset_in + settings.API_COOLDOWN_RESET_PADDING
+            headroom = self.remaining - self._reserves[priority]
+
+            wait = 0
+            if headroom <= 0 and reset_in > 0:
+                if priority == COSMETIC:
+                    raise exc.RequestShed(PRIORITY_NAMES[priority])
+                # critical requests may use up every last request, but if
+                # there are none left, the request would fail anyways
+                if priority != CRITICAL or self.remaining <= 0:
+                    wait = until_reset
+
+            elif priority != CRITICAL and self._tokens < 1:
+                if self._at_risk(priority, now):
+                    if priority == COSMETIC:
+                        raise exc.RequestShed(PRIORITY_NAMES[priority])
+                    wait = min((1 - self._tokens) / self._rate, until_reset)
+
+            # an empty bucket only holds back the requests made while our
+            # budget is at risk, not the ones that didn't have to wait
+            if wait > 0:
+                self._tokens -= 1
+            else:
+                self._tokens = max(self._tokens - 1, 0)
+            self._spent.append(now)
+            return wait
+
+    def acquire(self, priority):
+        """ blocks until a request of the given priority may be made, and
+        returns the number of seconds we slept """
+        try:
+            wait = self.reserve(priority)
+        except exc.RequestShed:
+            log.info("api budget is low (%s remaining), shedding %s request",
+                     self.remaining, PRIORITY_NAMES[priority])
+            raise
+
+        log.debug("requests remaining: %s, priority: %s, cooldown sleep: %0.2fs",
+                  self.remaining, PRIORITY_NAMES[priority], wait)
+        if wait > 0:
+            self._sleep(wait)
+        return wait
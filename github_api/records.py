@@ -0,0 +1,137 @@
+"""
+Slim, fixed-shape records for the api payloads we keep around.  Github's json
+for a single pr is tens of KB, of which we read a dozen fields, so we project
+every payload down to one of these right after decoding it, and only ever hold
+on to the projection.  Pass a record's from_json as the `project` of an api
+call to get records back instead of dicts.
+"""
+
+# what github shows for actors whose accounts have been deleted
+GHOST = "ghost"
+
+
+def get_login(actor):
+    """ the login of a rest api user object, which can be missing for deleted
+    accounts """
+    if not actor:
+        return GHOST
+    return actor["login"]
+
+
+class Record(object):
+    """ the base for our records.  subclasses list their fields in __slots__,
+    and are built with keyword arguments for all of them """
+    __slots__ = ()
+
+    def __init__(self, **fields):
+        for name in self.__slots__:
+            setattr(self, name, fields.pop(name, None))
+        if fields:
+            raise TypeError("unknown fields for {}: {}".format(
+                type(self).__name__, ", ".join(sorted(fields))))
+
+    def as_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self.as_dict() == other.as_dict()
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        fields = ", ".join("{}={!r}".format(name, getattr(self, name))
+                           for name in self.__slots__)
+        return "{}({})".format(type(self).__name__, fields)
+
+
+class PullRequest(Record):
+    __slots__ = ("number", "title", "body", "author", "head_sha", "pushed_at",
+                 "mergeable", "created_at", "state", "statuses_url")
+
+    @classmethod
+    def from_json(cls, data):
+        head = data.get("head") or {}
+        # the head repo is null if the repo backing the pr has been deleted
+        repo = head.get("repo")
+        return cls(
+            number=data["number"],
+            title=data["title"],
+            body=data.get("body"),
+            author=get_login(data.get("user")),
+            head_sha=head.get("sha"),
+            pushed_at=repo.get("pushed_at") if repo else None,
+            # only prs fetched one at a time know if they're mergeable
+            mergeable=data.get("mergeable"),
+            created_at=data.get("created_at"),
+            state=data.get("state"),
+            statuses_url=data.get("statuses_url"),
+        )
+
+
+class Comment(Record):
+    __slots__ = ("id", "author", "body", "created_at", "updated_at",
+                 "issue_number")
+
+    @classmethod
+    def from_json(cls, data):
+        # "https://github.com/octocat/Hello-World/issues/1347#issuecomment-1"
+        issue_number = None
+        html_url = data.get("html_url")
+        if html_url:
+            issue_number = int(html_url.split("/")[-1].split("#")[0])
+
+        return cls(
+            id=data["id"],
+            author=get_login(data.get("user")),
+            body=data.get("body") or "",
+            created_at=data.get("created_at"),
+            updated_at=data.get("updated_at"),
+            issue_number=issue_number,
+        )
+
+
+class Reaction(Record):
+    __slots__ = ("id", "author", "content", "created_at")
+
+    @classmethod
+    def from_json(cls, data):
+        return cls(
+            id=data["id"],
+            author=get_login(data.get("user")),
+            content=data["content"],
+            created_at=data.get("created_at"),
+        )
+
+
+class Review(Record):
+    __slots__ = ("id", "author", "state", "submitted_at")
+
+    @classmethod
+    def from_json(cls, data):
+        return cls(
+            id=data["id"],
+            author=get_login(data.get("user")),
+            state=data["state"],
+            submitted_at=data.get("submitted_at"),
+        )
+
+
+class User(Record):
+    __slots__ = ("login", "created_at")
+
+    @classmethod
+    def from_json(cls, data):
+        return cls(login=data["login"], created_at=data.get("created_at"))
+
+
+class Repository(Record):
+    __slots__ = ("full_name", "subscribers_count", "created_at")
+
+    @classmethod
+    def from_json(cls, data):
+        return cls(
+            full_name=data.get("full_name"),
+            subscribers_count=data["subscribers_count"],
+            created_at=data["created_at"],
+        )
@@ -1,5 +1,8 @@
 import arrow
 import settings
+from . import exceptions as exc
+from . import ratelimit
+from . import records
 
 
 def get_path(urn):
@@ -9,10 +12,10 @@ def get_path(urn):
 
 def get_num_watchers(api, urn):
     """ returns the number of watchers for a repo """
-    data = api("get", get_path(urn))
+    data = api("get", get_path(urn), project=records.Repository.from_json)
     # this is the field for watchers.  do not be tricked by "watchers_count"
     # which always matches "stargazers_count"
-    return data["subscribers_count"]
+    return data.subscribers_count
 
 
 def set_desc(api, urn, desc):
@@ -23,10 +26,13 @@ def set_desc(api, urn, desc):
         "description": desc,
         "homepage": settings.HOMEPAGE,
     }
-    api("patch", path, json=data)
+    try:
+        api("patch", path, json=data, priority=ratelimit.COSMETIC)
+    except exc.RequestShed:
+        pass
 
 
 def get_creation_date(api, urn):
     """ returns the creation date of the repo """
-    data = api("get", get_path(urn))
-    return arrow.get(data["created_at"])
+    data = api("get", get_path(urn), project=records.Repository.from_json)
+    return arrow.get(data.created_at)
@@ -0,0 +1,127 @@
+import time
+import random
+import threading
+
+import requests
+
+import settings
+from . import exceptions as exc
+
+# methods that are safe to send twice.  our PATCHes only ever set a pr or issue
+# to a fixed state, so repeating them is harmless too.  merging a pr is a PUT
+# that isn't, so prs.merge_pr opts out
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "PATCH", "DELETE"}
+
+# github's way of saying "try again later"
+TRANSIENT_STATUSES = {500, 502, 503, 504}
+
+
+def is_abuse_response(resp):
+    """ secondary rate limits and abuse detection come back as a 403 (or a
+    429), usually with a Retry-After header.  github rejects these before doing
+    anything, so they're safe to retry for any method """
+    if resp.status_code not in (403, 429):
+        return False
+    if "Retry-After" in resp.headers:
+        return True
+    try:
+        message = resp.json().get("message", "").lower()
+    except Exception:
+        return False
+    return "secondary rate limit" in message or "abuse" in message
+
+
+class RetryPolicy(object):
+    """ decides which failed requests are worth retrying, and how long to wait
+    before doing so: exponential backoff with full jitter, but never sooner
+    than github's Retry-After """
+
+    def __init__(self, attempts=settings.API_RETRY_ATTEMPTS,
+                 base=settings.API_RETRY_BASE_SECONDS,
+                 cap=settings.API_RETRY_MAX_SECONDS, rand=random.random):
+        self.attempts = attempts
+        self._base = base
+        self._cap = cap
+        self._rand = rand
+
+    def should_retry(self, attempt, idempotent, resp=None, error=None):
+        """ `attempt` is the number of the attempt that just failed, starting
+        at 0.  pass either the response we got or the error we got instead """
+        if attempt + 1 >= self.attempts:
+            return False
+
+        if error is not None:
+            # if we couldn't even connect, github never saw the request
+            if isinstance(error, requests.ConnectTimeout):
+                return True
+            return idempotent and isinstance(error, (requests.ConnectionError,
+                                                     requests.Timeout))
+
+        if is_abuse_response(resp):
+            return True
+        return idempotent and resp.status_code in TRANSIENT_STATUSES
+
+    def backoff(self, attempt, resp=None):
+        """ how many seconds to sleep before the next attempt """
+        wait = self._rand() * min(self._cap, self._base * 2 ** attempt)
+
+        if resp is not None:
+            try:
+                wait = max(wait, float(resp.headers["Retry-After"]))
+            except (KeyError, ValueError):
+                pass
+        return wait
+
+
+class CircuitBreaker(object):
+    """ keeps track of consecutive failures per endpoint.  once an endpoint
+    has failed `threshold` times in a row, its circuit opens, and requests to it
+    fail fast with CircuitOpen instead of waiting on a degraded github.  after
+    `cooldown` seconds, a single trial request is let through.  if it succeeds
+    the circuit closes again, otherwise it stays open for another cooldown """
+
+    def __init__(self, threshold=settings.API_CIRCUIT_THRESHOLD,
+                 cooldown=settings.API_CIRCUIT_COOLDOWN_SECONDS,
+                 get_now=time.time):
+        self._threshold = threshold
+        self._cooldown = cooldown
+        self._get_now = get_now
+        self._lock = threading.Lock()
+
+        self._failures = {}
+        self._opened = {}
+
+    def before(self, endpoint):
+        """ call before a request.  raises CircuitOpen if we shouldn't make it """
+        with self._lock:
+            opened = self._opened.get(endpoint)
+            if opened is None:
+                return
+
+            now = self._get_now()
+            if now - opened < self._cooldown:
+                raise exc.CircuitOpen(endpoint)
+
+            # half-open: this request is the trial.  everybody else keeps
+            # failing fast until it's done
+            self._opened[endpoint] = now
+
+    def success(self, endpoint):
+        with self._lock:
+            self._failures.pop(endpoint, None)
+            self._opened.pop(endpoint, None)
+
+    def failure(self, endpoint):
+        with self._lock:
+            failures = self._failures.get(endpoint, 0) + 1
+            self._failures[endpoint] = failures
+            if failures >= self._threshold:
+                self._opened[endpoint] = self._get_now()
+
+    def is_open(self, endpoint):
+        with self._lock:
+            return endpoint in self._opened
+
+    def open_circuits(self):
+        with self._lock:
+            return sorted(self._opened)
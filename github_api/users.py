@@ -1,9 +1,28 @@
+from . import exceptions as exc
+from . import ratelimit
+from . import records
+
 
 def get_user(api, user):
     path = "/users/{user}".format(user=user)
-    return api("get", path)
+    return api("get", path, project=records.User.from_json)
+
+
+def get_users(api, logins):
+    """ fetches several users with a single graphql query """
+    aliases = ["u{}".format(i) for i in range(len(logins))]
+    query = "query({variables}) {{ {users} }}".format(
+        variables=", ".join("${}: String!".format(a) for a in aliases),
+        users=" ".join("{0}: user(login: ${0}) {{ login createdAt }}".format(a)
+                       for a in aliases))
+    data = api.graphql(query, dict(zip(aliases, logins)))
+    return [records.User(login=data[a]["login"], created_at=data[a]["createdAt"])
+            for a in aliases if data.get(a)]
 
 
 def follow_user(api, user):
     follow_path = "/user/following/{user}".format(user=user)
-    return api("PUT", follow_path)
+    try:
+        return api("PUT", follow_path, priority=ratelimit.COSMETIC)
+    except exc.RequestShed:
+        return None
@@ -0,0 +1,160 @@
+import os
+import json
+import time
+import logging
+import calendar
+import threading
+
+from requests import RequestException
+
+import settings
+from . import exceptions as exc
+from . import users
+
+log = logging.getLogger("github_api")
+
+
+def created_epoch(created_at):
+    """ github's "2017-05-20T00:00:00Z" as a unix timestamp """
+    return calendar.timegm(time.strptime(created_at, "%Y-%m-%dT%H:%M:%SZ"))
+
+
+class _Fetch(object):
+    """ a fetch of some voters that's underway, which others who want the same
+    voters can wait for """
+    __slots__ = ("done", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.error = None
+
+
+class VoterIndex(object):
+    """ login => when the account was created, as a unix timestamp, for every
+    voter we've seen.  accounts don't get younger, so entries never expire.
+    voters we don't know yet are fetched in batches through graphql, if we use
+    it.  if attach()ed to a file, the index is kept there across restarts.
+    it's safe to share between threads, and threads that want the same new
+    voter at once share a single fetch """
+
+    def __init__(self, fpath=None):
+        self._fpath = fpath
+        self._created = {}
+        self._dirty = False
+        self._lock = threading.Lock()
+        # login => the _Fetch getting it
+        self._fetches = {}
+
+    def attach(self, fpath):
+        """ loads the index from `fpath`, and save()s it there from now on """
+        if os.path.exists(fpath):
+            with open(fpath, "r") as h:
+                created = json.load(h)
+            with self._lock:
+                for login, epoch in created.items():
+                    self._created.setdefault(login, epoch)
+        self._fpath = fpath
+
+    def save(self):
+        """ writes the index to its file, if it has changed """
+        with self._lock:
+            if not self._dirty or self._fpath is None:
+                return
+            created = dict(self._created)
+            self._dirty = False
+
+        tmp = self._fpath + ".tmp"
+        with open(tmp, "w") as h:
+            json.dump(created, h)
+        os.rename(tmp, self._fpath)
+
+    def add(self, user):
+        """ indexes a User record """
+        epoch = created_epoch(user.created_at)
+        with self._lock:
+            if self._created.get(user.login) != epoch:
+                self._created[user.login] = epoch
+                self._dirty = True
+
+    def get(self, login):
+        """ the account creation time of a voter, or None if we don't know
+        it yet """
+        return self._created.get(login)
+
+    def _claim(self, logins):
+        """ returns the logins we don't know that nobody is fetching yet, and
+        the _Fetch for them, which whoever called this now has to finish """
+        fetch = _Fetch()
+        with self._lock:
+            claimed = [login for login in logins
+                       if login not in self._created and login not in self._fetches]
+            for login in claimed:
+                self._fetches[login] = fetch
+        return claimed, fetch
+
+    def _finish(self, logins, fetch, error=None):
+        with self._lock:
+            for login in logins:
+                del self._fetches[login]
+        fetch.error = error
+        fetch.done.set()
+
+    def created(self, api, login):
+        """ the account creation time of a voter, fetching it if we have
+        to """
+        while True:
+            epoch = self.get(login)
+            if epoch is not None:
+                return epoch
+
+            claimed, fetch = self._claim([login])
+            if claimed:
+                try:
+                    self.add(users.get_user(api, login))
+                except Exception as e:
+                    self._finish(claimed, fetch, e)
+                    raise
+                self._finish(claimed, fetch)
+                continue
+
+            # somebody else is on it already
+            with self._lock:
+                fetch = self._fetches.get(login)
+            if fetch is not None:
+                fetch.done.wait()
+                if fetch.error is not None:
+                    raise fetch.error
+
+    def prefetch(self, api, logins):
+        """ fetches the voters among `logins` that we don't know yet.  this is
+        best effort, anybody it misses is fetched by created() later """
+        missing = sorted(set(login for login in logins if self.get(login) is None))
+        if not missing:
+            return
+
+        if settings.USE_GRAPHQL:
+            batch_size = settings.GRAPHQL_USER_BATCH
+            for start in range(0, len(missing), batch_size):
+                claimed, fetch = self._claim(missing[start:start + batch_size])
+                if not claimed:
+                    continue
+                try:
+                    for user in users.get_users(api, claimed):
+                        self.add(user)
+                # a deleted account fails the whole batch.  whoever is waiting
+                # on it tries by themselves
+                except exc.GraphQLError:
+                    log.warning("couldn't prefetch a batch of voters", exc_info=True)
+                finally:
+                    self._finish(claimed, fetch)
+            return
+
+        # the rest api has no batches, but we're called for many prs at once
+        for login in missing:
+            try:
+                self.created(api, login)
+            except (RequestException, exc.CircuitOpen):
+                log.warning("couldn't prefetch voter %s", login, exc_info=True)
+
+    def __len__(self):
+        return len(self._created)
@@ -1,32 +1,52 @@
+import os
+import re
+import time
+import threading
+from collections import OrderedDict
+
 import arrow
-from emoji import demojize
+from emoji import emojize
 
 from github_api.misc import dynamic_voting_window
 from . import prs
 from . import comments
-from . import users
 from . import repos
+from .voter_index import VoterIndex
 
 import settings
 
+# the emojis that count as votes, one per line
+EMOJI_FILE = "data/emojis.{type}"
+
 
-def get_votes(api, urn, pr):
+def get_votes(api, urn, pr, full=False):
     """ return a mapping of username => -1 or 1 for the votes on the current
     state of a pr.  we consider comments and reactions, but only from users who
     are not the owner of the pr.  we also make sure that the voting
     comments/reactions come *after* the last update to the pr, so that someone
-    can't acquire approval votes, then change the pr """
-
-    votes = {}
-    pr_owner = pr["user"]["login"]
-    pr_num = pr["number"]
-
-    # get all the comment-and-reaction-based votes
-    for voter, vote in get_pr_comment_votes_all(api, urn, pr_num):
-        votes[voter] = vote
+    can't acquire approval votes, then change the pr.  `full` fetches all of
+    the pr's comments, not just the ones that changed """
+    pr_num = pr.number
+    pr_comments = prs.get_pr_comments(api, urn, pr_num, full=full)
+    pr_reactions = prs.get_reactions_for_pr(api, urn, pr_num)
+    pr_reviews = prs.get_pr_reviews(api, urn, pr_num)
+    return tally_votes(pr, pr_comments, pr_reactions, pr_reviews)
+
+
+def tally_votes(pr, pr_comments, pr_reactions, pr_reviews, cache=None):
+    """ the part of get_votes that doesn't talk to github.  takes the pr and
+    its comments, reactions and reviews as records, however they were
+    fetched.  the comment and reaction votes come from `cache`, a VoteCache,
+    which only parses what's new since the last time """
+    cache = cache or vote_cache
+    pr_owner = pr.author
+
+    # get all the comment-and-reaction-based votes.  the pr itself is the
+    # "first comment," so its reactions are votes too
+    votes = cache.tally(pr.number, pr_comments, pr_reactions)
 
     # get all the pr-review-based votes
-    for vote_owner, vote in get_pr_review_votes(api, urn, pr_num):
+    for vote_owner, vote in get_review_votes(pr_reviews):
         if vote and vote_owner != pr_owner:
             votes[vote_owner] = vote
 
@@ -37,70 +57,35 @@ def get_votes(api, urn, pr):
     return votes
 
 
-def get_pr_comment_votes_all(api, urn, pr_num):
-    """ yields votes via comments and votes via reactions on comments for a
-    given pr """
-    for comment in prs.get_pr_comments(api, urn, pr_num):
-        comment_owner = comment["user"]["login"]
-
-        vote = parse_comment_for_vote(comment["body"])
-        if vote:
-            yield comment_owner, vote
-
-        # reactions count as votes too.
-        # but notice we're only counting reactions on comments NEWER than the
-        # last pr update, and the reaction itself also has to be later than the
-        # latest pr update:
-        #
-        #             | old reaction  | new reaction
-        # ------------|---------------|---------------
-        # old comment | doesn't count | doesn't count
-        # new comment | not possible  | counts
-        '''
-        Removed in response to issue #21
-        reaction_votes = get_comment_reaction_votes(api, urn,
-                comment["id"], since)
-        for reaction_owner, vote in reaction_votes:
-            yield reaction_owner, vote
-        '''
-
-    # we consider the pr itself to be the "first comment."  in the web ui, it
-    # looks like a comment, complete with reactions, so let's treat it like a
-    # comment
-    reaction_votes = get_pr_reaction_votes(api, urn, pr_num)
-    for reaction_owner, vote in reaction_votes:
-        yield reaction_owner, vote
+def get_comment_reaction_votes(api, urn, comment_id):
+    """ yields votes via reactions on a comment """
+    return get_reaction_votes(comments.get_reactions_for_comment(api, urn, comment_id))
 
 
-def get_pr_reaction_votes(api, urn, pr_num):
-    """ yields reaction votes to a pr-comment.  very similar to getting
-    reactions from comments on the pr """
-    reactions = prs.get_reactions_for_pr(api, urn, pr_num)
-    for reaction in reactions:
-        reaction_owner = reaction["user"]["login"]
-        vote = parse_reaction_for_vote(reaction["content"])
+def get_comment_votes(comment_list):
+    """ yields the votes in a list of comments """
+    for comment in comment_list:
+        comment_owner = comment.author
+        vote = parse_comment_for_vote(comment.body)
         if vote:
-            yield reaction_owner, vote
+            yield comment_owner, vote
 
 
-def get_comment_reaction_votes(api, urn, comment_id):
-    """ yields votes via reactions on comments on a pr.  don't use this
-    directly, it is called by get_pr_comment_votes_all """
-    reactions = comments.get_reactions_for_comment(api, urn, comment_id)
+def get_reaction_votes(reactions):
+    """ yields the votes in a list of reactions """
     for reaction in reactions:
-        reaction_owner = reaction["user"]["login"]
-        vote = parse_reaction_for_vote(reaction["content"])
+        reaction_owner = reaction.author
+        vote = parse_reaction_for_vote(reaction.content)
         if vote:
             yield reaction_owner, vote
 
 
-def get_pr_review_votes(api, urn, pr_num):
-    """ votes made through
-    https://help.github.com/articles/about-pull-request-reviews/ """
-    for review in prs.get_pr_reviews(api, urn, pr_num):
-        state = review["state"]
+def get_review_votes(reviews):
+    """ yields the votes in a list of pr reviews """
+    for review in reviews:
+        state = review.state
         if state in ("APPROVED", "DISMISSED"):
-            user = review["user"]["login"]
+            user = review.author
             vote = parse_review_for_vote(state)
             yield user, vote
 
@@ -108,14 +93,15 @@ def get_pr_review_votes(api, urn, pr_num):
 def get_vote_weight(api, username):
     """ for a given username, determine the weight that their -1 or +1 vote
     should be scaled by """
-    user = users.get_user(api, username)
+    return get_voter_weight(username, voter_index.created(api, username), time.time())
 
+
+def get_voter_weight(username, created, now):
+    """ the weight of a voter whose account was created at `created`, a unix
+    timestamp """
     # determine their age.  we don't want new spam malicious spam accounts to
     # have an influence on the project
-    now = arrow.utcnow()
-    created = arrow.get(user["created_at"])
-    age = (now - created).total_seconds()
-    old_enough_to_vote = age >= settings.MIN_VOTER_AGE
+    old_enough_to_vote = now - created >= settings.MIN_VOTER_AGE
     weight = 1.0 if old_enough_to_vote else 0.0
     if username.lower() == "smittyvb":
         weight /= 2
@@ -123,13 +109,20 @@ def get_vote_weight(api, username):
     return weight
 
 
-def get_vote_sum(api, votes):
+def get_vote_sum(api, votes, known_users=None):
     """ for a vote mapping of username => -1 or 1, compute the weighted vote
-    total """
+    total.  `known_users` is an optional mapping of username => user that we
+    already have, so we don't need to fetch those again.  the voters we've never
+    seen before are fetched in one batch """
+    for user in (known_users or {}).values():
+        voter_index.add(user)
+    voter_index.prefetch(api, votes)
+
+    now = time.time()
     total = 0
     variance = 0
     for user, vote in votes.items():
-        weight = get_vote_weight(api, user)
+        weight = get_voter_weight(user, voter_index.created(api, user), now)
         total += weight * vote
         if weight * vote > 0:
             variance += vote
@@ -160,29 +153,252 @@ def parse_reaction_for_vote(body):
 
 
 def parse_comment_for_vote(body):
-    """ turns a comment into a vote, if possible """
-    return parse_emojis_for_vote(demojize(body))
+    """ turns a comment into a vote, if possible.  unicode emojis count the
+    same as their :names: """
+    return parse_emojis_for_vote(body)
 
 
 def parse_emojis_for_vote(body):
     """ searches text for matching emojis """
-    for positive_emoji in prepare_emojis_list('positive'):
-        if positive_emoji in body:
-            return 1
-    for negative_emoji in prepare_emojis_list('negative'):
-        if negative_emoji in body:
-            return -1
-    return 0
+    return vote_matcher.vote(body)
 
 
-def prepare_emojis_list(type):
-    fname = "data/emojis.{type}".format(type=type)
+def prepare_emojis_list(type, fname=EMOJI_FILE):
+    fname = fname.format(type=type)
     with open(fname) as f:
         content = f.readlines()
     content = [x.strip() for x in content]
     return list(filter(None, content))
 
 
+def _emojize(name):
+    """ the unicode for an emoji's :name:, or the name if it has none """
+    try:
+        return emojize(name, language="alias")
+    except TypeError:
+        # emoji < 1.0 has no languages
+        return emojize(name, use_aliases=True)
+
+
+def _compile_emojis(emojis):
+    """ a regex that finds any of these :names:, or their unicode """
+    alternatives = set(emojis)
+    for name in emojis:
+        # "❤️" is often written without its variation selector, as "❤"
+        alternatives.add(_emojize(name).replace("\ufe0f", ""))
+    if not alternatives:
+        return re.compile("(?!)")
+    return re.compile("|".join(re.escape(a) for a in sorted(alternatives)))
+
+
+class VoteMatcher(object):
+    """ finds the vote in a piece of text.  each emoji list is compiled into
+    one regex, which is only compiled again when the list's file changes.  we
+    check for that at most every `check_interval` seconds """
+
+    def __init__(self, fname=EMOJI_FILE, check_interval=1, get_now=time.monotonic):
+        self._fname = fname
+        self._check_interval = check_interval
+        self._get_now = get_now
+        self._lock = threading.Lock()
+        self._checked = None
+        self._mtimes = None
+        self._regexes = None
+
+    def _mtime(self, type):
+        return os.stat(self._fname.format(type=type)).st_mtime
+
+    def regexes(self):
+        """ the (positive, negative) regexes for the current emoji lists """
+        now = self._get_now()
+        if self._checked is not None and now - self._checked < self._check_interval:
+            return self._regexes
+
+        with self._lock:
+            mtimes = (self._mtime("positive"), self._mtime("negative"))
+            if mtimes != self._mtimes:
+                self._regexes = (
+                    _compile_emojis(prepare_emojis_list("positive", self._fname)),
+                    _compile_emojis(prepare_emojis_list("negative", self._fname)),
+                )
+                self._mtimes = mtimes
+            # only now can the check above, which doesn't take the lock, use
+            # our regexes
+            self._checked = now
+            return self._regexes
+
+    def fingerprint(self):
+        """ changes whenever the emoji lists do """
+        positive, negative = self.regexes()
+        return positive.pattern, negative.pattern
+
+    def vote(self, body):
+        """ 1 if there's a positive emoji anywhere in the body, otherwise -1
+        if there's a negative one, otherwise 0 """
+        positive, negative = self.regexes()
+        if positive.search(body):
+            return 1
+        if negative.search(body):
+            return -1
+        return 0
+
+
+vote_matcher = VoteMatcher()
+
+# when every voter's account was created
+voter_index = VoterIndex()
+
+# comments come before reactions when we tally votes, so a reaction beats any
+# comment by the same voter
+COMMENT = 0
+REACTION = 1
+
+
+class _Tally(object):
+    """ who votes what in one pr's comments and reactions.  every item is
+    keyed by (COMMENT or REACTION, id), and a voter's vote is the one in their
+    last item, the same as tallying them in order """
+    __slots__ = ("items", "by_voter", "votes")
+
+    def __init__(self):
+        # key => (voter, vote), only for the items that have a vote
+        self.items = {}
+        # voter => the keys of their items
+        self.by_voter = {}
+        # voter => vote
+        self.votes = {}
+
+    def update(self, kind, fresh):
+        """ makes the items of one kind match `fresh`, a mapping of key =>
+        (voter, vote), and recounts only the voters whose items changed """
+        changed = set()
+        gone = [key for key in self.items if key[0] == kind and key not in fresh]
+        for key in gone:
+            voter, _ = self.items.pop(key)
+            self.by_voter[voter].discard(key)
+            changed.add(voter)
+
+        for key, item in fresh.items():
+            old = self.items.get(key)
+            if old == item:
+                continue
+            if old is not None:
+                self.by_voter[old[0]].discard(key)
+                changed.add(old[0])
+            self.items[key] = item
+            self.by_voter.setdefault(item[0], set()).add(key)
+            changed.add(item[0])
+
+        for voter in changed:
+            keys = self.by_voter.get(voter)
+            if keys:
+                self.votes[voter] = self.items[max(keys)][1]
+            else:
+                self.by_voter.pop(voter, None)
+                self.votes.pop(voter, None)
+
+
+class VoteCache(object):
+    """ remembers the vote in every comment and reaction we've parsed, by id
+    and when it was last updated, so that only new and edited ones are parsed
+    again.  it also keeps a _Tally for the `max_prs` prs we've looked at last.
+    everything is thrown out when the emoji lists change """
+
+    def __init__(self, max_entries=100000, max_prs=1000):
+        self._max_entries = max_entries
+        self._max_prs = max_prs
+        self._lock = threading.Lock()
+        self._fingerprint = None
+        # (kind, id) => (updated_at, vote)
+        self._parsed = OrderedDict()
+        # pr number => _Tally
+        self._tallies = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def _check_fingerprint(self):
+        fingerprint = vote_matcher.fingerprint()
+        if fingerprint != self._fingerprint:
+            self._parsed.clear()
+            self._tallies.clear()
+            self._fingerprint = fingerprint
+
+    def _vote(self, key, updated_at, parse, text):
+        cached = self._parsed.get(key)
+        if cached is not None and cached[0] == updated_at:
+            self.hits += 1
+            return cached[1]
+
+        self.misses += 1
+        vote = parse(text)
+        self._parsed[key] = (updated_at, vote)
+        self._parsed.move_to_end(key)
+        while len(self._parsed) > self._max_entries:
+            self._parsed.popitem(last=False)
+        return vote
+
+    def _fresh(self, kind, items, updated_at, parse, text):
+        fresh = {}
+        for item in items:
+            key = (kind, item.id)
+            vote = self._vote(key, updated_at(item), parse, text(item))
+            if vote:
+                fresh[key] = (item.author, vote)
+        return fresh
+
+    def tally(self, pr_num, pr_comments, pr_reactions):
+        """ a mapping of voter => vote for the comments and reactions on a
+        pr """
+        # they can be lazy api calls, which must not wait on each other
+        pr_comments = list(pr_comments)
+        pr_reactions = list(pr_reactions)
+
+        with self._lock:
+            self._check_fingerprint()
+            comment_votes = self._fresh(
+                COMMENT, pr_comments, lambda c: c.updated_at or c.created_at,
+                parse_comment_for_vote, lambda c: c.body)
+            # reactions can't be edited
+            reaction_votes = self._fresh(
+                REACTION, pr_reactions, lambda r: r.created_at,
+                parse_reaction_for_vote, lambda r: r.content)
+
+            tally = self._tallies.get(pr_num)
+            if tally is None:
+                tally = self._tallies[pr_num] = _Tally()
+            self._tallies.move_to_end(pr_num)
+            while len(self._tallies) > self._max_prs:
+                self._tallies.popitem(last=False)
+
+            tally.update(COMMENT, comment_votes)
+            tally.update(REACTION, reaction_votes)
+            return dict(tally.votes)
+
+    def dump(self):
+        """ the votes we've parsed, to carry them over a restart """
+        with self._lock:
+            return {"fingerprint": self._fingerprint,
+                    "parsed": list(self._parsed.items())}
+
+    def load(self, state):
+        """ loads what dump() returned.  votes parsed with other emoji lists
+        are ignored """
+        with self._lock:
+            self._check_fingerprint()
+            if state["fingerprint"] != self._fingerprint:
+                return
+            for key, entry in state["parsed"]:
+                self._parsed.setdefault(key, entry)
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._parsed), "prs": len(self._tallies),
+                    "hits": self.hits, "misses": self.misses}
+
+
+vote_cache = VoteCache()
+
+
 def friendly_voting_record(votes):
     """ returns a sorted list (a string list, not datatype list) of voters and
     their raw (unweighted) vote.  this is used in merge commit messages """
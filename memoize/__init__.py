@@ -1,3 +1,6 @@
-from .decorator import memoize
+from .decorator import (memoize, registry, all_stats, invalidate_tags,
+                        snapshot, restore)
+from .backends import flush_all
 
-__all__ = ["memoize"]
+__all__ = ["memoize", "registry", "all_stats", "invalidate_tags", "snapshot",
+           "restore", "flush_all"]
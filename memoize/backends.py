@@ -1,10 +1,39 @@
 import json
 import os
-from os.path import join, exists
+import sys
+from os.path import join, exists, getsize, dirname
+import atexit
 import inspect
+import sqlite3
+import threading
+import weakref
+from collections import OrderedDict
 
+from .helpers import digest_key
 
-def json_backend(d):
+# every write-behind backend, so that they can all be flushed before we exit or
+# replace our process
+_write_behind = weakref.WeakSet()
+
+
+def flush_all():
+    """ writes out everything that our write-behind backends haven't written
+    yet.  this runs at exit, but os.exec* skips exit handlers, so call it
+    yourself before those """
+    for backend in list(_write_behind):
+        backend.flush()
+
+
+atexit.register(flush_all)
+
+
+def _stored_key(k):
+    """ the persistent backends can only store string keys, so they digest the
+    decorator's tuple keys themselves """
+    return k if isinstance(k, str) else digest_key(k)
+
+
+def _file_backend(cls, d, ext, kwargs):
     if not exists(d):
         os.mkdir(d)
 
@@ -12,17 +41,60 @@ def json_backend(d):
         mod_name = inspect.getmodule(fn).__name__
         fn_name = fn.__name__
         name = mod_name + "." + fn_name
-        fpath = join(d, name)
-        return JSONBackend(fpath)
+        fpath = join(d, name + ext)
+        return cls(fpath, **kwargs)
+    return wrap
+
+
+def json_backend(d, **kwargs):
+    """ a backend factory that keeps one json file per memoized function in
+    directory `d`.  kwargs are passed on to JSONBackend """
+    return _file_backend(JSONBackend, d, "", kwargs)
+
+
+def log_backend(d, **kwargs):
+    """ a backend factory that keeps one append-only log per memoized function
+    in directory `d`.  kwargs are passed on to LogBackend """
+    return _file_backend(LogBackend, d, ".log", kwargs)
+
+
+def lru_backend(max_entries=None, max_bytes=None, parent=None):
+    """ a backend factory for bounded in-memory caches.  `parent` is another
+    backend factory, for a persistent cache that the memory cache sits in front
+    of """
+    def wrap(fn):
+        return LRUBackend(max_entries, max_bytes,
+                          parent=parent(fn) if parent else None)
+    return wrap
+
+
+def sqlite_backend(path):
+    """ a backend factory that keeps one table per memoized function in the
+    sqlite database at `path` """
+    d = dirname(path)
+    if d and not exists(d):
+        os.mkdir(d)
+
+    def wrap(fn):
+        mod_name = inspect.getmodule(fn).__name__
+        fn_name = fn.__name__
+        return SQLiteBackend(path, mod_name + "." + fn_name)
     return wrap
 
 
 class JSONBackend(object):
     """ a simple json-file-based backend for the memoize decorator.  writes to a
     temp file before atomically moving to the provided file, to prevent
-    data corruption """
+    data corruption.  writes from different threads are serialized.
 
-    def __init__(self, fpath):
+    every write rewrites the whole file.  with `write_behind`, writes only mark
+    the cache dirty, and the file is rewritten `flush_interval` seconds after
+    the first unwritten change, after `flush_every` unwritten changes, or at
+    exit, whichever comes first.  a crash loses the unwritten changes, but never
+    corrupts the file """
+
+    def __init__(self, fpath, write_behind=False, flush_interval=30,
+                 flush_every=100):
         self._data = {}
         if exists(fpath):
             with open(fpath, "r") as h:
@@ -30,20 +102,492 @@ class JSONBackend(object):
 
         self._fpath = fpath
         self._backup = self._fpath + ".tmp"
+        self._lock = threading.Lock()
+        # only one thread at a time may write the temp file
+        self._write_lock = threading.Lock()
+
+        self._write_behind = write_behind
+        self._flush_interval = flush_interval
+        self._flush_every = flush_every
+        self._dirty = 0
+        self._timer = None
+        if write_behind:
+            _write_behind.add(self)
 
     def __setitem__(self, k, v):
-        self._data[k] = v
-        self._atomic_write()
+        k = _stored_key(k)
+        with self._lock:
+            self._data[k] = v
+            flush_now = self._changed(1)
+
+        if flush_now:
+            self.flush()
+
+    def _changed(self, changes):
+        """ marks the cache dirty.  returns True if it should be flushed right
+        away, otherwise makes sure that a flush is coming """
+        self._dirty += changes
+        flush_now = (not self._write_behind or
+                     self._dirty >= self._flush_every)
+        if not flush_now and self._timer is None:
+            self._timer = threading.Timer(self._flush_interval, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+        return flush_now
 
     def __getitem__(self, k):
-        return self._data[k]
+        return self._data[_stored_key(k)]
 
     def __contains__(self, k):
-        return k in self._data
+        return _stored_key(k) in self._data
 
-    def _atomic_write(self):
+    def __len__(self):
+        return len(self._data)
+
+    def __delitem__(self, k):
+        k = _stored_key(k)
+        with self._lock:
+            del self._data[k]
+            flush_now = self._changed(1)
+        if flush_now:
+            self.flush()
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            flush_now = self._changed(1)
+        if flush_now:
+            self.flush()
+
+    def disk_bytes(self):
+        return getsize(self._fpath) if exists(self._fpath) else 0
+
+    @property
+    def dirty(self):
+        """ how many changes haven't been written to disk yet """
+        return self._dirty
+
+    def purge(self, before):
+        """ forgets the entries inserted before `before` """
+        with self._lock:
+            expired = [k for k, (inserted, _) in self._data.items()
+                       if inserted < before]
+            for k in expired:
+                del self._data[k]
+            flush_now = expired and self._changed(len(expired))
+
+        if flush_now:
+            self.flush()
+        return len(expired)
+
+    def flush(self):
+        """ writes the cache to disk, if anything changed since the last time """
+        with self._write_lock:
+            with self._lock:
+                if not self._dirty:
+                    return
+                data = dict(self._data)
+                self._dirty = 0
+                if self._timer is not None:
+                    self._timer.cancel()
+                    self._timer = None
+
+            try:
+                self._atomic_write(data)
+            except Exception:
+                # try again with the next flush
+                with self._lock:
+                    self._dirty += 1
+                raise
+
+    def _atomic_write(self, data):
         with open(self._backup, "w") as h:
-            json.dump(self._data, h)
+            json.dump(data, h)
 
         # atomic move
         os.rename(self._backup, self._fpath)
+
+
+class LogBackend(object):
+    """ an append-only json-lines backend for the memoize decorator.  every
+    write appends a single [key, value] line, so writes cost the same no matter
+    how big the cache is, and loading replays the log, with later lines winning.
+
+    the log keeps growing with overwritten and purged entries, so once it has
+    more than `compact_min` lines and `compact_ratio` times as many lines as
+    live entries, it's compacted in a background thread: the live entries are
+    written to a temp file, which atomically replaces the log.  a crash can
+    leave a torn last line, which is dropped when the log is loaded.  deletes
+    are logged as a [key] line """
+
+    def __init__(self, fpath, compact_min=1000, compact_ratio=2.0):
+        self._fpath = fpath
+        self._compacted = fpath + ".tmp"
+        self._compact_min = compact_min
+        self._compact_ratio = compact_ratio
+        self._lock = threading.Lock()
+
+        self._data = {}
+        self._records = 0
+        self._replay()
+
+        self._handle = open(self._fpath, "a")
+        self._compact_lock = threading.Lock()
+        self._compactor = None
+        # what gets written while we're compacting, which the compacted log
+        # needs too
+        self._pending = None
+
+    def _replay(self):
+        if not exists(self._fpath):
+            return
+
+        good = 0
+        with open(self._fpath, "rb") as h:
+            for line in h:
+                try:
+                    record = json.loads(line.decode("utf8"))
+                except ValueError:
+                    # a torn write.  everything after it is suspect too
+                    break
+                if not line.endswith(b"\n"):
+                    break
+
+                if len(record) == 1:
+                    self._data.pop(record[0], None)
+                else:
+                    k, v = record
+                    self._data[k] = v
+                self._records += 1
+                good += len(line)
+
+        # cut off the torn line, so that our appends start on a fresh one
+        if good < getsize(self._fpath):
+            with open(self._fpath, "r+b") as h:
+                h.truncate(good)
+
+    def __setitem__(self, k, v):
+        k = _stored_key(k)
+        line = json.dumps([k, v]) + "\n"
+        with self._lock:
+            self._data[k] = v
+            self._append(line)
+
+    def __delitem__(self, k):
+        k = _stored_key(k)
+        line = json.dumps([k]) + "\n"
+        with self._lock:
+            del self._data[k]
+            self._append(line)
+
+    def _append(self, line):
+        """ call with the lock held """
+        self._handle.write(line)
+        self._handle.flush()
+        self._records += 1
+        if self._pending is not None:
+            self._pending.append(line)
+        self._maybe_compact()
+
+    def __getitem__(self, k):
+        return self._data[_stored_key(k)]
+
+    def __contains__(self, k):
+        return _stored_key(k) in self._data
+
+    def __len__(self):
+        return len(self._data)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+        self.compact()
+
+    def disk_bytes(self):
+        return getsize(self._fpath) if exists(self._fpath) else 0
+
+    @property
+    def records(self):
+        """ how many lines the log has """
+        return self._records
+
+    def purge(self, before):
+        """ forgets the entries inserted before `before`.  they stay in the log
+        until the next compaction, and if we crash before then they come back,
+        but only as expired entries """
+        with self._lock:
+            expired = [k for k, (inserted, _) in self._data.items()
+                       if inserted < before]
+            for k in expired:
+                del self._data[k]
+            self._maybe_compact()
+        return len(expired)
+
+    def _maybe_compact(self):
+        if self._compactor is not None:
+            return
+        if self._records < self._compact_min:
+            return
+        if self._records < self._compact_ratio * len(self._data):
+            return
+
+        self._compactor = threading.Thread(target=self.compact)
+        self._compactor.daemon = True
+        self._compactor.start()
+
+    def compact(self):
+        """ rewrites the log with just the live entries """
+        with self._compact_lock:
+            with self._lock:
+                data = dict(self._data)
+                self._pending = []
+
+            try:
+                with open(self._compacted, "w") as h:
+                    for k, v in data.items():
+                        h.write(json.dumps([k, v]) + "\n")
+
+                with self._lock:
+                    # catch up on whatever was written while we were busy
+                    with open(self._compacted, "a") as h:
+                        h.writelines(self._pending)
+                    os.rename(self._compacted, self._fpath)
+
+                    self._handle.close()
+                    self._handle = open(self._fpath, "a")
+                    self._records = len(data) + len(self._pending)
+            finally:
+                with self._lock:
+                    self._pending = None
+                    self._compactor = None
+
+    def close(self):
+        compactor = self._compactor
+        if compactor is not None and compactor is not threading.current_thread():
+            compactor.join()
+        with self._lock:
+            self._handle.close()
+
+
+class SQLiteBackend(object):
+    """ a sqlite backend for the memoize decorator.  entries are looked up one
+    row at a time instead of loading the whole cache up front, and expired
+    entries are purged with one DELETE on an indexed column.  the database is
+    in WAL mode, so other processes (like our web server) can read it while we
+    write to it.  values are stored as json """
+
+    def __init__(self, path, table):
+        self._table = '"{}"'.format(table.replace('"', '""'))
+        self._lock = threading.Lock()
+
+        # every statement commits by itself
+        self._conn = sqlite3.connect(path, isolation_level=None,
+                                     check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS {t} (key TEXT PRIMARY KEY, "
+            "inserted REAL NOT NULL, value TEXT NOT NULL)".format(t=self._table))
+        self._conn.execute(
+            'CREATE INDEX IF NOT EXISTS "{name}_inserted" ON {t} (inserted)'
+            .format(name=table.replace('"', '""'), t=self._table))
+
+    def _query(self, sql, *params):
+        with self._lock:
+            return self._conn.execute(sql.format(t=self._table), params).fetchall()
+
+    def __setitem__(self, k, v):
+        inserted, res = v
+        self._query("INSERT OR REPLACE INTO {t} (key, inserted, value) "
+                    "VALUES (?, ?, ?)", _stored_key(k), inserted, json.dumps(res))
+
+    def __getitem__(self, k):
+        rows = self._query("SELECT inserted, value FROM {t} WHERE key = ?",
+                           _stored_key(k))
+        if not rows:
+            raise KeyError(k)
+        inserted, value = rows[0]
+        return inserted, json.loads(value)
+
+    def __contains__(self, k):
+        return bool(self._query("SELECT 1 FROM {t} WHERE key = ?", _stored_key(k)))
+
+    def __len__(self):
+        return self._query("SELECT COUNT(*) FROM {t}")[0][0]
+
+    def __delitem__(self, k):
+        with self._lock:
+            cursor = self._conn.execute(
+                "DELETE FROM {t} WHERE key = ?".format(t=self._table),
+                (_stored_key(k),))
+            if not cursor.rowcount:
+                raise KeyError(k)
+
+    def clear(self):
+        self._query("DELETE FROM {t}")
+
+    def disk_bytes(self):
+        """ roughly, since the table shares its file with others """
+        rows = self._query("SELECT SUM(LENGTH(key) + LENGTH(value) + 8) FROM {t}")
+        return rows[0][0] or 0
+
+    def purge(self, before):
+        """ deletes the entries inserted before `before` """
+        with self._lock:
+            cursor = self._conn.execute(
+                "DELETE FROM {t} WHERE inserted < ?".format(t=self._table),
+                (before,))
+            return cursor.rowcount
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def _entry_size(k, v):
+    """ roughly how many bytes a cache entry takes """
+    try:
+        return len(k) + len(json.dumps(v))
+    except TypeError:
+        return sys.getsizeof(k) + sys.getsizeof(v)
+
+
+class LRUBackend(object):
+    """ a bounded in-memory backend for the memoize decorator.  once it holds
+    more than `max_entries` entries or `max_bytes` bytes, the least recently
+    used entries are evicted.  purge() sweeps out the expired ones.
+
+    with a `parent` backend, this is the first level of a two level cache:
+    writes go to both, reads that miss here are answered by the parent and kept
+    here, so the hot keys never touch the parent's disk """
+
+    def __init__(self, max_entries=None, max_bytes=None, parent=None,
+                 sizeof=_entry_size):
+        self._max_entries = max_entries
+        self._max_bytes = max_bytes
+        self._parent = parent
+        self._sizeof = sizeof
+        self._lock = threading.Lock()
+
+        self._data = OrderedDict()
+        self._sizes = {}
+        self.bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expired = 0
+
+    def __setitem__(self, k, v):
+        with self._lock:
+            self._put(k, v)
+        if self._parent is not None:
+            self._parent[k] = v
+
+    def _put(self, k, v):
+        if k in self._data:
+            self.bytes -= self._sizes[k]
+        self._data[k] = v
+        self._data.move_to_end(k)
+        self._sizes[k] = self._sizeof(k, v)
+        self.bytes += self._sizes[k]
+
+        while self._data and self._over_limit():
+            old, _ = self._data.popitem(last=False)
+            self.bytes -= self._sizes.pop(old)
+            self.evictions += 1
+
+    def _over_limit(self):
+        if self._max_entries is not None and len(self._data) > self._max_entries:
+            return True
+        return self._max_bytes is not None and self.bytes > self._max_bytes
+
+    def __getitem__(self, k):
+        with self._lock:
+            if k in self._data:
+                self._data.move_to_end(k)
+                self.hits += 1
+                return self._data[k]
+            self.misses += 1
+
+        if self._parent is None:
+            raise KeyError(k)
+        v = self._parent[k]
+        with self._lock:
+            self._put(k, v)
+        return v
+
+    def __contains__(self, k):
+        with self._lock:
+            if k in self._data:
+                return True
+        return self._parent is not None and k in self._parent
+
+    def __len__(self):
+        return len(self._data)
+
+    def __delitem__(self, k):
+        with self._lock:
+            found = k in self._data
+            if found:
+                del self._data[k]
+                self.bytes -= self._sizes.pop(k)
+
+        if self._parent is not None:
+            try:
+                del self._parent[k]
+                found = True
+            except KeyError:
+                pass
+        if not found:
+            raise KeyError(k)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._sizes.clear()
+            self.bytes = 0
+        if self._parent is not None:
+            self._parent.clear()
+
+    def disk_bytes(self):
+        disk_bytes = getattr(self._parent, "disk_bytes", None)
+        return disk_bytes() if disk_bytes else 0
+
+    def purge(self, before):
+        """ sweeps out the entries inserted before `before`, here and in the
+        parent """
+        with self._lock:
+            expired = [k for k, (inserted, _) in self._data.items()
+                       if inserted < before]
+            for k in expired:
+                del self._data[k]
+                self.bytes -= self._sizes.pop(k)
+            self.expired += len(expired)
+
+        purge = getattr(self._parent, "purge", None)
+        if purge is not None:
+            purge(before)
+        return len(expired)
+
+    def dump(self):
+        """ the entries in memory, least recently used first """
+        with self._lock:
+            return list(self._data.items())
+
+    def load(self, entries):
+        """ puts entries from dump() back into memory, without writing them
+        to the parent, which has them already """
+        with self._lock:
+            for k, v in entries:
+                self._put(k, v)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._data),
+                "bytes": self.bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expired": self.expired,
+            }
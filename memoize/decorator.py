@@ -1,46 +1,378 @@
 from functools import wraps
 import time
-import inspect
+import logging
+import threading
 
 from . import helpers
+from .backends import LRUBackend
 
+# how many entries the default, in-memory backend keeps per function
+DEFAULT_MAX_ENTRIES = 10000
 
-def memoize(ttl_spec, whitelist=None, blacklist=None,
-            key_fn=helpers._json_keyify, backend=lambda fn: dict(),
-            get_now=time.time):
-    """ memoize/cache the decorated function for ttl amount of time """
+log = logging.getLogger("memoize")
 
-    ttl = helpers._time_code_to_seconds(ttl_spec)
+# qualified function name => memoized function, for every memoized function
+_registry = {}
+_registry_lock = threading.Lock()
+
+
+def registry():
+    """ returns a mapping of qualified function name => memoized function """
+    with _registry_lock:
+        return dict(_registry)
+
+
+def all_stats():
+    """ the stats() of every memoized function, by qualified name """
+    return {name: fn.stats() for name, fn in registry().items()}
+
+
+def snapshot():
+    """ the in-memory entries of every memoized function that has some, by
+    qualified name, to carry them over a restart.  persistent backends take
+    care of themselves """
+    return {name: fn.cache.dump() for name, fn in registry().items()
+            if hasattr(fn.cache, "dump")}
+
+
+def restore(snapshot):
+    """ loads the entries from a snapshot() back into the memoized functions
+    that are still around """
+    functions = registry()
+    for name, entries in snapshot.items():
+        fn = functions.get(name)
+        if fn is not None and hasattr(fn.cache, "load"):
+            fn.cache.load(entries)
+
+
+# tag => when it was last invalidated
+_invalidated_tags = {}
+
+
+def invalidate_tags(*tags, now=None):
+    """ invalidates every cached entry, of every memoized function, that has
+    one of these tags and was computed before now.  the entries we know the
+    tags of are deleted from their backends, so that a persistent backend
+    doesn't hand them out again after a restart """
+    if now is None:
+        now = time.time()
+    with _registry_lock:
+        for tag in tags:
+            _invalidated_tags[tag] = now
+
+    for fn in registry().values():
+        fn.drop_tagged(tags)
+
+
+def _invalidated_since(tags, inserted):
+    with _registry_lock:
+        for tag in tags:
+            invalidated = _invalidated_tags.get(tag)
+            if invalidated is not None and invalidated >= inserted:
+                return True
+    return False
+
+
+def _start_thread(target):
+    thread = threading.Thread(target=target)
+    thread.daemon = True
+    thread.start()
+
+
+class _Flight(object):
+    """ a call of the memoized function that's underway, which other callers
+    that want the same key can wait for """
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+    def wait(self):
+        self.done.wait()
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+class CacheStats(object):
+    """ counts what a memoized function's cache does for us """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.errors = 0
+        self.calls = 0
+        self.call_seconds = 0.0
+        self.hit_seconds = 0.0
+
+    def count(self, name, seconds=None):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+            if name == "hits":
+                self.hit_seconds += seconds
+            elif name == "calls":
+                self.call_seconds += seconds
+
+    def as_dict(self, cache):
+        with self._lock:
+            avg_call = self.call_seconds / self.calls if self.calls else 0.0
+            avg_hit = self.hit_seconds / self.hits if self.hits else 0.0
+            stats = {
+                "hits": self.hits,
+                "stale_hits": self.stale_hits,
+                "misses": self.misses,
+                "refreshes": self.refreshes,
+                "errors": self.errors,
+                "avg_call_seconds": avg_call,
+                # what a hit saves us is the call we didn't have to make
+                "avg_saved_per_hit_seconds": max(avg_call - avg_hit, 0.0),
+            }
+
+        stats["entries"] = len(cache) if hasattr(cache, "__len__") else None
+        stats["evictions"] = getattr(cache, "evictions", 0)
+        disk_bytes = getattr(cache, "disk_bytes", None)
+        stats["disk_bytes"] = disk_bytes() if disk_bytes else 0
+        return stats
+
+
+def memoize(ttl_spec, whitelist=None, blacklist=None, key_fn=None,
+            backend=lambda fn: LRUBackend(max_entries=DEFAULT_MAX_ENTRIES),
+            get_now=time.time, stale_while_revalidate=None, stale_if_error=None,
+            spawn=_start_thread, max_ttl=None, tags=None):
+    """ memoize/cache the decorated function for ttl amount of time.  if the
+    backend has a purge(before) method, it's called every now and then to drop
+    the entries that are too old to be used.
+
+    `ttl_spec` can also be a function of the result, returning its ttl, so that
+    some results can be kept longer than others.  a ttl of 0 or None means the
+    result isn't cached at all.  since we can't know the longest ttl that
+    function returns, expired entries are only purged if `max_ttl` is given
+
+    for `stale_while_revalidate` amount of time after an entry expires, it's
+    still returned right away, while a refresh runs in the background (using
+    `spawn`), at most one per key at a time.  for `stale_if_error` amount of
+    time after it expires, it's returned if refreshing it raises.
+
+    cache keys are tuples of the (whitelisted or not blacklisted) argument
+    values.  the persistent backends turn them into strings with
+    helpers.digest_key by themselves, and backends that need other keys can
+    have them made by `key_fn`
+
+    the memoized function is safe to call from many threads.  if several of them
+    miss the same key at once, only the first one calls the function, and the
+    others wait for its result.
+
+    `tags` is a function that takes the same arguments as the memoized function
+    and returns the tags of the entry for them, like the pr or the repo it's
+    about.  invalidate_tags() then throws out the entries with those tags.
+
+    memoized functions have a stats() method, invalidate(*args, **kwargs),
+    which forgets the entry for those arguments, and clear().  every memoized
+    function is in the registry() """
+
+    if callable(ttl_spec):
+        ttl = None
+
+        def ttl_of(res):
+            return helpers._time_code_to_seconds(ttl_spec(res) or 0)
+    else:
+        ttl = max_ttl = helpers._time_code_to_seconds(ttl_spec)
+
+        def ttl_of(res):
+            return ttl
+
+    swr = helpers._time_code_to_seconds(stale_while_revalidate or 0)
+    sie = helpers._time_code_to_seconds(stale_if_error or 0)
+
+    # entries are useless after this long
+    max_age = None
+    if max_ttl is not None:
+        max_age = helpers._time_code_to_seconds(max_ttl) + max(swr, sie)
 
     def wrapper(fn):
-        sig = inspect.getfullargspec(fn)
+        bind = helpers._make_binder(fn, whitelist, blacklist)
         cache = backend(fn)
+        purge = getattr(cache, "purge", None)
+        state = {"purged": 0}
+
+        stats = CacheStats()
+
+        # key => the _Flight computing it
+        flights = {}
+        # tag => the keys of the entries we've stored or read with that tag
+        tagged = {}
+        lock = threading.Lock()
+
+        def index(key, entry_tags):
+            with lock:
+                for tag in entry_tags:
+                    tagged.setdefault(tag, set()).add(key)
+
+        def drop_tagged(tags):
+            """ deletes the entries we know have one of these tags """
+            with lock:
+                keys = set()
+                for tag in tags:
+                    keys.update(tagged.pop(tag, ()))
+            for key in keys:
+                try:
+                    del cache[key]
+                except KeyError:
+                    pass
+
+        def join_flight(key):
+            """ returns the flight for a key, and whether we started it, in
+            which case we have to fly it """
+            with lock:
+                flight = flights.get(key)
+                if flight is not None:
+                    return flight, False
+                flight = flights[key] = _Flight()
+                return flight, True
+
+        def fly(flight, key, args, kwargs, refresh):
+            started = get_now()
+            timer = time.monotonic()
+            if refresh:
+                stats.count("refreshes")
+            try:
+                flight.result = fn(*args, **kwargs)
+                stats.count("calls", time.monotonic() - timer)
+                if ttl_of(flight.result) > 0:
+                    cache[key] = (started, flight.result)
+                    if tags is not None:
+                        entry_tags = tags(*args, **kwargs)
+                        index(key, entry_tags)
+                        # it was invalidated while we were computing it.  if
+                        # that was before we indexed it, invalidate_tags()
+                        # couldn't delete it
+                        if _invalidated_since(entry_tags, started):
+                            try:
+                                del cache[key]
+                            except KeyError:
+                                pass
+                # don't leave an old result behind for the stale windows
+                elif refresh:
+                    try:
+                        del cache[key]
+                    except KeyError:
+                        pass
+            except Exception as e:
+                stats.count("errors")
+                flight.error = e
+            finally:
+                with lock:
+                    del flights[key]
+                flight.done.set()
+
+        def refresh_in_background(key, args, kwargs):
+            flight, leader = join_flight(key)
+            if not leader:
+                return
+
+            def refresh():
+                fly(flight, key, args, kwargs, True)
+                if flight.error is not None:
+                    log.error("background refresh of %s failed", fn.__name__,
+                              exc_info=flight.error)
+            spawn(refresh)
 
         @wraps(fn)
         def wrapper2(*args, **kwargs):
-            # extract the arg names and values to use in our memoize key
-            to_use = helpers._extract_args(sig.args, sig.defaults, args, kwargs,
-                                           whitelist, blacklist)
+            timer = time.monotonic()
 
-            # and construct our memoize key
-            key = key_fn(to_use)
+            # construct our memoize key from the args we care about
+            key = bind(args, kwargs)
+            if key_fn is not None:
+                key = key_fn(key)
 
             now = get_now()
-            needs_refresh = True
+            age = None
+            entry_ttl = 0
+
+            if purge is not None and max_age is not None:
+                with lock:
+                    should_purge = now - state["purged"] >= max_age
+                    if should_purge:
+                        state["purged"] = now
+                if should_purge:
+                    purge(now - max_age)
 
             # we have a cached value already, let's check if it's old and needs
             # to be refreshed
-            if key in cache:
+            try:
                 inserted, res = cache[key]
-                needs_refresh = now - inserted > ttl
+                # something it depends on changed since, so it's no good, not
+                # even as a stale value
+                if tags is None:
+                    fresh = True
+                else:
+                    entry_tags = tags(*args, **kwargs)
+                    fresh = not _invalidated_since(entry_tags, inserted)
+                    # it may have been stored by an earlier process
+                    if fresh:
+                        index(key, entry_tags)
+                if fresh:
+                    age = now - inserted
+                    entry_ttl = ttl_of(res)
+            except KeyError:
+                pass
+
+            if age is not None and age <= entry_ttl:
+                stats.count("hits", time.monotonic() - timer)
+                return res
+
+            # old, but not too old.  let somebody else wait for the new value
+            if age is not None and age <= entry_ttl + swr:
+                stats.count("stale_hits")
+                refresh_in_background(key, args, kwargs)
+                return res
+
+            if age is None:
+                stats.count("misses")
 
             # if it's old, re-call the decorated function and re-cache the
-            # result with a new timestamp
-            if needs_refresh:
-                res = fn(*args, **kwargs)
-                cache[key] = (now, res)
+            # result with a new timestamp.  unless somebody else is doing that
+            # already, then we wait for them
+            flight, leader = join_flight(key)
+            if leader:
+                fly(flight, key, args, kwargs, age is not None)
+
+            try:
+                return flight.wait()
+            except Exception:
+                if age is not None and age <= entry_ttl + sie:
+                    log.warning("refreshing %s failed, using a stale value",
+                                fn.__name__, exc_info=True)
+                    stats.count("stale_hits")
+                    return res
+                raise
+
+        def invalidate(*args, **kwargs):
+            """ forgets the cached result for these arguments.  returns
+            whether there was one """
+            key = bind(args, kwargs)
+            if key_fn is not None:
+                key = key_fn(key)
+            try:
+                del cache[key]
+                return True
+            except KeyError:
+                return False
+
+        wrapper2.stats = lambda: dict(stats.as_dict(cache), ttl=ttl)
+        wrapper2.invalidate = invalidate
+        wrapper2.drop_tagged = drop_tagged
+        wrapper2.clear = cache.clear
+        wrapper2.cache = cache
 
-            return res
+        with _registry_lock:
+            _registry[fn.__module__ + "." + fn.__qualname__] = wrapper2
         return wrapper2
 
     return wrapper
@@ -1,5 +1,6 @@
 import re
-import json
+import inspect
+import hashlib
 
 
 def _time_code_to_seconds(code):
@@ -25,43 +26,70 @@ def _time_code_to_seconds(code):
     return seconds
 
 
-def _extract_args(sig_args, sig_defaults, args, kwargs, whitelist, blacklist):
-    """ a memoize helper that takes values from a function's signature, the args
-    and kwargs it was called with, and a whitelist and blacklist.  using those
-    pieces, we return a mapping of arg name and values that the whitelist and
-    blacklist allow for.  this is used when we only want to a subset of a
-    function's arguments for memoizing """
-
-    # this block creates our mapping from arg name to arg value.  once
-    # we have that, we can start filtering out the args by name using
-    # the whitelist or blacklist
-    all_args = dict(zip(sig_args, args))
-    all_args.update(kwargs)
-    if sig_defaults:
-        for i, defl in enumerate(sig_defaults):
-            name = sig_args[-(i + 1)]
-            all_args[name] = defl
-
-    # now that we have our mapping of arg name to value, filter through it using
-    # the whitelist or blacklist, if provided
-    to_use = {}
-    if whitelist is not None:
-        for key in whitelist:
-            val = all_args[key]
-            to_use[key] = val
-
-    elif blacklist is not None:
-        for key, val in all_args.items():
-            if key not in blacklist:
-                to_use[key] = val
-
-    else:
-        to_use = all_args
-
-    return to_use
-
-
-def _json_keyify(args):
-    """ converts arguments into a deterministic key used for memoizing """
-    args = tuple(sorted(args.items(), key=lambda e: e[0]))
-    return json.dumps(args)
+def _make_binder(fn, whitelist=None, blacklist=None):
+    """ looks at a function's signature once, and returns a function that turns
+    the args and kwargs of a call into a hashable key.  the key is a tuple of
+    the values of the arguments that the whitelist or blacklist allow for, in
+    the order of the signature, with defaults filled in for the ones that
+    weren't passed.  this is used when we only want to a subset of a function's
+    arguments for memoizing """
+    params = inspect.signature(fn).parameters.values()
+    named = [p for p in params if p.kind in (p.POSITIONAL_ONLY,
+                                             p.POSITIONAL_OR_KEYWORD,
+                                             p.KEYWORD_ONLY)]
+    names = [p.name for p in named]
+    positional = [p.name for p in named if p.kind != p.KEYWORD_ONLY]
+    has_varargs = any(p.kind == p.VAR_POSITIONAL for p in params)
+    has_varkw = any(p.kind == p.VAR_KEYWORD for p in params)
+
+    def allowed(name):
+        if whitelist is not None:
+            return name in whitelist
+        if blacklist is not None:
+            return name not in blacklist
+        return True
+
+    # (name, position or None, default or _MISSING) for every arg in the key
+    used = tuple((p.name,
+                  positional.index(p.name) if p.name in positional else None,
+                  p.default if p.default is not p.empty else _MISSING)
+                 for p in named if allowed(p.name))
+    num_positional = len(positional)
+    names = frozenset(names)
+
+    def bind(args, kwargs):
+        key = []
+        num_args = len(args)
+        for name, i, default in used:
+            if i is not None and i < num_args:
+                key.append(args[i])
+            else:
+                key.append(kwargs.get(name, default))
+
+        # anything that doesn't have a name in the signature goes at the end
+        if has_varargs and whitelist is None:
+            key.append(tuple(args[num_positional:]))
+        if has_varkw:
+            extra = tuple(sorted((k, v) for k, v in kwargs.items()
+                                 if k not in names and allowed(k)))
+            key.append(extra)
+        return tuple(key)
+
+    return bind
+
+
+class _Missing(object):
+    """ stands in for arguments that weren't passed and have no default """
+    def __repr__(self):
+        return "<missing>"
+
+
+_MISSING = _Missing()
+
+
+def digest_key(key):
+    """ turns a key from a binder into a short string that stays the same across
+    processes, for backends that persist their keys.  the reprs of the basic
+    types we memoize on (strings, numbers, tuples...) don't change between
+    runs, unlike their hashes """
+    return hashlib.sha1(repr(key).encode("utf8")).hexdigest()
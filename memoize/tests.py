@@ -1,7 +1,17 @@
+import os
+import json
 import time
+import shutil
+import threading
+import tempfile
 import unittest
-from decorator import memoize
-from helpers import _time_code_to_seconds, _extract_args
+from unittest import mock
+from os.path import join, exists
+
+from memoize.decorator import memoize, registry, invalidate_tags, snapshot, restore
+from memoize.helpers import _time_code_to_seconds, _make_binder, digest_key
+from memoize import backends, decorator
+from memoize.backends import sqlite_backend
 
 
 class TestsTimeCode(unittest.TestCase):
@@ -13,25 +23,39 @@ class TestsTimeCode(unittest.TestCase):
         self.assertRaises(ValueError, fn, "abc")
 
 
-class TestExtractArgs(unittest.TestCase):
+class TestBinder(unittest.TestCase):
+    def fn(self, a, b, c, d="default", **kwargs):
+        pass
+
     def test_basic(self):
-        fn = _extract_args
-        to_use = fn(["a", "b", "c", "d"], ("default",), [1, 2, 3], {"e": 4},
-                    None, None)
-        self.assertDictEqual(to_use, {"a": 1, "b": 2, "c": 3, "d": "default",
-                                      "e": 4})
+        bind = _make_binder(TestBinder.fn, None, ["self"])
+        key = bind((None, 1, 2, 3), {"e": 4})
+        self.assertEqual(key, (1, 2, 3, "default", (("e", 4),)))
+
+        # however the args were passed, the key is the same
+        self.assertEqual(bind((None, 1), {"c": 3, "b": 2, "e": 4}), key)
+
+    def test_explicit_default(self):
+        bind = _make_binder(TestBinder.fn)
+        key = bind((None, 1, 2, 3, "explicit"), {})
+        self.assertEqual(key, (None, 1, 2, 3, "explicit", ()))
+        key = bind((None, 1, 2, 3), {"d": "explicit"})
+        self.assertEqual(key, (None, 1, 2, 3, "explicit", ()))
 
     def test_whitelist(self):
-        fn = _extract_args
-        to_use = fn(["a", "b", "c", "d"], ("default",), [1, 2, 3], {"e": 4},
-                    ["b", "c"], None)
-        self.assertDictEqual(to_use, {"b": 2, "c": 3})
+        bind = _make_binder(TestBinder.fn, ["b", "c"], None)
+        self.assertEqual(bind((None, 1, 2, 3), {"e": 4}), (2, 3, ()))
 
     def test_blacklist(self):
-        fn = _extract_args
-        to_use = fn(["a", "b", "c", "d"], ("default",), [1, 2, 3], {"e": 4},
-                    None, ["b"])
-        self.assertDictEqual(to_use, {"a": 1, "c": 3, "d": "default", "e": 4})
+        bind = _make_binder(TestBinder.fn, None, ["self", "b"])
+        self.assertEqual(bind((None, 1, 2, 3), {"e": 4}),
+                         (1, 3, "default", (("e", 4),)))
+
+    def test_digest(self):
+        bind = _make_binder(TestBinder.fn, None, ["self"])
+        digest = digest_key(bind((None, 1, 2, 3), {}))
+        self.assertEqual(digest, digest_key((1, 2, 3, "default", ())))
+        self.assertNotEqual(digest, digest_key(bind((None, 1, 2, 4), {})))
 
 
 class TestMemoize(unittest.TestCase):
@@ -50,7 +74,7 @@ class TestMemoize(unittest.TestCase):
         res = fn(1, 2, 3)
         self.assertEqual(res, 6)
 
-        mkey = '[["a", 1], ["b", 2], ["c", 3]]'
+        mkey = (1, 2, 3)
         self.assertIn(mkey, self.backend)
         inserted, mvalue = self.backend[mkey]
 
@@ -62,7 +86,7 @@ class TestMemoize(unittest.TestCase):
         res = fn(4, 5, 6)
         self.assertEqual(res, 15)
 
-        mkey = '[["a", 4], ["b", 5], ["c", 6]]'
+        mkey = (4, 5, 6)
         self.assertIn(mkey, self.backend)
         inserted, mvalue = self.backend[mkey]
 
@@ -119,7 +143,7 @@ class TestMemoize(unittest.TestCase):
             state["counter"] += 1
             return c
 
-        mkey = '[["a", 1], ["b", 2], ["c", 3]]'
+        mkey = (1, 2, 3)
 
         now = time.time()
         res = fn(1, 2, 3)
@@ -140,5 +164,578 @@ class TestMemoize(unittest.TestCase):
         self.assertAlmostEqual(inserted, now + 60, delta=0.1)
 
 
+class TestJSONBackend(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.fpath = join(self.dir, "cache")
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def read(self):
+        with open(self.fpath) as h:
+            return json.load(h)
+
+    def test_write_through(self):
+        cache = backends.JSONBackend(self.fpath)
+        cache["a"] = (1, 2)
+        self.assertEqual(self.read(), {"a": [1, 2]})
+
+        # and it loads again
+        cache = backends.JSONBackend(self.fpath)
+        self.assertEqual(cache["a"], [1, 2])
+
+    def test_write_behind_flush_every(self):
+        cache = backends.JSONBackend(self.fpath, write_behind=True,
+                                     flush_interval=60, flush_every=3)
+        cache["a"] = 1
+        cache["b"] = 2
+        self.assertFalse(exists(self.fpath))
+        self.assertEqual(cache.dirty, 2)
+        self.assertEqual(cache["b"], 2)
+
+        cache["c"] = 3
+        self.assertEqual(self.read(), {"a": 1, "b": 2, "c": 3})
+        self.assertEqual(cache.dirty, 0)
+
+    def test_write_behind_timer(self):
+        cache = backends.JSONBackend(self.fpath, write_behind=True,
+                                     flush_interval=0.05)
+        cache["a"] = 1
+        time.sleep(0.5)
+        self.assertEqual(self.read(), {"a": 1})
+
+    def test_flush_all(self):
+        cache = backends.JSONBackend(self.fpath, write_behind=True,
+                                     flush_interval=60)
+        cache["a"] = 1
+        backends.flush_all()
+        self.assertEqual(self.read(), {"a": 1})
+
+        # nothing to do, so the file isn't rewritten
+        os.remove(self.fpath)
+        cache.flush()
+        self.assertFalse(exists(self.fpath))
+
+
+class TestLogBackend(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.fpath = join(self.dir, "cache.log")
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def lines(self):
+        with open(self.fpath) as h:
+            return h.readlines()
+
+    def test_appends(self):
+        cache = backends.LogBackend(self.fpath)
+        cache["a"] = [1, "x"]
+        cache["b"] = [1, "y"]
+        cache["a"] = [2, "z"]
+        self.assertEqual(len(self.lines()), 3)
+        cache.close()
+
+        # later lines win
+        cache = backends.LogBackend(self.fpath)
+        self.assertEqual(cache["a"], [2, "z"])
+        self.assertEqual(len(cache), 2)
+        cache.close()
+
+    def test_torn_record(self):
+        cache = backends.LogBackend(self.fpath)
+        cache["a"] = [1, "x"]
+        cache.close()
+        with open(self.fpath, "a") as h:
+            h.write('["b", [1, "y')
+
+        cache = backends.LogBackend(self.fpath)
+        self.assertIn("a", cache)
+        self.assertNotIn("b", cache)
+
+        # the torn line was cut off, so new records are readable
+        cache["c"] = [1, "z"]
+        cache.close()
+        cache = backends.LogBackend(self.fpath)
+        self.assertIn("c", cache)
+        cache.close()
+
+    def test_compaction(self):
+        cache = backends.LogBackend(self.fpath, compact_min=10, compact_ratio=2)
+        for i in range(10):
+            cache["a"] = [i, i]
+        cache.close()
+
+        self.assertEqual(cache.records, 1)
+        self.assertEqual(self.lines(), ['["a", [9, 9]]\n'])
+
+    def test_purge(self):
+        cache = backends.LogBackend(self.fpath)
+        cache["a"] = [1, "x"]
+        cache["b"] = [5, "y"]
+        self.assertEqual(cache.purge(3), 1)
+        self.assertNotIn("a", cache)
+        self.assertIn("b", cache)
+        cache.compact()
+        cache.close()
+        self.assertEqual(self.lines(), ['["b", [5, "y"]]\n'])
+
+    def test_decorator_purges(self):
+        cache = backends.LogBackend(self.fpath)
+        state = {"now": 0}
+
+        @memoize(10, backend=lambda fn: cache, get_now=lambda: state["now"],
+                 key_fn=digest_key)
+        def fn(a):
+            return a
+
+        fn(1)
+        state["now"] = 5
+        fn(2)
+        state["now"] = 12
+        fn(2)
+
+        # the entry for 1 expired and was purged, 2 is still fresh
+        self.assertEqual(len(cache), 1)
+        cache.close()
+
+
+class TestSQLiteBackend(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = join(self.dir, "cache.sqlite")
+        self.cache = backends.SQLiteBackend(self.path, "mod.fn")
+
+    def tearDown(self):
+        self.cache.close()
+        shutil.rmtree(self.dir)
+
+    def test_basic(self):
+        self.assertNotIn("a", self.cache)
+        self.assertRaises(KeyError, lambda: self.cache["a"])
+
+        self.cache["a"] = (1, {"x": [1, 2]})
+        self.cache["a"] = (2, {"x": [3]})
+        self.assertIn("a", self.cache)
+        self.assertEqual(self.cache["a"], (2, {"x": [3]}))
+        self.assertEqual(len(self.cache), 1)
+
+    def test_tables(self):
+        other = backends.SQLiteBackend(self.path, "mod.other")
+        other["a"] = (1, 2)
+        self.assertNotIn("a", self.cache)
+
+        # and it's all still there when we reopen it
+        other.close()
+        other = backends.SQLiteBackend(self.path, "mod.other")
+        self.assertEqual(other["a"], (1, 2))
+        other.close()
+
+    def test_purge(self):
+        for i in range(10):
+            self.cache[str(i)] = (i, i)
+        self.assertEqual(self.cache.purge(5), 5)
+        self.assertEqual(len(self.cache), 5)
+        self.assertNotIn("4", self.cache)
+        self.assertIn("5", self.cache)
+
+    def test_decorator(self):
+        @memoize("1m", backend=sqlite_backend(self.path), key_fn=digest_key)
+        def fn(a, b):
+            return [a, b]
+
+        self.assertEqual(fn(1, 2), [1, 2])
+        self.assertEqual(fn(1, 2), [1, 2])
+        table = backends.SQLiteBackend(self.path, __name__ + ".fn")
+        self.assertEqual(len(table), 1)
+        table.close()
+
+
+class TestLRUBackend(unittest.TestCase):
+    def test_max_entries(self):
+        cache = backends.LRUBackend(max_entries=2)
+        cache["a"] = (1, "a")
+        cache["b"] = (1, "b")
+        cache["a"]
+        cache["c"] = (1, "c")
+
+        self.assertIn("a", cache)
+        self.assertNotIn("b", cache)
+        self.assertEqual(cache.evictions, 1)
+
+    def test_max_bytes(self):
+        cache = backends.LRUBackend(max_bytes=100, sizeof=lambda k, v: 40)
+        for k in "abc":
+            cache[k] = (1, k)
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.bytes, 80)
+        self.assertNotIn("a", cache)
+
+    def test_purge(self):
+        cache = backends.LRUBackend()
+        cache["a"] = (1, "a")
+        cache["b"] = (5, "b")
+        self.assertEqual(cache.purge(3), 1)
+        self.assertEqual(cache.stats()["expired"], 1)
+        self.assertNotIn("a", cache)
+
+    def test_parent(self):
+        parent = {"a": (1, "a")}
+        cache = backends.LRUBackend(max_entries=1, parent=parent)
+
+        # misses are answered by the parent, then kept
+        self.assertEqual(cache["a"], (1, "a"))
+        self.assertEqual(cache.misses, 1)
+        self.assertEqual(cache["a"], (1, "a"))
+        self.assertEqual(cache.hits, 1)
+
+        # writes go to both, and evictions only affect the memory tier
+        cache["b"] = (2, "b")
+        self.assertEqual(parent["b"], (2, "b"))
+        self.assertEqual(len(cache), 1)
+        self.assertIn("a", cache)
+        self.assertRaises(KeyError, lambda: cache["c"])
+
+    def test_dump_load(self):
+        parent = {}
+        cache = backends.LRUBackend(max_entries=2, parent=parent)
+        cache["a"] = (1, "a")
+        cache["b"] = (2, "b")
+
+        loaded = backends.LRUBackend(max_entries=2, parent={})
+        loaded.load(cache.dump())
+        self.assertEqual(loaded["a"], (1, "a"))
+        self.assertEqual(loaded["b"], (2, "b"))
+        self.assertEqual(loaded.misses, 0)
+
+    def test_json_purge(self):
+        d = tempfile.mkdtemp()
+        try:
+            cache = backends.JSONBackend(join(d, "cache"))
+            cache["a"] = (1, "a")
+            cache["b"] = (5, "b")
+            self.assertEqual(cache.purge(3), 1)
+            self.assertEqual(backends.JSONBackend(join(d, "cache"))._data, {"b": [5, "b"]})
+        finally:
+            shutil.rmtree(d)
+
+
+class TestStale(unittest.TestCase):
+    def setUp(self):
+        self.now = 0
+        self.calls = 0
+        self.fail = False
+        self.spawned = []
+
+    def fn(self, a):
+        self.calls += 1
+        if self.fail:
+            raise IOError("github is down")
+        return self.calls
+
+    def memoize(self, **kwargs):
+        return memoize(10, get_now=lambda: self.now, spawn=self.spawned.append,
+                       **kwargs)(self.fn)
+
+    def test_stale_while_revalidate(self):
+        fn = self.memoize(stale_while_revalidate=10)
+        self.assertEqual(fn(1), 1)
+
+        # stale, so we get the old value, and one refresh is started
+        self.now = 15
+        self.assertEqual(fn(1), 1)
+        self.assertEqual(fn(1), 1)
+        self.assertEqual(len(self.spawned), 1)
+
+        self.spawned.pop()()
+        self.assertEqual(fn(1), 2)
+
+        # too stale, so we wait for the new value
+        self.now = 40
+        self.assertEqual(fn(1), 3)
+        self.assertEqual(self.spawned, [])
+
+    def test_failed_refresh(self):
+        fn = self.memoize(stale_while_revalidate=10)
+        fn(1)
+        self.now = 15
+        self.fail = True
+        fn(1)
+        self.spawned.pop()()
+
+        # the next call can try again
+        self.assertEqual(fn(1), 1)
+        self.assertEqual(len(self.spawned), 1)
+
+    def test_stale_if_error(self):
+        fn = self.memoize(stale_if_error=10)
+        self.assertEqual(fn(1), 1)
+
+        self.now = 15
+        self.fail = True
+        self.assertEqual(fn(1), 1)
+
+        self.now = 25
+        self.assertRaises(IOError, fn, 1)
+
+
+class TestSingleFlight(unittest.TestCase):
+    def test_concurrent_misses(self):
+        calls = []
+        release = threading.Event()
+
+        @memoize("1m")
+        def fn(a):
+            calls.append(a)
+            release.wait()
+            if a == "bad":
+                raise ValueError(a)
+            return a * 2
+
+        results = []
+        errors = []
+
+        def call(a):
+            try:
+                results.append(fn(a))
+            except ValueError as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=call, args=(a,))
+                   for a in [1] * 5 + ["bad"] * 3]
+        for thread in threads:
+            thread.start()
+        time.sleep(0.1)
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        # one call per key, and everybody got its result
+        self.assertEqual(sorted(calls, key=str), [1, "bad"])
+        self.assertEqual(results, [2] * 5)
+        self.assertEqual(len(errors), 3)
+
+        # failures aren't cached
+        fn("bad2")
+        self.assertRaises(ValueError, fn, "bad")
+
+
+class TestIntrospection(unittest.TestCase):
+    def test_stats(self):
+        state = {"now": 0}
+
+        # a dict never purges, so fn(1) expires instead of disappearing
+        @memoize(10, get_now=lambda: state["now"], backend=lambda fn: {})
+        def fn(a):
+            if a < 0:
+                raise ValueError(a)
+            return a
+
+        fn(1)
+        fn(1)
+        fn(2)
+        state["now"] = 20
+        fn(1)
+        self.assertRaises(ValueError, fn, -1)
+
+        stats = fn.stats()
+        self.assertEqual(stats["hits"], 1)
+        self.assertEqual(stats["misses"], 3)
+        self.assertEqual(stats["refreshes"], 1)
+        self.assertEqual(stats["errors"], 1)
+        self.assertEqual(stats["entries"], 2)
+        self.assertEqual(stats["ttl"], 10)
+
+        name = __name__ + ".TestIntrospection.test_stats.<locals>.fn"
+        self.assertIs(registry()[name], fn)
+
+    def test_invalidate(self):
+        calls = []
+
+        @memoize("1m")
+        def fn(a, b=2):
+            calls.append(a)
+            return a
+
+        fn(1)
+        fn(2)
+        self.assertTrue(fn.invalidate(1, b=2))
+        self.assertFalse(fn.invalidate(1))
+        fn(1)
+        fn(2)
+        self.assertEqual(calls, [1, 2, 1])
+
+        fn.clear()
+        fn(2)
+        self.assertEqual(calls, [1, 2, 1, 2])
+
+    def test_backends_invalidate(self):
+        d = tempfile.mkdtemp()
+        try:
+            for cache in [backends.JSONBackend(join(d, "json")),
+                          backends.LogBackend(join(d, "log")),
+                          backends.SQLiteBackend(join(d, "sqlite"), "fn"),
+                          backends.LRUBackend(parent={})]:
+                cache["a"] = (1, "a")
+                cache["b"] = (1, "b")
+                del cache["a"]
+                self.assertNotIn("a", cache)
+                self.assertRaises(KeyError, cache.__delitem__, "a")
+                cache.clear()
+                self.assertNotIn("b", cache)
+                self.assertEqual(len(cache), 0)
+
+            # deletes survive a reload of the log
+            cache = backends.LogBackend(join(d, "log2"))
+            cache["a"] = (1, "a")
+            del cache["a"]
+            cache.close()
+            self.assertNotIn("a", backends.LogBackend(join(d, "log2")))
+        finally:
+            shutil.rmtree(d)
+
+    def test_persistent_tuple_keys(self):
+        """ the persistent backends store the decorator's default keys, and find
+        them again after a restart """
+        d = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, d)
+        factories = [
+            backends.json_backend(join(d, "json"), write_behind=True),
+            backends.log_backend(join(d, "log")),
+            sqlite_backend(join(d, "sqlite", "cache.db")),
+        ]
+        for factory in factories:
+            calls = []
+
+            def fn(a, b="b"):
+                calls.append(a)
+                return [a, b]
+
+            memoized = memoize("1h", backend=factory)(fn)
+            self.assertEqual(memoized(1), [1, "b"])
+            backends.flush_all()
+
+            memoized = memoize("1h", backend=factory)(fn)
+            self.assertEqual(memoized(1), [1, "b"])
+            self.assertTrue(memoized.invalidate(1))
+            self.assertEqual(calls, [1])
+            backends.flush_all()
+
+
+class TestResultTTL(unittest.TestCase):
+    def test_ttl_of_result(self):
+        state = {"now": 0}
+        calls = []
+        results = {"pending": None, "mergeable": True, "uncacheable": False}
+
+        @memoize(lambda res: {None: 10, True: "1m", False: 0}[res],
+                 get_now=lambda: state["now"], max_ttl="1m")
+        def fn(a):
+            calls.append(a)
+            return results[a]
+
+        for a in results:
+            fn(a)
+        state["now"] = 30
+        for a in results:
+            fn(a)
+
+        # None expired after 10s, True is still good, False never got cached
+        self.assertEqual(calls, ["pending", "mergeable", "uncacheable",
+                                 "pending", "uncacheable"])
+        self.assertEqual(fn.stats()["entries"], 2)
+
+    def test_purge_needs_max_ttl(self):
+        purged = []
+
+        class Backend(dict):
+            def purge(self, before):
+                purged.append(before)
+
+        fn = memoize(lambda res: 10, backend=lambda fn: Backend())(lambda a: a)
+        fn(1)
+        self.assertEqual(purged, [])
+
+        fn = memoize(lambda res: 10, backend=lambda fn: Backend(),
+                     max_ttl=10)(lambda a: a)
+        fn(1)
+        self.assertEqual(len(purged), 1)
+
+
+class TestTags(unittest.TestCase):
+    def test_invalidate_tags(self):
+        state = {"now": 100}
+        calls = []
+
+        @memoize("1h", get_now=lambda: state["now"], stale_if_error="1h",
+                 tags=lambda repo, pr: ["pr:{}#{}".format(repo, pr)])
+        def fn(repo, pr):
+            calls.append(pr)
+            return pr
+
+        fn("test-tags", 1)
+        fn("test-tags", 2)
+        invalidate_tags("pr:test-tags#1", now=150)
+
+        state["now"] = 200
+        fn("test-tags", 1)
+        fn("test-tags", 2)
+        self.assertEqual(calls, [1, 2, 1])
+
+        # entries computed after the invalidation are fine
+        fn("test-tags", 1)
+        self.assertEqual(calls, [1, 2, 1])
+
+    def test_invalidation_survives_restart(self):
+        d = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, d)
+        calls = []
+
+        def start():
+            """ memoizes our function like a freshly started process would """
+            @memoize("1h", key_fn=digest_key, backend=backends.json_backend(d),
+                     tags=lambda pr: ["pr:test-restart#{}".format(pr)])
+            def fn(pr):
+                calls.append(pr)
+                return pr
+            return fn
+
+        fn = start()
+        fn(1)
+        fn(2)
+
+        # the entries we read back from disk are the ones we invalidate
+        fn = start()
+        fn(1)
+        invalidate_tags("pr:test-restart#1")
+
+        # and the next process doesn't know about the invalidation
+        with mock.patch.dict(decorator._invalidated_tags, clear=True):
+            fn = start()
+            fn(1)
+            fn(2)
+        self.assertEqual(calls, [1, 2, 1])
+
+
+class TestSnapshot(unittest.TestCase):
+    def test_round_trip(self):
+        calls = []
+
+        @memoize("1h")
+        def fn(a):
+            calls.append(a)
+            return a
+
+        fn(1)
+        saved = snapshot()
+        fn.clear()
+
+        restore(saved)
+        fn(1)
+        self.assertEqual(calls, [1])
+
+
 if __name__ == "__main__":
     unittest.main()
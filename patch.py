@@ -10,10 +10,11 @@ import inspect
 import settings
 from os.path import dirname, abspath, join
 from functools import partial
-from memoize import memoize
-from memoize.backends import json_backend
+from memoize import memoize, invalidate_tags
+from memoize.backends import json_backend, log_backend, sqlite_backend, lru_backend
 import github_api.voting
 import github_api.repos
+import github_api.hooks
 
 
 def decorate(fn, dec):
@@ -24,9 +25,41 @@ def decorate(fn, dec):
 
 
 cache_dir = join(dirname(abspath(__file__)), settings.MEMOIZE_CACHE_DIRNAME)
-api_memoize = partial(memoize, blacklist={"api"}, backend=json_backend(cache_dir))
+if settings.MEMOIZE_BACKEND == "log":
+    backend = log_backend(cache_dir)
+elif settings.MEMOIZE_BACKEND == "sqlite":
+    # the other backends keep everything in memory anyways
+    backend = lru_backend(max_entries=settings.MEMOIZE_MEMORY_ENTRIES,
+                          parent=sqlite_backend(join(cache_dir, settings.MEMOIZE_SQLITE_FILE)))
+else:
+    backend = json_backend(cache_dir, write_behind=True,
+                           flush_interval=settings.MEMOIZE_FLUSH_SECONDS,
+                           flush_every=settings.MEMOIZE_FLUSH_WRITES)
+api_memoize = partial(memoize, blacklist={"api"}, backend=backend)
 
-# now let's memoize some very frequent api calls that don't change often
-decorate(github_api.voting.get_vote_weight, api_memoize("1d"))
-decorate(github_api.repos.get_num_watchers, api_memoize("10m"))
-decorate(github_api.prs.get_is_mergeable, api_memoize("2m"))
+
+def mergeable_ttl(mergeable):
+    """ None means github is still working out if a pr is mergeable, which
+    usually takes seconds """
+    return "10s" if mergeable is None else "2m"
+
+
+# now let's memoize some very frequent api calls that don't change often.  our
+# watcher count being a little out of date is fine, so it gets refreshed in the
+# background, and survives github having a bad day
+decorate(github_api.repos.get_num_watchers,
+         api_memoize("10m", stale_while_revalidate="1h", stale_if_error="1d"))
+# voters' account ages never change, so we keep them for good
+github_api.voting.voter_index.attach(join(cache_dir, settings.VOTER_INDEX_FILE))
+
+# our own merges, closes and label changes throw out what we've cached about the
+# prs (and for merges, the repo) they touched
+github_api.hooks.on_mutation(invalidate_tags)
+
+
+def pr_tags(api, urn, pr_num):
+    return [github_api.hooks.pr_tag(urn, pr_num), github_api.hooks.repo_tag(urn)]
+
+
+decorate(github_api.prs.get_is_mergeable,
+         api_memoize(mergeable_ttl, max_ttl="2m", tags=pr_tags))
@@ -69,6 +69,23 @@ DEFAULT_PAGINATION = 100
 # be stored
 MEMOIZE_CACHE_DIRNAME = "api_cache"
 
+# memoize cache files are rewritten at most this often, or after this many new
+# entries, instead of after every new entry.  they're also written out before
+# we exit or restart
+MEMOIZE_FLUSH_SECONDS = 30
+MEMOIZE_FLUSH_WRITES = 100
+
+# how memoize caches are stored.  "json" rewrites a whole json file per
+# function, "log" appends every new entry to a log that gets compacted now and
+# then, and "sqlite" keeps them all in one sqlite database (MEMOIZE_SQLITE_FILE,
+# inside the cache directory)
+MEMOIZE_BACKEND = "json"
+MEMOIZE_SQLITE_FILE = "cache.sqlite"
+
+# the sqlite backend sits behind an in-memory cache of at most this many
+# entries per function, so that hot entries never touch the disk
+MEMOIZE_MEMORY_ENTRIES = 10000
+
 # used for calculating how long our voting window is
 TIMEZONE = "US/Pacific"
 
@@ -82,3 +99,79 @@ with open("description.txt", "r") as h:
 PR_STALE_HOURS = 36
 
 API_COOLDOWN_RESET_PADDING = 30
+
+# the number of keep-alive connections the github api session will hold open.
+# the api object lives for the whole process and is shared by all cron jobs
+API_POOL_SIZE = 10
+
+# how many GET responses we remember the ETag/Last-Modified for, so we can ask
+# github whether they've changed.  unchanged responses are free
+API_CONDITIONAL_CACHE_SIZE = 1000
+
+# we keep the comments of this many prs (and our repo) around, and only ask
+# github for the ones that changed since we last looked.  deleted comments only
+# show up when we fetch all of a pr's comments again, every so often
+API_COMMENT_STORE_SCOPES = 1000
+API_COMMENTS_FULL_SYNC_SECONDS = 60 * 10
+
+# when spending our api budget at the rate of the last API_SPEND_WINDOW_SECONDS
+# would dip into the reserves below before github resets it, we spread what's
+# left evenly over the time until the reset, but this many requests may still
+# go out back-to-back.  the window is as long as github's, so that a single busy
+# poll (like our first one after a cold start) doesn't count as our rate
+API_BURST = 100
+API_SPEND_WINDOW_SECONDS = 60 * 60
+
+# the part of our remaining api budget that normal (read) requests and cosmetic
+# (status, label) requests may not touch.  when the budget dips below these,
+# normal requests wait for the reset and cosmetic requests are dropped, so that
+# merges and closes always have requests left.  i've seen github's api fail
+# with a 403 when we had 5 requests remaining, so leave some slack
+API_NORMAL_RESERVE = 30
+API_COSMETIC_RESERVE = 500
+
+# how many threads collect votes for ready PRs at the same time.  merging and
+# closing PRs always happens one at a time
+PULL_REQUEST_POLLING_WORKERS = 8
+
+# fetch the open PRs, with their comments, reactions, reviews and voter ages,
+# through a few batched graphql queries instead of several rest calls per PR
+USE_GRAPHQL = False
+
+# how many PRs to fetch per graphql query
+GRAPHQL_PR_BATCH = 25
+
+# how many voters we don't know yet to fetch per graphql query
+GRAPHQL_USER_BATCH = 50
+
+# when every voter's account was created is kept in this file, in the memoize
+# cache directory
+VOTER_INDEX_FILE = "voter_index.json"
+
+# per-endpoint api statistics are dumped to this file (relative to the project
+# directory) every API_STATS_INTERVAL_SECONDS
+API_STATS_FILE = "api_stats.json"
+API_STATS_INTERVAL_SECONDS = 60 * 5
+
+# and so are the statistics of our memoize caches
+MEMOIZE_STATS_FILE = "memoize_stats.json"
+
+# when we restart after a merge, our in-process caches and rate limit state are
+# carried over in this file (relative to the project directory).  if the
+# restart takes longer than WARM_CACHE_MAX_AGE_SECONDS, we start cold instead
+WARM_CACHE_FILE = "warm_cache.pickle"
+WARM_CACHE_MAX_AGE_SECONDS = 60 * 10
+
+# how many rate limit readings to keep, to see our headroom over time
+API_STATS_HEADROOM_SAMPLES = 1000
+
+# transient api failures (5xx, secondary rate limits, dropped connections) are
+# retried this many times in total, with exponential backoff and jitter
+API_RETRY_ATTEMPTS = 4
+API_RETRY_BASE_SECONDS = 1
+API_RETRY_MAX_SECONDS = 60
+
+# after this many consecutive failures, an endpoint's circuit opens and
+# requests to it fail fast for API_CIRCUIT_COOLDOWN_SECONDS
+API_CIRCUIT_THRESHOLD = 5
+API_CIRCUIT_COOLDOWN_SECONDS = 60
@@ -0,0 +1,144 @@
+import os
+import time
+import shutil
+import tempfile
+import importlib
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch, MagicMock
+
+import requests
+
+import settings
+from github_api.records import PullRequest
+
+# the cron package exports the function under the module's name
+poll = importlib.import_module("cron.poll_pull_requests")
+
+
+def make_pr(number):
+    return PullRequest(number=number, title="pr", body="", head_sha="abc",
+                       author="someone")
+
+
+class TestPollPullRequests(unittest.TestCase):
+    def setUp(self):
+        self.api = MagicMock()
+        self.api.limiter.is_throttled.return_value = False
+        self.prs = [make_pr(1), make_pr(2), make_pr(3)]
+
+        patches = [
+            patch("github_api.prs.get_ready_prs", return_value=iter(self.prs)),
+            patch("github_api.voting.voter_index"),
+            patch.object(poll.memoize, "flush_all"),
+            patch.object(poll.warm_cache, "save"),
+            patch.object(poll.os, "execl"),
+        ]
+        for p in patches:
+            p.start()
+            self.addCleanup(p.stop)
+
+    def test_acts_serially_in_order(self):
+        """ the reads happen concurrently, but prs are acted on one at a time,
+        in the order github listed them, after all of the reads are done """
+        events = []
+        acting = threading.Lock()
+
+        def get_pr_state(api, pr, snapshot=None, known_users=None):
+            # the first pr's reads finish last
+            time.sleep(0.05 * (len(self.prs) - pr.number))
+            events.append(("read", pr.number))
+            return ({}, 1, 1, 0)
+
+        def handle_pr(api, pr, *state):
+            self.assertTrue(acting.acquire(blocking=False))
+            try:
+                events.append(("act", pr.number))
+            finally:
+                acting.release()
+            return False
+
+        with patch.object(poll, "get_pr_state", side_effect=get_pr_state), \
+                patch.object(poll, "handle_pr", side_effect=handle_pr):
+            poll.poll_pull_requests(self.api)
+
+        self.assertEqual(events[3:], [("act", 1), ("act", 2), ("act", 3)])
+        self.assertEqual(sorted(events[:3]), [("read", 1), ("read", 2), ("read", 3)])
+        poll.os.execl.assert_not_called()
+
+    def test_failures_skip_one_pr(self):
+        """ a pr whose votes we can't collect, or that we fail to act on, doesn't
+        stop us from merging the others """
+        def get_pr_state(api, pr, snapshot=None, known_users=None):
+            if pr.number == 2:
+                raise requests.ConnectionError()
+            return ({}, 1, 1, 0)
+
+        def handle_pr(api, pr, *state):
+            if pr.number == 1:
+                raise requests.HTTPError(response=MagicMock(status_code=500))
+            return True
+
+        with patch.object(poll, "get_pr_state", side_effect=get_pr_state), \
+                patch.object(poll, "handle_pr", side_effect=handle_pr) as handle, \
+                self.assertLogs("chaosbot", "ERROR") as logs:
+            poll.poll_pull_requests(self.api)
+
+        self.assertEqual([r.getMessage() for r in logs.records], [
+            "failed to collect votes for PR #2, skipping",
+            "failed to process PR #1, skipping",
+        ])
+        self.assertEqual([c[0][1].number for c in handle.call_args_list], [1, 3])
+        poll.os.execl.assert_called_once()
+
+    def test_throttled_single_worker(self):
+        self.api.limiter.is_throttled.return_value = True
+        with patch.object(poll, "ThreadPoolExecutor", wraps=ThreadPoolExecutor) as pool, \
+                patch.object(poll, "get_pr_state", return_value=({}, 1, 1, 0)), \
+                patch.object(poll, "handle_pr", return_value=False):
+            poll.poll_pull_requests(self.api)
+        pool.assert_called_once_with(max_workers=1)
+
+        self.api.limiter.is_throttled.return_value = False
+        gh_prs = poll.gh.prs
+        gh_prs.get_ready_prs.return_value = iter(self.prs)
+        with patch.object(poll, "ThreadPoolExecutor", wraps=ThreadPoolExecutor) as pool, \
+                patch.object(poll, "get_pr_state", return_value=({}, 1, 1, 0)), \
+                patch.object(poll, "handle_pr", return_value=False):
+            poll.poll_pull_requests(self.api)
+        pool.assert_called_once_with(max_workers=settings.PULL_REQUEST_POLLING_WORKERS)
+
+    def test_merged_but_not_wrapped_up(self):
+        """ once a pr is merged, we restart onto it even if commenting on it,
+        labeling it or following its author fails """
+        # handle_pr keeps a voting record in server/
+        cwd = os.getcwd()
+        d = tempfile.mkdtemp()
+        os.mkdir(os.path.join(d, "server"))
+        os.chdir(d)
+        self.addCleanup(shutil.rmtree, d)
+        self.addCleanup(os.chdir, cwd)
+
+        gh_prs = poll.gh.prs
+        gh_prs.get_ready_prs.return_value = iter(self.prs[:1])
+        with patch.object(poll, "get_pr_state", return_value=({"someone": 1}, 1, 1, 0)), \
+                patch.object(gh_prs, "is_pr_in_voting_window", return_value=True), \
+                patch.object(gh_prs, "post_accepted_status"), \
+                patch.object(gh_prs, "merge_pr", return_value="sha") as merge_pr, \
+                patch.object(poll.gh.comments, "leave_accept_comment",
+                             side_effect=requests.ConnectionError()), \
+                self.assertLogs("chaosbot", "ERROR") as logs:
+            poll.poll_pull_requests(self.api)
+
+        self.assertEqual([r.getMessage() for r in logs.records],
+                         ["merged PR 1, but couldn't wrap it up"])
+
+        merge_pr.assert_called_once()
+        poll.memoize.flush_all.assert_called_once_with()
+        poll.warm_cache.save.assert_called_once_with(self.api)
+        poll.os.execl.assert_called_once()
+
+
+if __name__ == "__main__":
+    unittest.main()
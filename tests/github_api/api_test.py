@@ -0,0 +1,85 @@
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import MagicMock
+
+from github_api import API, parse_links
+
+
+def create_mock_response(data, next_url=None):
+    resp = MagicMock()
+    resp.status_code = 200
+    resp.headers = {}
+    if next_url:
+        resp.headers["Link"] = '<{}>; rel="next", <last>; rel="last"'.format(next_url)
+    resp.json.return_value = data
+    return resp
+
+
+class TestPagination(unittest.TestCase):
+    def setUp(self):
+        self.api = API("user", "pat")
+        self.api._session.request = MagicMock()
+        self.api._session.request.side_effect = [
+            create_mock_response([1, 2], "https://api.github.com/things?page=2"),
+            create_mock_response([3, 4], "https://api.github.com/things?page=3"),
+            create_mock_response([5]),
+        ]
+
+    def test_follows_next(self):
+        items = list(self.api.paginate("/things", params={"per_page": 2}))
+        self.assertEqual(items, [1, 2, 3, 4, 5])
+
+        # the params are only sent on the first page, after that they're part
+        # of the next url
+        calls = self.api._session.request.call_args_list
+        self.assertEqual(calls[0][1]["params"], {"per_page": 2})
+        self.assertEqual(calls[1][0][1], "https://api.github.com/things?page=2")
+        self.assertIsNone(calls[1][1]["params"])
+
+    def test_lazy(self):
+        items = self.api.paginate("/things")
+        self.assertEqual(next(items), 1)
+        self.assertEqual(next(items), 2)
+        self.assertEqual(self.api._session.request.call_count, 1)
+
+        self.assertEqual(next(items), 3)
+        self.assertEqual(self.api._session.request.call_count, 2)
+
+    def test_max_pages(self):
+        items = list(self.api.paginate("/things", max_pages=2))
+        self.assertEqual(items, [1, 2, 3, 4])
+        self.assertEqual(self.api._session.request.call_count, 2)
+
+
+class TestConnections(unittest.TestCase):
+    def setUp(self):
+        self.api = API("user", "pat", pool_size=4)
+        self.api._session.request = MagicMock(
+            side_effect=lambda *args, **kwargs: create_mock_response({}))
+
+    def test_pooled_session(self):
+        """ every request goes through the one session and its pool """
+        adapter = self.api._session.get_adapter(self.api.BASE_URL)
+        self.assertIs(adapter, self.api._adapter)
+        self.assertEqual(adapter._pool_maxsize, 4)
+
+        self.api("get", "/things")
+        self.api("get", "/other/things")
+        self.assertEqual(self.api._session.request.call_count, 2)
+
+    def test_connection_stats(self):
+        """ requests from many threads at once are all counted """
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            list(pool.map(lambda i: self.api("get", "/things/{}".format(i)),
+                          range(400)))
+
+        # our mocked session never opens a connection
+        self.assertEqual(self.api.connection_stats(),
+                         {"requests": 400, "connections": 0, "reused": 400})
+
+
+class TestParseLinks(unittest.TestCase):
+    def test_basic(self):
+        links = parse_links('<https://a?page=2>; rel="next", <https://a?page=9>; rel="last"')
+        self.assertEqual(links, {"next": "https://a?page=2", "last": "https://a?page=9"})
+        self.assertEqual(parse_links(None), {})
@@ -0,0 +1,75 @@
+import unittest
+from unittest.mock import MagicMock
+
+from github_api.comment_store import CommentStore
+from github_api.records import Comment
+
+
+def comment(id, updated_at, body=""):
+    return Comment(id=id, author="a", body=body, created_at=str(id),
+                   updated_at=updated_at)
+
+
+class TestCommentStore(unittest.TestCase):
+    def setUp(self):
+        self.now = 1000
+        self.store = CommentStore(2, 60, get_now=lambda: self.now)
+        self.api = MagicMock()
+
+    def fetch(self, *fetched, scope="pr", full=False):
+        self.api.paginate.return_value = iter(fetched)
+        comments = self.store.fetch(self.api, "/comments", scope, params={"per_page": 100},
+                                    full=full)
+        return comments, self.api.paginate.call_args[1]["params"]
+
+    def test_incremental(self):
+        comments, params = self.fetch(comment(2, "b"), comment(1, "a"))
+        self.assertEqual([c.id for c in comments], [1, 2])
+        self.assertNotIn("since", params)
+
+        # only what changed since our high-water mark is fetched, and merged
+        # with what we have
+        comments, params = self.fetch(comment(2, "c", "edited"), comment(3, "c"))
+        self.assertEqual(params["since"], "b")
+        self.assertEqual([c.id for c in comments], [1, 2, 3])
+        self.assertEqual(comments[1].body, "edited")
+
+        comments, params = self.fetch()
+        self.assertEqual(params["since"], "c")
+        self.assertEqual(len(comments), 3)
+
+    def test_full_sync(self):
+        self.fetch(comment(1, "a"), comment(2, "b"))
+
+        # a full sync drops the comments that were deleted
+        self.now += 60
+        comments, params = self.fetch(comment(2, "b"))
+        self.assertNotIn("since", params)
+        self.assertEqual([c.id for c in comments], [2])
+        self.assertEqual(self.store.stats()["full_syncs"], 2)
+
+    def test_forced_full_sync(self):
+        self.fetch(comment(1, "a"), comment(2, "b"))
+        comments, params = self.fetch(comment(2, "b"), full=True)
+        self.assertNotIn("since", params)
+        self.assertEqual([c.id for c in comments], [2])
+
+    def test_scopes(self):
+        self.fetch(comment(1, "a"), scope="pr1")
+        self.fetch(comment(2, "a"), scope="pr2")
+        self.fetch(comment(3, "a"), scope="pr3")
+        self.assertEqual(len(self.store), 2)
+
+        # pr1 was evicted, so we start over with it
+        _, params = self.fetch(comment(1, "a"), scope="pr1")
+        self.assertNotIn("since", params)
+
+    def test_dump_load(self):
+        self.fetch(comment(1, "a"))
+        store = CommentStore(2, 60, get_now=lambda: self.now)
+        store.load(self.store.dump())
+        self.store = store
+
+        comments, params = self.fetch()
+        self.assertEqual(params["since"], "a")
+        self.assertEqual([c.id for c in comments], [1])
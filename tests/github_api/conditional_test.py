@@ -0,0 +1,82 @@
+import unittest
+from unittest.mock import MagicMock
+
+from github_api import API
+from github_api.conditional import ConditionalCache
+
+
+def create_mock_response(status_code, data=None, headers=None):
+    resp = MagicMock()
+    resp.status_code = status_code
+    resp.headers = headers or {}
+    resp.json.return_value = data
+    return resp
+
+
+class TestConditionalCache(unittest.TestCase):
+    def test_lru_eviction(self):
+        cache = ConditionalCache(2)
+        cache.store("a", {"ETag": "1"}, "a")
+        cache.store("b", {"ETag": "2"}, "b")
+
+        # touching "a" makes "b" the least recently used
+        cache.lookup("a")
+        cache.store("c", {"ETag": "3"}, "c")
+
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.lookup("b"), ({}, None))
+        self.assertEqual(cache.lookup("a"), ({"If-None-Match": "1"}, "a"))
+        self.assertEqual(cache.evictions, 1)
+
+    def test_no_validators(self):
+        cache = ConditionalCache(2)
+        cache.store("a", {}, "a")
+        self.assertEqual(len(cache), 0)
+
+    def test_params_in_key(self):
+        k1 = ConditionalCache.make_key("url", {"page": 1, "per_page": 100})
+        k2 = ConditionalCache.make_key("url", {"per_page": 100, "page": 1})
+        k3 = ConditionalCache.make_key("url", {"page": 2, "per_page": 100})
+        self.assertEqual(k1, k2)
+        self.assertNotEqual(k1, k3)
+
+    def test_dump_load(self):
+        cache = ConditionalCache(2)
+        cache.store("a", {"ETag": "1"}, "a")
+        cache.store("b", {"ETag": "2"}, "b")
+
+        loaded = ConditionalCache(2)
+        loaded.store("c", {"ETag": "3"}, "c")
+        loaded.load(cache.dump())
+
+        # what we load is more recent than what we had
+        self.assertEqual(len(loaded), 2)
+        self.assertEqual(loaded.lookup("c"), ({}, None))
+        self.assertEqual(loaded.lookup("a"), ({"If-None-Match": "1"}, "a"))
+
+
+class TestConditionalRequests(unittest.TestCase):
+    def test_not_modified(self):
+        api = API("user", "pat")
+        api._session.request = MagicMock()
+        api._session.request.side_effect = [
+            create_mock_response(200, [1, 2, 3], {"ETag": '"abc"'}),
+            create_mock_response(304),
+        ]
+
+        self.assertEqual(api("get", "/repos/test/blah"), [1, 2, 3])
+        self.assertEqual(api("get", "/repos/test/blah"), [1, 2, 3])
+
+        headers = api._session.request.call_args[1]["headers"]
+        self.assertEqual(headers["If-None-Match"], '"abc"')
+        self.assertEqual(api.conditional_cache.not_modified, 1)
+
+    def test_writes_are_not_conditional(self):
+        api = API("user", "pat")
+        api._session.request = MagicMock()
+        api._session.request.return_value = create_mock_response(
+            200, {}, {"ETag": '"abc"'})
+
+        api("post", "/repos/test/blah", json={})
+        self.assertNotIn("headers", api._session.request.call_args[1])
+        self.assertEqual(len(api.conditional_cache), 0)
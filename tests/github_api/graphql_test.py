@@ -0,0 +1,111 @@
+import json
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+from github_api import API, graphql, voting
+
+
+def create_pr_node(number, author, comments=(), reactions=(), reviews=()):
+    def user(login):
+        return {"login": login, "createdAt": "2015-01-01T00:00:00Z"}
+
+    return {
+        "number": number,
+        "title": "PR {}".format(number),
+        "body": "",
+        "createdAt": "2017-01-01T00:00:00Z",
+        "mergeable": "MERGEABLE",
+        "headRefOid": "abc{}".format(number),
+        "headRepository": {"pushedAt": "2017-01-01T00:00:00Z"},
+        "author": user(author),
+        "comments": {
+            "pageInfo": {"hasNextPage": False},
+            "nodes": [{"databaseId": i, "body": body, "createdAt": "", "updatedAt": "",
+                       "author": user(login)}
+                      for i, (login, body) in enumerate(comments)],
+        },
+        "reactions": {
+            "pageInfo": {"hasNextPage": False},
+            "nodes": [{"databaseId": i, "content": content, "createdAt": "",
+                       "user": user(login)}
+                      for i, (login, content) in enumerate(reactions)],
+        },
+        "reviews": {
+            "pageInfo": {"hasNextPage": False},
+            "nodes": [{"databaseId": i, "state": state, "submittedAt": "",
+                       "author": user(login)}
+                      for i, (login, state) in enumerate(reviews)],
+        },
+    }
+
+
+# our stand-in for github's graphql endpoint serves these two pages of prs
+PAGES = {
+    None: {"nodes": [create_pr_node(1, "alice",
+                                    comments=[("bob", "looks good :+1:")],
+                                    reactions=[("carol", "THUMBS_DOWN")],
+                                    reviews=[("dave", "APPROVED")])],
+           "pageInfo": {"hasNextPage": True, "endCursor": "cursor1"}},
+    "cursor1": {"nodes": [create_pr_node(2, "bob")],
+                "pageInfo": {"hasNextPage": False, "endCursor": None}},
+}
+
+
+class GraphQLHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        length = int(self.headers["Content-Length"])
+        request = json.loads(self.rfile.read(length).decode("utf8"))
+        self.server.queries.append(request)
+
+        after = request["variables"]["after"]
+        body = {"data": {"repository": {"pullRequests": PAGES[after]}}}
+        body = json.dumps(body).encode("utf8")
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestOpenPRsSnapshot(unittest.TestCase):
+    def setUp(self):
+        self.server = HTTPServer(("127.0.0.1", 0), GraphQLHandler)
+        self.server.queries = []
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+        base_url = "http://127.0.0.1:{}".format(self.server.server_port)
+        self.api = API("user", "pat", base_url=base_url)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_snapshot(self):
+        snapshots, known_users = graphql.get_open_prs_snapshot(self.api, "test/blah")
+
+        # both pages were fetched, following the cursor
+        self.assertEqual(len(self.server.queries), 2)
+        self.assertEqual([s["pr"].number for s in snapshots], [1, 2])
+
+        pr = snapshots[0]["pr"]
+        self.assertEqual(pr.author, "alice")
+        self.assertEqual(pr.head_sha, "abc1")
+        self.assertEqual(pr.pushed_at, "2017-01-01T00:00:00Z")
+        self.assertIs(pr.mergeable, True)
+
+        self.assertEqual(snapshots[0]["reactions"][0].content, "-1")
+        self.assertEqual(set(known_users), {"alice", "bob", "carol", "dave"})
+        self.assertEqual(known_users["carol"].created_at, "2015-01-01T00:00:00Z")
+
+    def test_votes_from_snapshot(self):
+        snapshots, _ = graphql.get_open_prs_snapshot(self.api, "test/blah")
+        s = snapshots[0]
+        votes = voting.tally_votes(s["pr"], s["comments"], s["reactions"], s["reviews"])
+        self.assertEqual(votes, {"alice": 1, "bob": 1, "carol": -1, "dave": 1})
@@ -0,0 +1,37 @@
+import unittest
+from unittest.mock import MagicMock, patch
+
+from github_api import hooks, prs, issues
+from github_api.records import PullRequest
+
+
+class TestHooks(unittest.TestCase):
+    def setUp(self):
+        self.tags = []
+        listeners = patch.object(hooks, "_listeners", [lambda *tags: self.tags.extend(tags)])
+        listeners.start()
+        self.addCleanup(listeners.stop)
+
+    def test_pr_mutations(self):
+        api = MagicMock()
+        pr = PullRequest(number=3, title="title", body="body", head_sha="abc")
+
+        # labels don't touch what we cache about the pr itself
+        prs.label_pr(api, "test/blah", 3, ["accepted"])
+        self.assertEqual(self.tags, [hooks.labels_tag("test/blah", 3)])
+
+        del self.tags[:]
+        prs.merge_pr(api, "test/blah", pr, {}, 1, 1)
+        self.assertEqual(self.tags, [hooks.pr_tag("test/blah", 3),
+                                     hooks.repo_tag("test/blah")])
+
+        del self.tags[:]
+        prs.close_pr(api, "test/blah", pr)
+        issues.open_issue(api, "test/blah", "3")
+        self.assertEqual(self.tags, [hooks.pr_tag("test/blah", 3)] * 2)
+
+    def test_failed_mutation(self):
+        api = MagicMock(side_effect=ValueError)
+        with self.assertRaises(ValueError):
+            issues.close_issue(api, "test/blah", 3)
+        self.assertEqual(self.tags, [])
@@ -0,0 +1,56 @@
+import json
+import unittest
+from unittest.mock import MagicMock
+
+from github_api import API
+from github_api.instrumentation import Instrumentation, template_endpoint
+
+
+class TestTemplateEndpoint(unittest.TestCase):
+    def test_templates(self):
+        fn = template_endpoint
+        self.assertEqual(fn("get", "/repos/chaosbot/chaos/pulls/12/reviews"),
+                         "GET /repos/{urn}/pulls/{pr}/reviews")
+        self.assertEqual(fn("get", "https://api.github.com/repos/a/b/issues/3/comments?page=2"),
+                         "GET /repos/{urn}/issues/{issue}/comments")
+        self.assertEqual(fn("get", "/repos/a/b/issues/comments/55/reactions"),
+                         "GET /repos/{urn}/issues/comments/{comment}/reactions")
+        self.assertEqual(fn("post", "/repos/a/b/statuses/deadbeef"),
+                         "POST /repos/{urn}/statuses/{sha}")
+        self.assertEqual(fn("get", "/users/someone"), "GET /users/{user}")
+
+
+class TestInstrumentation(unittest.TestCase):
+    def test_record(self):
+        inst = Instrumentation()
+        inst.record("get", "/repos/a/b/pulls/1", 200, 0.07, 100, 0.0)
+        inst.record("get", "/repos/a/b/pulls/2", 304, 0.02, 0, 1.5)
+        inst.record("get", "/repos/a/b/pulls/3", 502, 12.0, 10, 0.0)
+
+        stats = inst.endpoint("get", "/repos/{urn}/pulls/{pr}")
+        self.assertEqual(stats["requests"], 3)
+        self.assertEqual(stats["statuses"], {"200": 1, "304": 1, "502": 1})
+        self.assertEqual(stats["bytes_received"], 110)
+        self.assertEqual(stats["cooldown_seconds"], 1.5)
+        self.assertEqual(stats["latency"]["histogram"]["0.05"], 1)
+        self.assertEqual(stats["latency"]["histogram"]["0.1"], 1)
+        self.assertEqual(stats["latency"]["histogram"]["+Inf"], 1)
+
+        # and it all survives a round trip through json
+        dumped = json.loads(inst.to_json())
+        self.assertIn("GET /repos/{urn}/pulls/{pr}", dumped["endpoints"])
+
+    def test_api_records(self):
+        resp = MagicMock()
+        resp.status_code = 200
+        resp.content = b"[]"
+        resp.json.return_value = []
+        resp.headers = {"X-RateLimit-Remaining": "4999", "X-RateLimit-Reset": "0"}
+
+        api = API("user", "pat")
+        api._session.request = MagicMock(return_value=resp)
+        api("get", "/repos/test/blah/pulls")
+
+        dumped = api.instrumentation.as_dict()
+        self.assertEqual(dumped["endpoints"]["GET /repos/{urn}/pulls"]["bytes_received"], 2)
+        self.assertEqual(dumped["rate_limit"][0]["remaining"], 4999)
@@ -1,21 +1,21 @@
 import unittest
 import arrow
 from unittest.mock import patch, MagicMock
+import requests
+from requests import HTTPError
 
 from github_api import prs, API
+from github_api import exceptions as exc
+from github_api.records import PullRequest
 
 
 def create_mock_pr(number, title, pushed_at):
-    return {
-        "number": number,
-        "title": title,
-        "statuses_url": "statuses_url/{}".format(number),
-        "head": {
-            "repo": {
-                "pushed_at": pushed_at
-            }
-        }
-    }
+    return PullRequest(
+        number=number,
+        title=title,
+        statuses_url="statuses_url/{}".format(number),
+        pushed_at=pushed_at,
+    )
 
 
 class TestPRMethods(unittest.TestCase):
@@ -102,4 +102,62 @@ class TestPRMethods(unittest.TestCase):
         ready_prs = prs.get_ready_prs(api, "urn", 5)
         ready_prs_list = [pr for pr in ready_prs]
         self.assertTrue(len(ready_prs_list) is 1)
-        self.assertTrue(ready_prs_list[0].get("number") is 11)
+        self.assertTrue(ready_prs_list[0].number is 11)
+
+    def test_merge_pr_502_that_went_through(self):
+        def api(method, path, **kwargs):
+            calls.append((method, path, kwargs.get("idempotent")))
+            if method == "PUT":
+                raise HTTPError(response=MagicMock(status_code=502))
+            if path.endswith("/merge"):
+                return None
+            return {"merge_commit_sha": "abc"}
+
+        calls = []
+        pr = PullRequest(number=3, title="title", body="body", head_sha="abc")
+        self.assertEqual(prs.merge_pr(api, "test/blah", pr, {}, 1, 1), "abc")
+        self.assertEqual(calls[0], ("PUT", "/repos/test/blah/pulls/3/merge", False))
+
+    def test_merge_pr_502_that_failed(self):
+        def api(method, path, **kwargs):
+            response = MagicMock(status_code=502 if method == "PUT" else 404)
+            raise HTTPError(response=response)
+
+        pr = PullRequest(number=3, title="title", body="body", head_sha="abc")
+        with self.assertRaises(HTTPError) as e:
+            prs.merge_pr(api, "test/blah", pr, {}, 1, 1)
+        self.assertEqual(e.exception.response.status_code, 502)
+
+    def test_merge_pr_timeout_that_went_through(self):
+        def api(method, path, **kwargs):
+            if method == "PUT":
+                raise requests.ReadTimeout()
+            if path.endswith("/merge"):
+                return None
+            return {"merge_commit_sha": "abc"}
+
+        pr = PullRequest(number=3, title="title", body="body", head_sha="abc")
+        self.assertEqual(prs.merge_pr(api, "test/blah", pr, {}, 1, 1), "abc")
+
+    def test_merge_pr_dropped_connection_that_failed(self):
+        def api(method, path, **kwargs):
+            if method == "PUT":
+                raise requests.ConnectionError()
+            raise HTTPError(response=MagicMock(status_code=404))
+
+        pr = PullRequest(number=3, title="title", body="body", head_sha="abc")
+        self.assertRaises(requests.ConnectionError, prs.merge_pr, api,
+                          "test/blah", pr, {}, 1, 1)
+
+    def test_merge_pr_connect_timeout(self):
+        """ a merge that never reached github isn't looked for """
+        api = MagicMock(side_effect=requests.ConnectTimeout())
+        pr = PullRequest(number=3, title="title", body="body", head_sha="abc")
+        self.assertRaises(requests.ConnectTimeout, prs.merge_pr, api,
+                          "test/blah", pr, {}, 1, 1)
+        self.assertEqual(api.call_count, 1)
+
+    def test_merge_pr_conflict(self):
+        api = MagicMock(side_effect=HTTPError(response=MagicMock(status_code=409)))
+        pr = PullRequest(number=3, title="title", body="body", head_sha="abc")
+        self.assertRaises(exc.CouldntMerge, prs.merge_pr, api, "test/blah", pr, {}, 1, 1)
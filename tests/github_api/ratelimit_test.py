@@ -0,0 +1,103 @@
+import unittest
+
+import settings
+from github_api import exceptions as exc
+from github_api.ratelimit import RateLimiter, CRITICAL, NORMAL, COSMETIC
+
+
+class RateLimiterTests(unittest.TestCase):
+    def setUp(self):
+        self.now = 1000.0
+        self.limiter = RateLimiter(burst=10, normal_reserve=30,
+                                   cosmetic_reserve=500, spend_window=600,
+                                   get_now=lambda: self.now)
+
+    def update(self, remaining, reset, spent):
+        """ like RateLimiter.update(), with a full bucket, after `spent`
+        requests over the last spend window """
+        self.limiter.restore({
+            "remaining": remaining,
+            "reset": reset,
+            "tokens": 10,
+            "spent": [self.now - 600 * i / spent for i in reversed(range(spent))],
+            "saved": self.now,
+        })
+
+    def test_unknown_budget(self):
+        """ before we've heard from github, nobody waits """
+        for _ in range(100):
+            self.assertEqual(self.limiter.reserve(NORMAL), 0)
+
+    def test_plenty_of_budget(self):
+        """ as long as our rate leaves the budget alone, nobody waits, not even
+        past the burst """
+        self.update(5000, self.now + 3600, 500)
+        for _ in range(100):
+            self.assertEqual(self.limiter.reserve(NORMAL), 0)
+            self.assertEqual(self.limiter.reserve(COSMETIC), 0)
+        self.assertFalse(self.limiter.is_throttled())
+
+    def test_burst_then_pace(self):
+        """ when our rate would eat into the reserves, we get a burst, then
+        get paced at the refill rate """
+        self.update(3630, self.now + 3600, 600)
+        for _ in range(10):
+            self.assertEqual(self.limiter.reserve(NORMAL), 0)
+
+        # 3600 usable requests over 3600 seconds is 1 request per second
+        self.assertAlmostEqual(self.limiter.reserve(NORMAL), 1)
+        self.assertAlmostEqual(self.limiter.reserve(NORMAL), 2)
+        self.assertTrue(self.limiter.is_throttled())
+
+        # time passing refills the bucket
+        self.now += 10
+        self.assertEqual(self.limiter.reserve(NORMAL), 0)
+
+    def test_critical_never_paced(self):
+        self.limiter.update(3630, self.now + 3600)
+        for _ in range(20):
+            self.assertEqual(self.limiter.reserve(CRITICAL), 0)
+
+    def test_cosmetic_shed_when_paced(self):
+        """ cosmetic requests are shed once our rate would eat into their
+        reserve, even while normal requests don't have to wait yet """
+        self.update(3630, self.now + 3600, 550)
+        for _ in range(10):
+            self.limiter.reserve(COSMETIC)
+        self.assertRaises(exc.RequestShed, self.limiter.reserve, COSMETIC)
+        self.assertEqual(self.limiter.reserve(NORMAL), 0)
+
+    def test_low_budget(self):
+        """ below the reserves, cosmetic requests are shed, normal requests
+        wait for the reset, and critical requests still go through """
+        pad = settings.API_COOLDOWN_RESET_PADDING
+        self.limiter.update(20, self.now + 60)
+        self.assertRaises(exc.RequestShed, self.limiter.reserve, COSMETIC)
+        self.assertEqual(self.limiter.reserve(NORMAL), 60 + pad)
+        self.assertEqual(self.limiter.reserve(CRITICAL), 0)
+
+    def test_no_budget(self):
+        """ with nothing left, even critical requests wait for the reset """
+        pad = settings.API_COOLDOWN_RESET_PADDING
+        self.limiter.update(0, self.now + 60)
+        self.assertEqual(self.limiter.reserve(CRITICAL), 60 + pad)
+
+    def test_refund(self):
+        self.update(3630, self.now + 3600, 600)
+        for _ in range(10):
+            self.limiter.reserve(NORMAL)
+        self.limiter.refund()
+        self.assertEqual(self.limiter.reserve(NORMAL), 0)
+
+    def test_state_round_trip(self):
+        """ a new limiter picks up the budget and tokens of an old one """
+        self.update(3630, self.now + 3600, 600)
+        for _ in range(10):
+            self.limiter.reserve(NORMAL)
+        state = self.limiter.state()
+
+        limiter = RateLimiter(burst=10, normal_reserve=30, cosmetic_reserve=500,
+                              spend_window=600, get_now=lambda: self.now)
+        limiter.restore(state)
+        self.assertEqual(limiter.remaining, 3630)
+        self.assertAlmostEqual(limiter.reserve(NORMAL), 1)
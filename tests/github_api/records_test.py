@@ -0,0 +1,92 @@
+import unittest
+from unittest.mock import MagicMock
+
+from github_api import API, records
+
+
+PR_JSON = {
+    "number": 5,
+    "title": "Add a thing",
+    "body": "it's a thing",
+    "state": "open",
+    "created_at": "2017-01-01T00:00:00Z",
+    "mergeable": True,
+    "statuses_url": "https://api.github.com/repos/test/blah/statuses/abc",
+    "user": {"login": "alice", "id": 1, "avatar_url": "https://..."},
+    "head": {
+        "sha": "abc",
+        "ref": "branch",
+        "repo": {"full_name": "alice/blah", "pushed_at": "2017-01-02T00:00:00Z"},
+    },
+    "base": {"ref": "master"},
+    "_links": {},
+}
+
+
+class TestRecords(unittest.TestCase):
+    def test_pr_projection(self):
+        pr = records.PullRequest.from_json(PR_JSON)
+        self.assertEqual(pr.number, 5)
+        self.assertEqual(pr.author, "alice")
+        self.assertEqual(pr.head_sha, "abc")
+        self.assertEqual(pr.pushed_at, "2017-01-02T00:00:00Z")
+        self.assertIs(pr.mergeable, True)
+
+        # records are slotted, so nothing else can be hung on them
+        self.assertFalse(hasattr(pr, "__dict__"))
+        with self.assertRaises(AttributeError):
+            pr.base = "master"
+
+    def test_pr_deleted_repo(self):
+        data = dict(PR_JSON, head={"sha": "abc", "repo": None})
+        del data["mergeable"]
+        pr = records.PullRequest.from_json(data)
+        self.assertIsNone(pr.pushed_at)
+        self.assertIsNone(pr.mergeable)
+
+    def test_comment_projection(self):
+        comment = records.Comment.from_json({
+            "id": 7,
+            "body": ":+1:",
+            "user": None,
+            "html_url": "https://github.com/test/blah/issues/12#issuecomment-7",
+        })
+        self.assertEqual(comment.author, records.GHOST)
+        self.assertEqual(comment.issue_number, 12)
+
+    def test_equality(self):
+        a = records.User(login="alice", created_at="2015-01-01T00:00:00Z")
+        b = records.User.from_json({"login": "alice", "id": 1,
+                                    "created_at": "2015-01-01T00:00:00Z"})
+        self.assertEqual(a, b)
+        self.assertEqual(records.User(**a.as_dict()), a)
+
+        with self.assertRaises(TypeError):
+            records.User(login="alice", id=1)
+
+
+class TestProjection(unittest.TestCase):
+    def setUp(self):
+        self.api = API("user", "pat")
+        self.api._session.request = MagicMock()
+
+    def respond(self, data, etag):
+        resp = MagicMock()
+        resp.status_code = 200
+        resp.headers = {"ETag": etag}
+        resp.json.return_value = data
+        self.api._session.request.return_value = resp
+
+    def test_projects_lists(self):
+        self.respond([PR_JSON, PR_JSON], "1")
+        prs = list(self.api.paginate("/pulls", project=records.PullRequest.from_json))
+        self.assertEqual([pr.number for pr in prs], [5, 5])
+
+    def test_projections_cached_separately(self):
+        self.respond(PR_JSON, "1")
+        pr = self.api("get", "/pulls/5", project=records.PullRequest.from_json)
+        data = self.api("get", "/pulls/5")
+
+        self.assertIsInstance(pr, records.PullRequest)
+        self.assertEqual(data, PR_JSON)
+        self.assertEqual(len(self.api.conditional_cache), 2)
@@ -0,0 +1,102 @@
+import unittest
+from unittest.mock import MagicMock, patch
+
+import requests
+
+from github_api import API, exceptions as exc
+from github_api.retry import RetryPolicy, CircuitBreaker
+
+
+def create_mock_response(status_code, headers=None, message=""):
+    resp = MagicMock()
+    resp.status_code = status_code
+    resp.headers = headers or {}
+    resp.content = b""
+    resp.json.return_value = {"message": message}
+
+    def raise_for_status():
+        if status_code >= 400:
+            raise requests.HTTPError(response=resp)
+    resp.raise_for_status.side_effect = raise_for_status
+    return resp
+
+
+class TestRetryPolicy(unittest.TestCase):
+    def setUp(self):
+        self.policy = RetryPolicy(attempts=3, base=1, cap=10, rand=lambda: 1.0)
+
+    def test_transient(self):
+        resp = create_mock_response(502)
+        self.assertTrue(self.policy.should_retry(0, True, resp=resp))
+        self.assertTrue(self.policy.should_retry(1, True, resp=resp))
+        # out of attempts
+        self.assertFalse(self.policy.should_retry(2, True, resp=resp))
+        # might have been processed already
+        self.assertFalse(self.policy.should_retry(0, False, resp=resp))
+
+    def test_abuse(self):
+        resp = create_mock_response(403, message="You have exceeded a secondary rate limit")
+        self.assertTrue(self.policy.should_retry(0, False, resp=resp))
+
+        resp = create_mock_response(403, message="Must have admin rights")
+        self.assertFalse(self.policy.should_retry(0, True, resp=resp))
+
+    def test_backoff(self):
+        self.assertEqual(self.policy.backoff(0), 1)
+        self.assertEqual(self.policy.backoff(2), 4)
+        self.assertEqual(self.policy.backoff(5), 10)
+
+        resp = create_mock_response(403, headers={"Retry-After": "30"})
+        self.assertEqual(self.policy.backoff(0, resp), 30)
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    def test_open_and_close(self):
+        now = [0]
+        breaker = CircuitBreaker(threshold=2, cooldown=60, get_now=lambda: now[0])
+
+        breaker.failure("GET /x")
+        breaker.before("GET /x")
+        breaker.failure("GET /x")
+        self.assertRaises(exc.CircuitOpen, breaker.before, "GET /x")
+
+        # other endpoints are unaffected
+        breaker.before("GET /y")
+
+        # after the cooldown, one trial goes through
+        now[0] = 61
+        breaker.before("GET /x")
+        self.assertRaises(exc.CircuitOpen, breaker.before, "GET /x")
+
+        breaker.success("GET /x")
+        breaker.before("GET /x")
+
+
+@patch("time.sleep")
+class TestAPIRetries(unittest.TestCase):
+    def setUp(self):
+        self.api = API("user", "pat")
+        self.api._session.request = MagicMock()
+
+    def test_retry_then_succeed(self, mock_sleep):
+        ok = create_mock_response(200)
+        ok.json.return_value = {"ok": True}
+        self.api._session.request.side_effect = [create_mock_response(502), ok]
+
+        self.assertEqual(self.api("get", "/repos/test/blah"), {"ok": True})
+        self.assertEqual(self.api._session.request.call_count, 2)
+
+    def test_no_retry_for_post(self, mock_sleep):
+        self.api._session.request.return_value = create_mock_response(502)
+        self.assertRaises(requests.HTTPError, self.api, "post", "/repos/test/blah")
+        self.assertEqual(self.api._session.request.call_count, 1)
+
+    def test_circuit_opens(self, mock_sleep):
+        self.api.retry_policy = RetryPolicy(attempts=1)
+        self.api.breaker = CircuitBreaker(threshold=2)
+        self.api._session.request.return_value = create_mock_response(503)
+
+        for _ in range(2):
+            self.assertRaises(requests.HTTPError, self.api, "get", "/repos/test/blah")
+        self.assertRaises(exc.CircuitOpen, self.api, "get", "/repos/test/blah")
+        self.assertEqual(self.api._session.request.call_count, 2)
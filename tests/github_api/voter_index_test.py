@@ -0,0 +1,100 @@
+import json
+import time
+import tempfile
+import threading
+import unittest
+from unittest.mock import MagicMock, patch
+from os.path import join
+
+import settings
+from github_api import exceptions as exc
+from github_api import voting
+from github_api.records import User
+from github_api.voter_index import VoterIndex, created_epoch
+
+
+class TestVoterIndex(unittest.TestCase):
+    def setUp(self):
+        self.index = VoterIndex()
+        self.api = MagicMock()
+
+    def test_created_epoch(self):
+        self.assertEqual(created_epoch("1970-01-02T00:00:00Z"), 24 * 60 * 60)
+
+    def test_graphql_prefetch(self):
+        self.api.graphql.return_value = {
+            "u0": {"login": "a", "createdAt": "1970-01-01T00:00:00Z"},
+            "u1": {"login": "b", "createdAt": "1970-01-02T00:00:00Z"},
+        }
+        self.index.add(User(login="c", created_at="1970-01-01T00:00:00Z"))
+
+        with patch.object(settings, "USE_GRAPHQL", True):
+            self.index.prefetch(self.api, ["b", "a", "c", "a"])
+
+        # one query for everybody we didn't know
+        self.assertEqual(self.api.graphql.call_count, 1)
+        self.assertEqual(self.api.graphql.call_args[0][1], {"u0": "a", "u1": "b"})
+        self.assertEqual(self.index.get("b"), 24 * 60 * 60)
+
+        # known voters cost nothing
+        self.assertEqual(self.index.created(self.api, "a"), 0)
+        self.assertFalse(self.api.called)
+
+    @patch("github_api.users.get_user")
+    def test_concurrent_fetches(self, get_user):
+        def slow_get_user(api, login):
+            time.sleep(0.05)
+            return User(login=login, created_at="1970-01-01T00:00:10Z")
+        get_user.side_effect = slow_get_user
+
+        # workers that meet the same new voter at once share one call
+        results = []
+        threads = [threading.Thread(
+            target=lambda: results.append(self.index.created(self.api, "a")))
+            for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(results, [10] * 5)
+        self.assertEqual(get_user.call_count, 1)
+
+    @patch("github_api.users.get_user")
+    def test_failed_fetch(self, get_user):
+        get_user.side_effect = ValueError
+        self.assertRaises(ValueError, self.index.created, self.api, "a")
+
+        # failures aren't remembered
+        get_user.side_effect = None
+        get_user.return_value = User(login="a", created_at="1970-01-01T00:00:10Z")
+        self.assertEqual(self.index.created(self.api, "a"), 10)
+
+    def test_failed_batch(self):
+        self.api.graphql.side_effect = exc.GraphQLError([{"message": "nope"}])
+        with patch.object(settings, "USE_GRAPHQL", True):
+            self.index.prefetch(self.api, ["ghost"])
+        self.assertIsNone(self.index.get("ghost"))
+
+    def test_attach(self):
+        fpath = join(tempfile.mkdtemp(), "voter_index.json")
+        self.index.attach(fpath)
+        self.index.add(User(login="a", created_at="1970-01-01T00:00:10Z"))
+        self.index.save()
+        with open(fpath) as h:
+            self.assertEqual(json.load(h), {"a": 10})
+
+        index = VoterIndex()
+        index.attach(fpath)
+        self.assertEqual(index.get("a"), 10)
+
+    @patch("github_api.voting.voter_index", new_callable=VoterIndex)
+    def test_vote_sum_known_users(self, index):
+        known_users = {
+            "old": User(login="old", created_at="2000-01-01T00:00:00Z"),
+            "new": User(login="new", created_at="2999-01-01T00:00:00Z"),
+        }
+        total, variance = voting.get_vote_sum(self.api, {"old": 1, "new": -1},
+                                              known_users)
+        self.assertEqual(total, 1)
+        self.assertFalse(self.api.called)
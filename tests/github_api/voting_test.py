@@ -1,8 +1,12 @@
+import os
+import tempfile
 import unittest
+from os.path import join
 from unittest.mock import patch
 
 import settings
 from github_api import voting
+from github_api.records import Comment, Reaction
 
 
 class TestVotingMethods(unittest.TestCase):
@@ -16,6 +20,62 @@ class TestVotingMethods(unittest.TestCase):
         self.assertEqual(voting.parse_emojis_for_vote(":hankey::+1:"), 1)
         self.assertEqual(voting.parse_emojis_for_vote(":+1::hankey:"), 1)
 
+    def test_parse_comment_for_vote_unicode(self):
+        self.assertEqual(voting.parse_comment_for_vote("\U0001F44D nice"), 1)
+        self.assertEqual(voting.parse_comment_for_vote("\U0001F44E"), -1)
+        self.assertEqual(voting.parse_comment_for_vote("\U0001F4A9 \U0001F44D"), 1)
+        self.assertEqual(voting.parse_comment_for_vote("\u2764 and \u2764\ufe0f"), 1)
+        self.assertEqual(voting.parse_comment_for_vote("hmm \U0001F914"), 0)
+
+    def test_vote_matcher_reloads(self):
+        fname = join(tempfile.mkdtemp(), "emojis.{type}")
+        with open(fname.format(type="positive"), "w") as h:
+            h.write(":+1:\n")
+        with open(fname.format(type="negative"), "w") as h:
+            h.write(":-1:\n")
+
+        now = [0]
+        matcher = voting.VoteMatcher(fname, check_interval=10, get_now=lambda: now[0])
+        self.assertEqual(matcher.vote(":tada:"), 0)
+
+        with open(fname.format(type="positive"), "a") as h:
+            h.write(":tada:\n")
+        os.utime(fname.format(type="positive"), (1, 1))
+
+        # we don't look at the files again until check_interval has passed
+        self.assertEqual(matcher.vote(":tada:"), 0)
+        now[0] = 10
+        self.assertEqual(matcher.vote(":tada:"), 1)
+
+    def test_vote_cache(self):
+        cache = voting.VoteCache()
+        comments = [Comment(id=1, author="a", body=":+1:", updated_at="1"),
+                    Comment(id=2, author="b", body=":-1:", updated_at="1"),
+                    Comment(id=3, author="a", body="hmm :-1:", updated_at="1"),
+                    Comment(id=4, author="c", body="lol", updated_at="1")]
+        reactions = [Reaction(id=1, author="b", content="heart", created_at="1")]
+        self.assertEqual(cache.tally(1, comments, reactions), {"a": -1, "b": 1})
+        self.assertEqual(cache.misses, 5)
+
+        # only the edited comment gets parsed again, and a deleted comment's
+        # vote goes away
+        comments[3] = Comment(id=4, author="c", body=":tada:", updated_at="2")
+        del comments[2]
+        self.assertEqual(cache.tally(1, comments, reactions),
+                         {"a": 1, "b": 1, "c": 1})
+        self.assertEqual(cache.misses, 6)
+        self.assertEqual(cache.hits, 3)
+
+    def test_vote_cache_fetches_unlocked(self):
+        cache = voting.VoteCache()
+
+        def fetch():
+            # other prs' tallies can go ahead while we wait on github
+            self.assertFalse(cache._lock.locked())
+            yield Comment(id=1, author="a", body=":+1:", updated_at="1")
+
+        self.assertEqual(cache.tally(1, fetch(), iter([])), {"a": 1})
+
     @patch("github_api.repos.get_num_watchers")
     def test_get_approval_threshold(self, mock_get_num_watchers):
         # if the number of watchers is low, threshold defaults to 1
@@ -0,0 +1,50 @@
+import time
+import tempfile
+import unittest
+from unittest.mock import patch
+from os.path import join, exists
+
+import settings
+import warm_cache
+from github_api.ratelimit import RateLimiter
+from github_api.conditional import ConditionalCache
+from github_api.comment_store import CommentStore
+
+
+class FakeAPI(object):
+    def __init__(self):
+        self.limiter = RateLimiter()
+        self.conditional_cache = ConditionalCache(10)
+        self.comment_store = CommentStore(10, 60)
+
+
+class TestWarmCache(unittest.TestCase):
+    def setUp(self):
+        self.fpath = join(tempfile.mkdtemp(), "warm_cache.pickle")
+
+    def test_round_trip(self):
+        api = FakeAPI()
+        api.limiter.update(100, time.time() + 3600)
+        api.conditional_cache.store("a", {"ETag": "1"}, "a")
+        warm_cache.save(api, self.fpath)
+
+        api = FakeAPI()
+        self.assertTrue(warm_cache.restore(api, self.fpath))
+        self.assertEqual(api.limiter.remaining, 100)
+        self.assertEqual(api.conditional_cache.lookup("a"),
+                         ({"If-None-Match": "1"}, "a"))
+
+        # a snapshot is only used once
+        self.assertFalse(exists(self.fpath))
+        self.assertFalse(warm_cache.restore(FakeAPI(), self.fpath))
+
+    def test_too_old(self):
+        warm_cache.save(FakeAPI(), self.fpath)
+        with patch.object(settings, "WARM_CACHE_MAX_AGE_SECONDS", -1):
+            self.assertFalse(warm_cache.restore(FakeAPI(), self.fpath))
+
+    def test_corrupt(self):
+        with open(self.fpath, "wb") as h:
+            h.write(b"not a pickle")
+        self.assertFalse(warm_cache.restore(FakeAPI(), self.fpath))
+        self.assertFalse(exists(self.fpath))
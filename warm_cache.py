@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Carries our warm in-process state over a self-restart.  After a merge we exec
+startup.sh, which throws away everything we know: our rate limit budget, the
+responses we can make conditional requests with, the comments we've fetched,
+our in-memory memoize entries and the votes we've parsed out of comments.  We
+save those to a file right before the exec, and load them back when we start up
+again, so the first poll after a merge is as cheap as any other.
+
+Connection pools can't be saved, so those are cold either way.
+"""
+
+import os
+import time
+import pickle
+import logging
+from os.path import join, abspath, dirname, exists
+
+import settings
+import memoize
+from github_api import voting
+
+THIS_DIR = dirname(abspath(__file__))
+SNAPSHOT_FILE = join(THIS_DIR, settings.WARM_CACHE_FILE)
+
+# bump this whenever the shape of what we save changes
+VERSION = 3
+
+__log = logging.getLogger("chaosbot")
+
+
+def save(api, fpath=None):
+    """ saves the api's and memoize's in-process state """
+    fpath = fpath or SNAPSHOT_FILE
+    snapshot = {
+        "version": VERSION,
+        "saved": time.time(),
+        "rate_limit": api.limiter.state(),
+        "conditional": api.conditional_cache.dump(),
+        "comments": api.comment_store.dump(),
+        "memoize": memoize.snapshot(),
+        "votes": voting.vote_cache.dump(),
+    }
+
+    tmp = fpath + ".tmp"
+    with open(tmp, "wb") as h:
+        pickle.dump(snapshot, h, pickle.HIGHEST_PROTOCOL)
+    os.rename(tmp, fpath)
+
+    __log.info("saved a warm cache of %d conditional responses",
+               len(snapshot["conditional"]))
+
+
+def restore(api, fpath=None):
+    """ loads what save() saved into the api and our memoized functions, if
+    it's recent enough to trust.  a snapshot is only ever used once.  returns
+    whether we loaded one """
+    fpath = fpath or SNAPSHOT_FILE
+    if not exists(fpath):
+        return False
+
+    try:
+        with open(fpath, "rb") as h:
+            snapshot = pickle.load(h)
+    # the code that saved it may not match the code that's loading it, in which
+    # case we just start cold
+    except Exception:
+        __log.exception("couldn't load the warm cache, starting cold")
+        return False
+    finally:
+        os.remove(fpath)
+
+    age = time.time() - snapshot.get("saved", 0)
+    if snapshot.get("version") != VERSION or age > settings.WARM_CACHE_MAX_AGE_SECONDS:
+        __log.info("warm cache is unusable (version %r, %ds old), starting cold",
+                   snapshot.get("version"), age)
+        return False
+
+    api.limiter.restore(snapshot["rate_limit"])
+    api.conditional_cache.load(snapshot["conditional"])
+    api.comment_store.load(snapshot["comments"])
+    memoize.restore(snapshot["memoize"])
+    voting.vote_cache.load(snapshot["votes"])
+
+    __log.info("restored a warm cache of %d conditional responses",
+               len(snapshot["conditional"]))
+    return True